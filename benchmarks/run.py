@@ -0,0 +1,206 @@
+"""
+Offline benchmark suite for NovaStream.
+
+    python -m benchmarks.run [--latency 0.02] [--bandwidth-kbps 8000] [--output out.json] [--baseline base.json]
+
+Runs scraping, manifest discovery and transfers against the local fixture
+server and prints a JSON report. With ``--baseline`` every metric is also
+compared with an earlier report.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from multiprocessing.dummy import Pool as ThreadPool
+
+from benchmarks.server import FixtureServer, encryption_available
+from src import hls, hls_async, metrics, transport
+from src.episode import resolve_episode
+from src.scraper import find_episode_links
+
+MB = 1024 * 1024
+
+# Report fields compared against a baseline, by which direction is better
+HIGHER_IS_BETTER = ("mb_per_s", "episodes_per_min")
+LOWER_IS_BETTER = ("latency_ms", "ttfb_ms", "seconds", "retries", "failed")
+
+
+def _median_ms(samples):
+    return round(statistics.median(samples) * 1000, 2) if samples else None
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_find_episode_links(server, repeat):
+    """Homepage scrape latency (static HTTP tier)."""
+    samples = []
+    for _ in range(repeat):
+        links, elapsed = _timed(find_episode_links, server.homepage())
+        samples.append(elapsed)
+    return {"episodes_found": len(links), "latency_ms": _median_ms(samples)}
+
+
+def bench_discovery(server):
+    """Manifest discovery per episode through the browserless tiers."""
+    samples, tiers = [], {}
+    for num in range(1, server.episodes + 1):
+        info, elapsed = _timed(resolve_episode, server.episode_url(num),
+                               browser=lambda url, **kw: set())
+        samples.append(elapsed)
+        tiers[info.tier] = tiers.get(info.tier, 0) + 1
+    return {"latency_ms": _median_ms(samples), "tiers": tiers}
+
+
+def bench_get_manifest_urls(server):
+    """Browser capture latency; needs selenium-wire and Chrome."""
+    try:
+        from src.manifest import get_manifest_urls
+        found, elapsed = _timed(get_manifest_urls, server.episode_url(2))
+    except Exception as e:
+        # Usually selenium-wire or Chrome is missing; keep the first line of the reason
+        reason = (str(e).strip().splitlines() or [""])[0]
+        return {"skipped": f"{type(e).__name__}: {reason}"}
+    return {"manifests": len(found), "latency_ms": round(elapsed * 1000, 2)}
+
+
+def bench_ttfb(server):
+    """Time to first byte of segment responses."""
+    session = transport.get_session()
+    samples = []
+    for index in range(min(server.segments, 20)):
+        start = time.perf_counter()
+        resp = session.get(f"{server.url}/hls/1/hi/seg{index}.ts", stream=True, timeout=30)
+        try:
+            next(resp.iter_content(1), None)
+            samples.append(time.perf_counter() - start)
+        finally:
+            resp.close()
+    return {"ttfb_ms": _median_ms(samples)}
+
+
+def bench_streams(server, workdir, concurrency):
+    """Segment engine throughput on each playlist variant."""
+    variants = ["hi", "br"] + (["enc"] if encryption_available() else [])
+    report = {}
+    for variant in variants:
+        dest = os.path.join(workdir, f"{variant}.ts")
+        result, elapsed = _timed(hls.download_stream, server.playlist_url(1, variant), dest, concurrency=concurrency)
+        report[variant] = {"mb_per_s": round(result.bytes / MB / elapsed, 2), "seconds": round(elapsed, 3),
+                           "retries": result.retries}
+        os.remove(dest)
+    if hls_async.available():
+        dest = os.path.join(workdir, "async.ts")
+        result, elapsed = _timed(hls_async.download_stream, server.playlist_url(1), dest, concurrency)
+        report["async"] = {"mb_per_s": round(result.bytes / MB / elapsed, 2), "seconds": round(elapsed, 3),
+                           "retries": result.retries}
+    else:
+        report["async"] = {"skipped": "aiohttp is not installed"}
+    return report
+
+
+def bench_download_episode(server, workdir, workers, engine):
+    """End-to-end episodes through ``download_episode``; the remux needs ffmpeg."""
+    if not shutil.which("ffmpeg"):
+        return {"skipped": "ffmpeg is not installed"}
+    from src.downloader import download_episode
+    outdir = os.path.join(workdir, engine)
+    os.makedirs(outdir, exist_ok=True)
+    options = {"engine": engine, "manifest_cache": False, "browsers": 0}
+    args = [("Fixture_Show", n, server.episode_url(n), outdir, 0, 1, options) for n in range(1, server.episodes + 1)]
+    with ThreadPool(workers) as pool:
+        results, elapsed = _timed(pool.map, download_episode, args)
+    size = sum(os.path.getsize(os.path.join(outdir, f)) for f in os.listdir(outdir) if f.endswith(".mp4"))
+    return {"episodes_per_min": round(sum(map(bool, results)) / elapsed * 60, 2),
+            "mb_per_s": round(size / MB / elapsed, 2), "failed": results.count(False)}
+
+
+def run(args):
+    metrics.reset()
+    workdir = tempfile.mkdtemp(prefix="novastream-bench-")
+    server = FixtureServer(episodes=args.episodes, segments=args.segments, segment_size=args.segment_kb * 1024,
+                           latency=args.latency, bandwidth=args.bandwidth_kbps * 125, error_rate=args.error_rate,
+                           seed=args.seed)
+    try:
+        with server:
+            report = {
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+                "find_episode_links": bench_find_episode_links(server, args.repeat),
+                "discovery": bench_discovery(server),
+                "get_manifest_urls": bench_get_manifest_urls(server),
+                "ttfb": bench_ttfb(server),
+                "streams": bench_streams(server, workdir, args.concurrency),
+                "download_episode": {engine: bench_download_episode(server, workdir, args.workers, engine)
+                                     for engine in ("ffmpeg", "native")},
+                "server": {"requests": server.requests, "injected_errors": server.errors},
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    report["stages"] = metrics.current().snapshot()["stages"]
+    return report
+
+
+def _flatten(report, prefix=""):
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(report, baseline):
+    """Lines describing how each metric moved against ``baseline``."""
+    old = _flatten(baseline)
+    lines = []
+    for name, value in sorted(_flatten(report).items()):
+        field = name.rsplit(".", 1)[-1]
+        if field not in HIGHER_IS_BETTER + LOWER_IS_BETTER or not old.get(name):
+            continue
+        change = (value - old[name]) / old[name] * 100
+        better = change < 0 if field in LOWER_IS_BETTER else change > 0
+        verdict = "better" if better else "worse" if change else "same"
+        lines.append(f"{name}: {old[name]} -> {value} ({change:+.1f}%, {verdict})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NovaStream against a local fixture site")
+    parser.add_argument("--episodes", type=int, default=4)
+    parser.add_argument("--segments", type=int, default=30)
+    parser.add_argument("--segment-kb", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--bandwidth-kbps", type=int, default=0, help="per-response cap, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of segment requests failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8, help="segment requests in flight")
+    parser.add_argument("--workers", type=int, default=2, help="episodes in flight for download_episode")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare with")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n".join(compare(report, json.load(f))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
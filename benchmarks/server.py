@@ -0,0 +1,233 @@
+"""
+Local stand-in for an episode site and its HLS CDN, for benchmarks.
+
+Serves, for episodes 1..N:
+  /show/                      series homepage linking every episode
+  /show-episode-N/            episode page; odd episodes embed the playlist
+                              in player JSON, even ones in a player iframe
+  /player/N/                  player page with a <video> tag
+  /hls/N/master.m3u8          master playlist with 'hi' and 'lo' variants
+  /hls/N/<variant>/index.m3u8 media playlists: hi, lo, enc (AES-128, needs
+                              cryptography) and br (byte ranges of one file)
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bytes per write when a bandwidth cap is set
+WRITE_CHUNK = 16 * 1024
+# Transport stream packet size; segments are whole packets
+TS_PACKET = 188
+# Fixed AES-128 key served for the 'enc' variant
+KEY = bytes(range(16))
+
+VARIANTS = ("hi", "lo", "enc", "br")
+
+
+def encryption_available():
+    try:
+        # Dynamic import: cryptography is optional
+        import cryptography  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _encrypt(data, iv):
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(KEY), modes.CBC(iv)).encryptor()
+    return encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+
+class FixtureServer:
+    """
+    Threaded HTTP server for the synthetic series. ``latency`` (seconds)
+    delays every response, ``bandwidth`` (bytes/s, 0 = unlimited) paces
+    each response body and ``error_rate`` is the share of segment requests
+    answered with 503. Error injection is seeded, so runs repeat.
+    """
+
+    def __init__(self, episodes=4, segments=30, segment_size=256 * 1024, segment_duration=4.0,
+                 latency=0.0, bandwidth=0, error_rate=0.0, seed=0, host="127.0.0.1", port=0):
+        self.episodes = episodes
+        self.segments = segments
+        self.segment_size = segment_size - segment_size % TS_PACKET
+        self.segment_duration = segment_duration
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._cache = {}
+        self.requests = 0
+        self.errors = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def homepage(self):
+        return f"{self.url}/show/"
+
+    def episode_url(self, num):
+        return f"{self.url}/show-episode-{num}/"
+
+    def playlist_url(self, num, variant="hi"):
+        return f"{self.url}/hls/{num}/{variant}/index.m3u8"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Content
+
+    def segment(self, num, variant, index):
+        """Deterministic payload of one segment: whole 188-byte TS packets."""
+        key = (num, variant, index)
+        if key not in self._cache:
+            size = self.segment_size // 2 if variant == "lo" else self.segment_size
+            size -= size % TS_PACKET
+            packet = b"\x47" + bytes([num % 256, index % 256]) * (TS_PACKET // 2)
+            data = packet[:TS_PACKET] * (size // TS_PACKET)
+            if variant == "enc":
+                data = _encrypt(data, index.to_bytes(16, "big"))
+            self._cache[key] = data
+        return self._cache[key]
+
+    def _media_playlist(self, num, variant):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:4", f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0"]
+        if variant == "enc":
+            lines.append('#EXT-X-KEY:METHOD=AES-128,URI="key"')
+        offset = 0
+        for index in range(self.segments):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            if variant == "br":
+                size = len(self.segment(num, "hi", index))
+                lines.append(f"#EXT-X-BYTERANGE:{size}@{offset}")
+                lines.append("all.ts")
+                offset += size
+            else:
+                lines.append(f"seg{index}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _master_playlist(self, num):
+        return ("#EXTM3U\n"
+                "#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720\nhi/index.m3u8\n"
+                "#EXT-X-STREAM-INF:BANDWIDTH=500000,RESOLUTION=640x360\nlo/index.m3u8\n")
+
+    def _page(self, path):
+        if path == "/show/":
+            links = "".join(f'<li><a href="/show-episode-{n}/">Episode {n}</a></li>' for n in range(1, self.episodes + 1))
+            return f"<html><head><title>Fixture Show</title></head><body><ul>{links}</ul></body></html>"
+        if path.startswith("/show-episode-"):
+            num = int(path.strip("/").rsplit("-", 1)[1])
+            if num % 2:
+                player = f'<script>var player = {{"file": "/hls/{num}/master.m3u8"}};</script>'
+            else:
+                player = f'<iframe src="/player/{num}/"></iframe>'
+            return f"<html><head><title>Fixture Show Episode {num}</title></head><body>{player}</body></html>"
+        if path.startswith("/player/"):
+            num = int(path.strip("/").split("/")[1])
+            return f'<html><body><video src="/hls/{num}/master.m3u8" autoplay></video></body></html>'
+        return None
+
+    def resolve(self, path, range_header=None):
+        """Return (status, content type, body) for ``path``."""
+        page = self._page(path)
+        if page is not None:
+            return 200, "text/html", page.encode()
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "hls" or not parts[1].isdigit():
+            return 404, "text/plain", b"not found"
+        num = int(parts[1])
+        if not 1 <= num <= self.episodes:
+            return 404, "text/plain", b"not found"
+        if parts[2:] == ["master.m3u8"]:
+            return 200, "application/vnd.apple.mpegurl", self._master_playlist(num).encode()
+        if len(parts) != 4 or parts[2] not in VARIANTS:
+            return 404, "text/plain", b"not found"
+        variant, name = parts[2], parts[3]
+        if variant == "enc" and not encryption_available():
+            return 404, "text/plain", b"encrypted variant needs cryptography"
+        if name == "index.m3u8":
+            return 200, "application/vnd.apple.mpegurl", self._media_playlist(num, variant).encode()
+        if variant == "enc" and name == "key":
+            return 200, "application/octet-stream", KEY
+        if self._inject_error():
+            return 503, "text/plain", b"injected failure"
+        if variant == "br" and name == "all.ts":
+            body = b"".join(self.segment(num, "hi", i) for i in range(self.segments))
+            return self._ranged(body, range_header)
+        if name.startswith("seg") and name.endswith(".ts") and name[3:-3].isdigit():
+            index = int(name[3:-3])
+            if index < self.segments:
+                return 200, "video/mp2t", self.segment(num, variant, index)
+        return 404, "text/plain", b"not found"
+
+    def _ranged(self, body, range_header):
+        if not range_header or not range_header.startswith("bytes="):
+            return 200, "video/mp2t", body
+        start, _, end = range_header[6:].partition("-")
+        return 206, "video/mp2t", body[int(start):int(end) + 1 if end else None]
+
+    def _inject_error(self):
+        if not self.error_rate:
+            return False
+        with self._rng_lock:
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                status, content_type, body = server.resolve(self.path.split("?")[0], self.headers.get("Range"))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self._write(body)
+
+            def _write(self, body):
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                for start in range(0, len(body), WRITE_CHUNK):
+                    chunk = body[start:start + WRITE_CHUNK]
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / server.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
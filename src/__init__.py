@@ -1,11 +1,45 @@
 """
 NovaStream package.
 """
+import importlib
 
 __version__ = '1.0.0'
 
-from .utils import expand_ranges as expand_ranges, banner as banner
-from .driver import get_driver as get_driver
-from .scraper import find_episode_links as find_episode_links
-from .manifest import get_manifest_urls as get_manifest_urls
-from .downloader import download_episode as download_episode, run_download as run_download 
\ No newline at end of file
+# Public API, loaded on first attribute access so ``import src`` stays cheap
+# for worker processes and headless scripts
+_EXPORTS = {
+    'expand_ranges': 'utils',
+    'banner': 'utils',
+    'get_driver': 'driver',
+    'find_episode_links': 'scraper',
+    'get_manifest_urls': 'manifest',
+    'download_episode': 'downloader',
+    'run_download': 'downloader',
+    'run_batch': 'batch',
+    'load_jobs': 'batch',
+}
+
+__all__ = [
+    'banner',
+    'download_episode',
+    'expand_ranges',
+    'find_episode_links',
+    'get_driver',
+    'get_manifest_urls',
+    'load_jobs',
+    'run_batch',
+    'run_download',
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,155 @@
+"""
+Multi-series batch downloads for NovaStream.
+"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from colorama import Fore
+
+from src import jobstore, metrics, watchdog
+from src.completion import CompletionIndex
+from src.downloader import (RecordAttempts, drama_folder, episode_args, episode_options, refresh_episode_job,
+                            resolve_episode_job, select_episodes, transfer_episode, with_requeue)
+from src.pipeline import ROUND_ROBIN
+from src.scheduler import DEFAULT_BROWSERS, Scheduler, Stages
+
+# Series whose episode lists are scraped at once
+DISCOVERY_CONCURRENCY = 4
+
+# One series to download; ``priority`` (higher first) matters under the priority policy
+SeriesJob = namedtuple("SeriesJob", ["url", "name", "output", "download_all", "episode_list", "engine", "quality",
+                                     "priority"],
+                       defaults=("", "downloads", True, "", "ffmpeg", "best", None))
+
+# Outcome of one series; ``completed`` includes episodes found already downloaded
+SeriesResult = namedtuple("SeriesResult", ["job", "folder", "total", "completed", "skipped", "failed", "error",
+                                           "seconds"])
+
+# Manifest column names accepted for SeriesJob fields
+_ALIASES = {"base_output": "output", "episodes": "episode_list"}
+
+
+def _job_from_row(row, where):
+    fields = {}
+    for key, value in row.items():
+        key = _ALIASES.get((key or "").strip(), (key or "").strip())
+        if key in SeriesJob._fields and value not in (None, ""):
+            fields[key] = value.strip() if isinstance(value, str) else value
+    if not fields.get("url"):
+        raise ValueError(f"{where} has no url")
+    if isinstance(fields.get("download_all"), str):
+        fields["download_all"] = fields["download_all"].lower() in ("true", "1", "yes")
+    elif "download_all" not in fields:
+        # A selection without an explicit flag means just those episodes
+        fields["download_all"] = not fields.get("episode_list")
+    if "priority" in fields:
+        fields["priority"] = int(fields["priority"])
+    return SeriesJob(**fields)
+
+
+def load_jobs(path):
+    """
+    Read series jobs from a manifest: a CSV file with a header row, or a
+    JSON list of objects (optionally under a "jobs" key). Columns are
+    SeriesJob fields; ``base_output`` and ``episodes`` are accepted for
+    ``output`` and ``episode_list``, and other columns are ignored.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r") as f:
+            data = json.load(f)
+        rows = data.get("jobs", []) if isinstance(data, dict) else data
+    else:
+        with open(path, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+    return [_job_from_row(row, f"{path} entry {i}") for i, row in enumerate(rows, 1)]
+
+
+def run_batch(jobs, workers=4, browsers=DEFAULT_BROWSERS, throttle_kbps=0, policy=ROUND_ROBIN,
+              stall_timeout=watchdog.STALL_TIMEOUT, job_store=None, metrics_textfile=None):
+    """
+    Download several series through one shared scheduler and return a
+    SeriesResult per job, in order; a series that fails reports its error
+    there instead of raising. ``jobs`` are SeriesJobs or dicts read like
+    manifest rows (see ``load_jobs``). Every series' episodes join the
+    same fair queue as soon as its episode list is known, so one series'
+    tail overlaps the next one's start; ``workers`` transfers, ``browsers``
+    pooled browsers and ``throttle_kbps`` are the budget for the whole
+    batch. With ``job_store`` each series and attempt is recorded as in
+    ``run_download``. Session metrics cover the batch (``metrics.current()``).
+    """
+    jobs = [job if isinstance(job, SeriesJob) else _job_from_row(job, f"job {i}") for i, job in enumerate(jobs, 1)]
+    session = metrics.reset(metrics_textfile)
+    sched = Scheduler(transfers=workers, browsers=browsers, throttle_kbps=throttle_kbps, policy=policy)
+    discovery = threading.BoundedSemaphore(DISCOVERY_CONCURRENCY)
+    results = [None] * len(jobs)
+
+    def run(i, job):
+        # Earlier jobs go first under the priority policy unless they say otherwise
+        priority = job.priority if job.priority is not None else -i
+        results[i] = _run_series(sched, job, i, priority, throttle_kbps, stall_timeout, job_store, discovery)
+
+    threads = [threading.Thread(target=run, args=(i, job), name=f"series-{i}", daemon=True)
+               for i, job in enumerate(jobs)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sched.close()
+        session.write_textfile()
+    return results
+
+
+def _run_series(sched, job, group, priority, throttle_kbps, stall_timeout, job_store, discovery):
+    start = time.monotonic()
+    drama_name = drama_folder(job.url, job.name)
+    drama_dir = os.path.join(job.output, drama_name)
+    episodes, drama_id, store = [], None, None
+    completed = skipped = failed = 0
+    try:
+        os.makedirs(drama_dir, exist_ok=True)
+        with discovery:
+            episodes = select_episodes(job.url, job.download_all, job.episode_list)
+        if job_store:
+            store = jobstore.open_store(job_store)
+            drama_id = store.open_drama(job.url, job.output, job.name,
+                                        jobstore.drama_config(jobstore.BATCH, **job._asdict()))
+            store.recover(drama_id)
+            store.update_drama(drama_id, status=jobstore.RUNNING, started=time.time(), finished=None)
+            store.add_episodes(drama_id, episodes)
+        pending = CompletionIndex(drama_dir).pending(episodes)
+        skipped = len(episodes) - len(pending)
+        pool_args = episode_args(drama_name, drama_dir, pending, throttle_kbps,
+                                 episode_options(job.engine, job.quality, stall_timeout))
+
+        def record(func):
+            return RecordAttempts(func, job_store, drama_id) if job_store else func
+
+        stages = Stages(record(resolve_episode_job), record(transfer_episode), record(refresh_episode_job))
+        for result in with_requeue(lambda args: sched.imap(args, stages, group, priority), pool_args):
+            if result:
+                completed += 1
+            else:
+                failed += 1
+        error = f"{failed} of {len(episodes)} episodes failed" if failed else None
+    except Exception as e:
+        # Discovery errors, store errors and the like end this series only
+        logging.error(f"{job.url}: series failed: {e}")
+        error = str(e)
+    if drama_id is not None:
+        try:
+            store.update_drama(drama_id, status=jobstore.FAILED if error else jobstore.DONE, finished=time.time(),
+                               last_error=error)
+        except Exception as e:
+            logging.error(f"{job.url}: could not record the series outcome: {e}")
+    msg = f"{drama_name}: {completed} downloaded, {skipped} skipped, {failed} failed"
+    logging.info(msg)
+    print((Fore.RED if error else Fore.GREEN) + msg + (f" ({error})" if error and not failed else ""))
+    return SeriesResult(job, drama_dir, len(episodes), completed + skipped, skipped, failed, error,
+                        time.monotonic() - start)
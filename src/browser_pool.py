@@ -0,0 +1,146 @@
+"""
+Warm headless-browser pool for NovaStream.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+
+from src.driver import get_driver
+
+# Process-wide pool used by get_manifest_urls and find_episode_links
+_current = None
+_current_lock = threading.Lock()
+
+
+class BrowserPool:
+    """
+    Bounded pool of long-lived selenium-wire drivers.
+    Drivers are leased per page load, reset between leases and recycled
+    after ``max_uses`` leases or when they stop responding.
+    """
+
+    def __init__(self, size=1, max_uses=25, factory=get_driver):
+        self.size = size
+        self.max_uses = max_uses
+        self.factory = factory
+        self.pid = os.getpid()
+        self._idle = []
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    @contextmanager
+    def lease(self):
+        """Lease a driver for the duration of the ``with`` block."""
+        self._slots.acquire()
+        driver = None
+        healthy = True
+        try:
+            driver = self._checkout()
+            try:
+                yield driver
+            except Exception:
+                healthy = _alive(driver)
+                raise
+        finally:
+            if driver is not None:
+                self._checkin(driver, healthy)
+            self._slots.release()
+
+    def _checkout(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            if self._idle:
+                return self._idle.pop()
+        driver = self.factory()
+        with self._lock:
+            self._uses[id(driver)] = 0
+        return driver
+
+    def _checkin(self, driver, healthy):
+        with self._lock:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+            retire = self._closed or not healthy or uses >= self.max_uses
+        if not retire:
+            try:
+                _reset(driver)
+            except Exception as e:
+                logging.warning(f"Browser reset failed, recycling instance: {e}")
+                retire = True
+        if not retire:
+            with self._lock:
+                if not self._closed:
+                    self._idle.append(driver)
+                    return
+        self._discard(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Failed to quit browser: {e}")
+
+    def close(self):
+        """Quit every idle driver; leased drivers are quit when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+
+def _alive(driver):
+    """Return False if the browser session has crashed or disconnected."""
+    try:
+        # Liveness probe: any round trip to the browser raises once the session is gone
+        _ = driver.current_url
+    except Exception:
+        return False
+    return True
+
+
+def _reset(driver):
+    """Drop page state and captured traffic before the next lease."""
+    driver.get("about:blank")
+    driver.delete_all_cookies()
+    # selenium-wire: clear the captured request log
+    del driver.requests
+
+
+def configure(size=1, max_uses=25):
+    """
+    Enable the process-wide browser pool, creating it on first use.
+    Safe to call repeatedly; the existing pool is returned.
+    """
+    global _current
+    with _current_lock:
+        if _current is None or _current.pid != os.getpid():
+            _current = BrowserPool(size, max_uses)
+            # Quit pooled browsers when this process (or pool worker) exits
+            mp_util.Finalize(None, shutdown, exitpriority=10)
+        return _current
+
+
+def current():
+    """Return the active pool for this process, or None."""
+    pool = _current
+    # A pool inherited over fork belongs to the parent's browsers
+    if pool is None or pool.pid != os.getpid():
+        return None
+    return pool
+
+
+def shutdown():
+    """Close and detach the process-wide pool."""
+    global _current
+    with _current_lock:
+        pool, _current = current(), None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,60 @@
+"""
+Per-drama completion index for NovaStream.
+"""
+import json
+import os
+import threading
+import time
+
+from src.utils import file_lock, write_json_atomic
+
+# Index file name, stored in each drama's output folder
+INDEX_FILE = ".completed.json"
+
+
+class CompletionIndex:
+    """
+    JSON record of finished episodes in a drama folder, keyed by episode
+    number: output path, size, duration and the saved file's sha256. Lets
+    callers skip finished episodes before any network work.
+    """
+
+    def __init__(self, drama_dir):
+        self.path = os.path.join(drama_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, num):
+        """Return the recorded entry for episode ``num``, or None."""
+        return self._entries.get(str(num))
+
+    def is_complete(self, num):
+        """True if episode ``num`` was recorded and its file is still intact."""
+        entry = self.get(num)
+        if not entry:
+            return False
+        try:
+            return os.path.getsize(entry["path"]) == entry["size"]
+        except OSError:
+            return False
+
+    def pending(self, episodes):
+        """Filter (num, url) pairs down to the episodes not yet complete."""
+        return [(n, u) for n, u in episodes if not self.is_complete(n)]
+
+    def record(self, num, path, size, duration=None, sha256=None):
+        """Mark episode ``num`` as complete."""
+        entry = {"path": path, "size": size, "duration": duration, "sha256": sha256, "completed": time.time()}
+        # Other instances and worker processes record into the same file
+        with self._lock, file_lock(self.path):
+            entries = self._load()
+            entries[str(num)] = entry
+            write_json_atomic(self.path, entries)
+            self._entries = entries
@@ -0,0 +1,126 @@
+"""
+Adaptive concurrency control for NovaStream.
+"""
+import logging
+import queue
+import threading
+import time
+
+# Seconds of samples behind each adjustment
+WINDOW = 5.0
+# Fraction of failed tasks in a window treated as congestion
+ERROR_THRESHOLD = 0.1
+# Relative throughput gain that justifies another worker
+PLATEAU = 0.05
+# Fraction of physical memory that must stay available
+MEMORY_FLOOR = 0.1
+
+
+def memory_pressure(floor=MEMORY_FLOOR):
+    """True when available memory drops below ``floor`` of the total."""
+    try:
+        # Dynamic import: psutil is optional
+        import psutil
+        mem = psutil.virtual_memory()
+        return mem.available < mem.total * floor
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            info = dict(line.split(":", 1) for line in f)
+        total = int(info["MemTotal"].split()[0])
+        available = int(info["MemAvailable"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return False
+    return available < total * floor
+
+
+def was_throttled(resp):
+    """True if urllib3 had to retry ``resp`` because the server answered 429."""
+    retries = getattr(getattr(resp, "raw", None), "retries", None)
+    history = getattr(retries, "history", None) or ()
+    return any(getattr(entry, "status", None) == 429 for entry in history)
+
+
+class AIMDController:
+    """
+    Additive-increase/multiplicative-decrease controller for the number of
+    concurrent tasks. Callers ``record`` each finished task (bytes moved,
+    whether it failed or was rate limited) and read ``update()`` before
+    starting new work. Once per window the level drops by ``decrease`` on
+    errors, 429s or memory pressure, grows by ``increase`` while throughput
+    keeps improving, and holds once throughput plateaus.
+    """
+
+    def __init__(self, minimum=1, maximum=8, initial=None, name="workers", window=WINDOW,
+                 increase=1, decrease=0.5, clock=time.monotonic, memory_check=memory_pressure):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.level = min(self.maximum, max(minimum, initial or minimum))
+        self.name = name
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.clock = clock
+        self.memory_check = memory_check
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._bytes = self._tasks = self._errors = self._throttled = 0
+        self._last_rate = None
+
+    def record(self, nbytes=0, error=False, throttled=False):
+        """Account one finished task."""
+        with self._lock:
+            self._bytes += nbytes
+            self._tasks += 1
+            self._errors += bool(error)
+            self._throttled += bool(throttled)
+
+    def update(self):
+        """Re-evaluate the level if a window has elapsed; returns the level."""
+        with self._lock:
+            now = self.clock()
+            elapsed = now - self._start
+            if elapsed < self.window or not self._tasks:
+                return self.level
+            rate = self._bytes / elapsed
+            old = self.level
+            if self._throttled or self._errors > self._tasks * ERROR_THRESHOLD or self.memory_check():
+                reason = (f"{self._throttled} rate limited, {self._errors}/{self._tasks} failed"
+                          if self._throttled or self._errors else "memory pressure")
+                self.level = max(self.minimum, int(self.level * self.decrease))
+                # Throughput measured under congestion is no baseline
+                rate = None
+            elif self._last_rate is None or rate > self._last_rate * (1 + PLATEAU):
+                reason = f"{rate / 1e6:.2f} MB/s"
+                self.level = min(self.maximum, self.level + self.increase)
+            else:
+                reason = f"plateau at {rate / 1e6:.2f} MB/s"
+            self._last_rate = rate
+            self._start = now
+            self._bytes = self._tasks = self._errors = self._throttled = 0
+        if self.level != old:
+            logging.info(f"Adaptive {self.name}: {old} -> {self.level} ({reason})")
+        return self.level
+
+
+def adaptive_imap(pool, func, args_list, controller, weigh=None):
+    """
+    Like ``pool.imap_unordered`` but keeps at most ``controller.update()``
+    tasks in flight, so ``pool`` should be sized for ``controller.maximum``.
+    A task counts as failed when ``func`` returns a falsy value; ``weigh``
+    maps (args, result) to the bytes it moved.
+    """
+    done = queue.Queue()
+    pending = list(reversed(args_list))
+    in_flight = 0
+    while pending or in_flight:
+        while pending and in_flight < controller.update():
+            args = pending.pop()
+            pool.apply_async(func, (args,), callback=lambda res, a=args: done.put((a, res)),
+                             error_callback=lambda exc, a=args: done.put((a, None)))
+            in_flight += 1
+        args, result = done.get()
+        in_flight -= 1
+        controller.record(weigh(args, result) if weigh and result else 0, error=not result)
+        yield result
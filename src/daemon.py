@@ -0,0 +1,534 @@
+"""
+Headless download service for NovaStream.
+
+A long-running process that takes download jobs over a local HTTP API
+and runs them through one warm resolve/transfer pipeline: the browser
+pool, the per-thread HTTP sessions and the worker threads survive from
+one job to the next. ``python -m src.daemon serve`` starts it; the
+``submit``, ``status``, ``cancel`` and ``shutdown`` commands talk to it.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src import browser_pool, jobstore, metrics, progress, ratelimit, watchdog
+from src.completion import CompletionIndex
+from src.downloader import (ENGINES, MAX_REQUEUES, RecordAttempts, Requeue, drama_folder, episode_args,
+                            episode_options, refresh_episode_job, resolve_episode_job, select_episodes,
+                            transfer_episode)
+from src.jobstore import CANCELLED, DONE, FAILED, QUEUED, RUNNING
+from src.pipeline import Pipeline
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Host header values the API answers to; anything else may be a DNS rebinding attempt
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+# Job store kept in the daemon's output folder
+STORE_FILE = "daemon.db"
+
+# Marks the end of the job queue
+_STOP = object()
+
+
+class Job:
+    """One series to download, with its progress counters."""
+
+    def __init__(self, job_id, url, output, name="", episodes="", engine="ffmpeg", quality="best"):
+        self.id = job_id
+        self.url = url
+        self.output = output
+        self.name = name
+        self.episodes = episodes
+        self.engine = engine
+        self.quality = quality
+        self.state = QUEUED
+        self.error = None
+        self.folder = None
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.requeues = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.tracker = progress.ProgressTracker()
+        self._outstanding = 0
+        self._settled = threading.Event()
+        self._dropped = set()
+
+    @classmethod
+    def from_drama(cls, drama):
+        """Rebuild a job from its job store row."""
+        config = drama["config"]
+        episodes = "" if config["download_all"] else config["episode_list"]
+        job = cls(str(drama["id"]), drama["url"], drama["output"], drama["name"], episodes, config["engine"],
+                  config["quality"])
+        job.state = drama["status"]
+        job.error = drama["last_error"]
+        job.created, job.started, job.finished = drama["created"], drama["started"], drama["finished"]
+        return job
+
+    def status(self):
+        """JSON-ready view of the job."""
+        return {
+            "id": self.id,
+            "url": self.url,
+            "name": self.name,
+            "episodes": self.episodes,
+            "engine": self.engine,
+            "quality": self.quality,
+            "state": self.state,
+            "error": self.error,
+            "folder": self.folder,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "progress": round(self.completed + self.failed + self.skipped + self.cancelled + self.tracker.partial, 2),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class Daemon:
+    """
+    Runs submitted jobs one after another on shared, long-lived resources:
+    ``resolvers`` pooled browsers, ``workers`` transfer threads and one
+    bandwidth limiter of ``throttle_kbps``. Episodes of a job resolve
+    ahead of its transfers, as in ``run_download(..., resolvers=N)``.
+    Jobs, episodes and attempts are kept in ``job_store`` (by default
+    daemon.db in ``base_output``); jobs queued or running when the daemon
+    last stopped are picked up again on start.
+    """
+
+    def __init__(self, base_output, workers=4, resolvers=1, throttle_kbps=0, lookahead=None, engine="ffmpeg",
+                 quality="best", stall_timeout=watchdog.STALL_TIMEOUT, metrics_textfile=None, job_store=None):
+        self.base_output = base_output
+        self.workers = workers
+        self.resolvers = resolvers
+        self.throttle_kbps = throttle_kbps
+        self.lookahead = lookahead
+        self.engine = engine
+        self.quality = quality
+        self.stall_timeout = stall_timeout
+        self.metrics_textfile = metrics_textfile
+        self.job_store = job_store or os.path.join(base_output, STORE_FILE)
+        self.started = None
+        self._store = jobstore.open_store(self.job_store)
+        self._stopping = False
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._current = None
+        self._pipeline = None
+        self._runner = None
+
+    def start(self):
+        os.makedirs(self.base_output, exist_ok=True)
+        self.started = time.time()
+        browser_pool.configure(self.resolvers)
+        ratelimit.configure(self.throttle_kbps)
+        progress.install(self._on_progress)
+        self._pipeline = Pipeline(self._resolve, self._transfer, resolvers=self.resolvers, transfers=self.workers,
+                                  lookahead=self.lookahead, refresh=self._refresh)
+        # The store may be shared with the GUI and CLI; only jobs submitted here are resumed
+        for drama in self._store.dramas(source=jobstore.DAEMON):
+            job = Job.from_drama(drama)
+            if job.id in self._jobs:
+                continue
+            self._store.recover(drama["id"])
+            if job.state == RUNNING:
+                job.state = QUEUED
+            self._jobs[job.id] = job
+            if job.state == QUEUED:
+                self._queue.put(job)
+        self._runner = threading.Thread(target=self._run, name="daemon-jobs", daemon=True)
+        self._runner.start()
+        logging.info(f"Daemon started: {self.workers} workers, {self.resolvers} resolvers")
+        return self
+
+    def stop(self):
+        """
+        Stop taking episodes, let in-flight transfers finish and release
+        every resource. Unfinished jobs stay queued for the next start.
+        """
+        self._stopping = True
+        self._queue.put(_STOP)
+        if self._runner:
+            self._runner.join()
+        if self._pipeline:
+            self._pipeline.close()
+        progress.install(None)
+        browser_pool.shutdown()
+        logging.info("Daemon stopped")
+
+    def submit(self, url, name="", episodes="", engine=None, quality=None, output=None):
+        """
+        Queue a series; ``episodes`` is a range list such as '1,3-5', empty
+        for all. ``output`` is a folder inside ``base_output``.
+        """
+        engine = engine or self.engine
+        if not url:
+            raise ValueError("A url is required")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        output, quality = self._output_dir(output), quality or self.quality
+        drama_id = self._store.add_drama(url, name, output, jobstore.drama_config(
+            jobstore.DAEMON, download_all=not episodes, episode_list=episodes or "", engine=engine, quality=quality))
+        with self._lock:
+            job = Job(str(drama_id), url, output, name or "", episodes or "", engine, quality)
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        logging.info(f"Job {job.id} queued: {url}")
+        return job
+
+    def _output_dir(self, output):
+        if not output:
+            return self.base_output
+        base = os.path.realpath(self.base_output)
+        path = os.path.realpath(os.path.join(base, output))
+        if os.path.commonpath([base, path]) != base:
+            raise ValueError(f"Output must be inside {self.base_output}")
+        return os.path.join(self.base_output, os.path.relpath(path, base))
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job never starts; a running one stops
+        resolving new episodes and ends once its in-flight transfers do.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.state not in (QUEUED, RUNNING):
+                return job
+            job.state = CANCELLED
+            if job.started is None:
+                job.finished = time.time()
+        self._store.update_drama(int(job.id), status=CANCELLED, finished=job.finished)
+        logging.info(f"Job {job_id} cancelled")
+        return job
+
+    def status(self):
+        """Daemon summary: uptime, job counts by state and the running job's metrics."""
+        counts = {}
+        for job in self.jobs():
+            counts[job.state] = counts.get(job.state, 0) + 1
+        current = self._current
+        return {
+            "uptime": round(time.time() - self.started, 1) if self.started else 0,
+            "workers": self.workers,
+            "resolvers": self.resolvers,
+            "throttle_kbps": self.throttle_kbps,
+            "jobs": counts,
+            "current": current.id if current else None,
+            "metrics": metrics.current().snapshot() if current else None,
+        }
+
+    def _run(self):
+        for job in iter(self._queue.get, _STOP):
+            if job.state != QUEUED or self._stopping:
+                continue
+            self._current = job
+            try:
+                self._run_job(job)
+            except Exception as e:
+                logging.error(f"Job {job.id} failed: {e}")
+                job.state, job.error = FAILED, str(e)
+            finally:
+                job.finished = None if job.state == QUEUED else time.time()
+                self._current = None
+                self._store.update_drama(int(job.id), status=job.state, finished=job.finished, last_error=job.error)
+
+    def _run_job(self, job):
+        job.state = RUNNING
+        job.started = time.time()
+        self._store.update_drama(int(job.id), status=RUNNING, started=job.started)
+        drama_name = drama_folder(job.url, job.name)
+        drama_dir = os.path.join(job.output, drama_name)
+        os.makedirs(drama_dir, exist_ok=True)
+        job.folder = drama_dir
+        session = metrics.reset(self.metrics_textfile)
+        try:
+            episodes = select_episodes(job.url, not job.episodes, job.episodes)
+        except ValueError as e:
+            job.state, job.error = FAILED, str(e)
+            return
+        self._store.add_episodes(int(job.id), episodes)
+        pending = CompletionIndex(drama_dir).pending(episodes)
+        job.total = len(episodes)
+        job.skipped = len(episodes) - len(pending)
+        options = episode_options(job.engine, job.quality, self.stall_timeout)
+        pool_args = episode_args(drama_name, drama_dir, pending, self.throttle_kbps, options)
+        job._outstanding = len(pool_args)
+        if not pool_args:
+            job._settled.set()
+        for args in pool_args:
+            self._submit_episode(job, args)
+        job._settled.wait()
+        session.write_json(os.path.join(drama_dir, metrics.METRICS_FILE), series=drama_dir)
+        session.write_textfile()
+        if job.state == RUNNING and self._stopping:
+            # Interrupted by shutdown: finished episodes are recorded, the rest resume on restart
+            job.state = QUEUED
+        elif job.state == RUNNING:
+            job.state = DONE if not job.failed else FAILED
+            if job.failed:
+                job.error = f"{job.failed} of {job.total} episodes failed"
+        logging.info(f"Job {job.id} {job.state}: {job.completed} downloaded, {job.skipped} skipped, "
+                     f"{job.failed} failed")
+
+    def _submit_episode(self, job, args):
+        self._pipeline.submit((job, args), lambda result: self._settle(job, args, result))
+
+    def _record(self, func, job):
+        return RecordAttempts(func, self.job_store, int(job.id))
+
+    def _resolve(self, item):
+        job, args = item
+        if job.state == CANCELLED or self._stopping:
+            job._dropped.add(args[1])
+            return False
+        resolved = self._record(resolve_episode_job, job)(args)
+        return resolved if isinstance(resolved, bool) else (job, resolved)
+
+    def _refresh(self, item):
+        job, episode_job = item
+        if self._cancelled(job, episode_job.num):
+            return False
+        fresh = self._record(refresh_episode_job, job)(episode_job)
+        return fresh if isinstance(fresh, bool) else (job, fresh)
+
+    def _transfer(self, item):
+        job, episode_job = item
+        if self._cancelled(job, episode_job.num):
+            return False
+        return self._record(transfer_episode, job)(episode_job)
+
+    def _cancelled(self, job, num):
+        # Episodes resolved ahead of a cancel are dropped, not transferred
+        if job.state != CANCELLED:
+            return False
+        job._dropped.add(num)
+        return True
+
+    def _settle(self, job, args, result):
+        num = args[1]
+        with self._lock:
+            if isinstance(result, Requeue):
+                tries = job.requeues.get(num, 0)
+                if tries < MAX_REQUEUES and job.state != CANCELLED:
+                    job.requeues[num] = tries + 1
+                    requeue = True
+                else:
+                    requeue, result = False, False
+            else:
+                requeue = False
+            if not requeue:
+                if num in job._dropped:
+                    job.cancelled += 1
+                elif result:
+                    job.completed += 1
+                else:
+                    job.failed += 1
+                job._outstanding -= 1
+                if job._outstanding == 0:
+                    job._settled.set()
+        if requeue:
+            logging.info(f"Job {job.id}: requeuing stalled episode {num}")
+            self._submit_episode(job, args)
+
+    def _on_progress(self, event):
+        job = self._current
+        if job is not None:
+            job.tracker.update(event)
+
+
+def _host_name(host):
+    """Host header without its port."""
+    if host.startswith("["):
+        return host.split("]")[0] + "]"
+    return host.rsplit(":", 1)[0]
+
+
+def make_server(daemon, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    HTTP API for ``daemon``, bound to the local machine:
+      GET    /status          daemon summary
+      GET    /jobs            every job
+      POST   /jobs            submit {"url", "name", "episodes", "engine", "quality", "output"}
+      GET    /jobs/<id>       one job
+      DELETE /jobs/<id>       cancel a job
+      POST   /shutdown        stop the daemon
+    Requests from web pages (any with an Origin header) or for a host
+    other than the loopback address are refused, and POST bodies must be
+    application/json, which browsers cannot send cross-origin without a
+    preflight the API never grants.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _refused(self):
+            host = _host_name(self.headers.get("Host") or "")
+            if self.headers.get("Origin") is not None or host not in LOOPBACK_HOSTS:
+                self._reply(403, {"error": "forbidden"})
+                return True
+            if self.command == "POST" and \
+                    (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+                self._reply(415, {"error": "Content-Type must be application/json"})
+                return True
+            return False
+
+        def do_GET(self):
+            if self._refused():
+                return
+            path = self.path.rstrip("/")
+            if path == "/status":
+                return self._reply(200, daemon.status())
+            if path == "/jobs":
+                return self._reply(200, [job.status() for job in daemon.jobs()])
+            if path.startswith("/jobs/"):
+                job = daemon.get(path[len("/jobs/"):])
+                if job is None:
+                    return self._reply(404, {"error": "no such job"})
+                return self._reply(200, job.status())
+            self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self._refused():
+                return
+            path = self.path.rstrip("/")
+            if path == "/shutdown":
+                self._reply(202, {"state": "stopping"})
+                threading.Thread(target=server.shutdown, daemon=True).start()
+                return
+            if path != "/jobs":
+                return self._reply(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                fields = ("url", "name", "episodes", "engine", "quality", "output")
+                job = daemon.submit(**{k: body.get(k) for k in fields})
+            except (ValueError, AttributeError) as e:
+                return self._reply(400, {"error": str(e)})
+            self._reply(201, job.status())
+
+        def do_DELETE(self):
+            if self._refused():
+                return
+            path = self.path.rstrip("/")
+            job = daemon.cancel(path[len("/jobs/"):]) if path.startswith("/jobs/") else None
+            if job is None:
+                return self._reply(404, {"error": "no such job"})
+            self._reply(200, job.status())
+
+        def _reply(self, code, data):
+            body = json.dumps(data).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"API {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(args):
+    logging.basicConfig(
+        filename=os.path.join(args.output, "daemon.log"), filemode="a",
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    daemon = Daemon(args.output, workers=args.workers, resolvers=args.resolvers, throttle_kbps=args.throttle_kbps,
+                    engine=args.engine, quality=args.quality, stall_timeout=args.stall_timeout,
+                    metrics_textfile=args.metrics_textfile, job_store=args.job_store).start()
+    server = make_server(daemon, args.host, args.port)
+    print(f"NovaStream daemon listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+
+
+def _call(args, method, path, body=None):
+    url = f"http://{args.host}:{args.port}{path}"
+    try:
+        r = requests.request(method, url, json=body, timeout=10)
+    except requests.ConnectionError:
+        print(f"No daemon at {url}; start one with 'python -m src.daemon serve'", file=sys.stderr)
+        return 1
+    print(json.dumps(r.json(), indent=2))
+    return 0 if r.ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="novastream-daemon", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("serve", help="run the daemon in the foreground")
+    run.add_argument("--output", default="downloads", help="default folder for downloaded series")
+    run.add_argument("--workers", type=int, default=4, help="concurrent transfers")
+    run.add_argument("--resolvers", type=int, default=1, help="pooled browsers resolving manifests")
+    run.add_argument("--throttle-kbps", type=int, default=0, help="bandwidth cap shared by all transfers")
+    run.add_argument("--engine", choices=ENGINES, default="ffmpeg")
+    run.add_argument("--quality", default="best")
+    run.add_argument("--stall-timeout", type=float, default=watchdog.STALL_TIMEOUT)
+    run.add_argument("--metrics-textfile", help="Prometheus text file updated while jobs run")
+    run.add_argument("--job-store", help=f"job database (default: {STORE_FILE} in the output folder)")
+    submit = commands.add_parser("submit", help="queue a series")
+    submit.add_argument("url")
+    submit.add_argument("--name", default="")
+    submit.add_argument("--episodes", default="", help="e.g. 1,3-5; all episodes when omitted")
+    submit.add_argument("--engine", choices=ENGINES)
+    submit.add_argument("--quality")
+    submit.add_argument("--output", help="folder inside the daemon's output folder")
+    status = commands.add_parser("status", help="show the daemon or one job")
+    status.add_argument("job", nargs="?")
+    cancel = commands.add_parser("cancel", help="cancel a job")
+    cancel.add_argument("job")
+    commands.add_parser("shutdown", help="stop the daemon")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        os.makedirs(args.output, exist_ok=True)
+        serve(args)
+        return 0
+    if args.command == "submit":
+        body = {k: getattr(args, k) for k in ("url", "name", "episodes", "engine", "quality", "output")}
+        return _call(args, "POST", "/jobs", body)
+    if args.command == "status":
+        return _call(args, "GET", f"/jobs/{args.job}" if args.job else "/status")
+    if args.command == "cancel":
+        return _call(args, "DELETE", f"/jobs/{args.job}")
+    return _call(args, "POST", "/shutdown", {})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+User prompts for NovaStream downloads: Tk dialogs on a desktop, console
+messages on headless machines.
+"""
+import logging
+import os
+import sys
+
+from colorama import Fore
+
+TOTAL_PROMPT = "Could not auto-detect episodes. Enter total count:"
+
+
+def _tk():
+    """Return the tkinter module, or None when it is missing or there is no display."""
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return None
+    try:
+        # Dynamic import: servers often lack the Tk libraries
+        import tkinter
+    except ImportError:
+        return None
+    return tkinter
+
+
+def ask_total():
+    """Ask for the episode count when it cannot be detected; None if cancelled or nobody can answer."""
+    tk = _tk()
+    if tk is None:
+        if not (sys.stdin and sys.stdin.isatty()):
+            logging.error("Episode count unknown and no terminal to ask; pass an episode list instead")
+            return None
+        return input(TOTAL_PROMPT + " ").strip() or None
+    from tkinter import simpledialog
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        return simpledialog.askstring("Input", TOTAL_PROMPT, initialvalue="1")
+    finally:
+        root.destroy()
+
+
+def _show(kind, title, message, color):
+    tk = _tk()
+    if tk is None:
+        print(color + message)
+        return
+    from tkinter import messagebox
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        getattr(messagebox, kind)(title, message)
+    finally:
+        root.destroy()
+
+
+def show_error(title, message):
+    _show("showerror", title, message, Fore.RED)
+
+
+def show_info(title, message):
+    _show("showinfo", title, message, Fore.GREEN)
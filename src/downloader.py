@@ -3,139 +3,783 @@ Downloader module for NovaStream.
 """
 import os
 import re
+import queue
+import signal
+import time
 import logging
 import subprocess  # nosec B404
+import threading
 import multiprocessing as mp
+from collections import deque, namedtuple
 import requests
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 from colorama import init as colorama_init, Fore
-import tkinter as tk
-from tkinter import messagebox, simpledialog
 
-from src.manifest import get_manifest_urls
+from src import browser_pool, dialogs, hls, hls_async, jobstore, metrics, progress, ratelimit, retry, watchdog
+from src.completion import CompletionIndex
+from src.concurrency import AIMDController, adaptive_imap
+from src.episode import resolve_episode
+from src.manifest import get_manifest_urls, resolve_streams
+from src.manifest_cache import CACHE_FILE, DEFAULT_TTL, ManifestCache, url_expiry
+from src.pipeline import run_pipeline
 from src.scraper import find_episode_links
-from src.utils import banner, expand_ranges
+from src.utils import banner, expand_ranges, file_sha256
 
 # initialize colorama
 colorama_init(autoreset=True)
 
-# Track ffmpeg processes for cancellation
+# Track ffmpeg processes for cancellation, with the owner each was started under
 FFMPEG_PROCS = []
+FFMPEG_OWNERS = {}
+_owner = threading.local()
+
+# Transfer engines selectable through the ``engine`` option
+ENGINES = ("ffmpeg", "native", "async")
+
+# Seconds of manifest validity a queued job needs before its transfer starts
+EXPIRY_MARGIN = 60
+
+# An episode resolved to a stream and an output path, ready for transfer;
+# ``throttled`` records the cap at resolve time (transfers check it again) and
+# ``audio`` is the variant's separate audio playlist, if it has one
+EpisodeJob = namedtuple("EpisodeJob", ["args", "num", "url", "m3u8", "outpath", "engine", "throttled", "retries",
+                                       "options", "expires", "audio"], defaults=(None,))
+
+# Manifest re-resolutions allowed per episode after its tokens are rejected
+MAX_REFRESHES = 1
+
+# ffmpeg stderr lines kept for error reports
+STDERR_TAIL_LINES = 40
+
+# Extra rounds given to episodes whose transfer stalled and was requeued
+MAX_REQUEUES = 2
+
+# Returned by a transfer the watchdog stopped; ``args`` go back on the queue
+Requeue = namedtuple("Requeue", ["args"])
+
+# HTTP failures reported by ffmpeg, e.g. "Server returned 403 Forbidden (access denied)"
+_FFMPEG_HTTP_RE = re.compile(r"(?:Server returned|HTTP error) (\d{3})")
 
 def _safe_download_episode(args):
     try:
         return download_episode(args)
     except Exception as e:
         logging.error(f"Error in download_episode: {e}")
+        metrics.count("failures")
+        return False
+
+class OwnedTransfer:
+    """
+    Stage wrapper tagging the ffmpeg processes ``func`` starts with
+    ``owner``, so ``kill_ffmpeg(owner)`` stops only those.
+    ``cancel()`` also stops the native engines between segments and keeps
+    cancelled transfers from falling back to (or retrying) ffmpeg.
+    """
+
+    def __init__(self, func, owner):
+        self.func = func
+        self.owner = owner
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        kill_ffmpeg(self.owner)
+
+    def __call__(self, item):
+        previous = getattr(_owner, "tag", None), getattr(_owner, "transfer", None)
+        _owner.tag, _owner.transfer = self.owner, self
+        try:
+            return self.func(item)
+        finally:
+            _owner.tag, _owner.transfer = previous
+
+def _cancelled():
+    """True when the transfer running on this thread belongs to a cancelled OwnedTransfer."""
+    transfer = getattr(_owner, "transfer", None)
+    return bool(transfer and transfer.cancelled)
+
+def _check_cancelled(num):
+    if _cancelled():
+        raise hls.TransferCancelled(f"[#{num}] transfer cancelled")
+
+def kill_ffmpeg(owner=None):
+    """SIGTERM the running ffmpeg process groups started under ``owner``, or all of them."""
+    for proc in FFMPEG_PROCS[:]:
+        if owner is not None and FFMPEG_OWNERS.get(proc) != owner:
+            continue
+        try:
+            os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+        except OSError as e:
+            logging.warning(f"Could not stop ffmpeg {proc.pid}: {e}")
+
+def _drain_stderr(stream, tail, parser):
+    for raw in stream:
+        line = raw.decode('utf-8', errors='replace').rstrip()
+        if parser.duration is None:
+            parser.duration = progress.parse_duration(line)
+        tail.append(line)
+
+def _run_ffmpeg(cmd, on_progress=None, stall_timeout=watchdog.STALL_TIMEOUT):
+    """
+    Run an ffmpeg command, tracking it for cancellation. Machine-readable
+    progress is parsed as it arrives and passed to ``on_progress``; only
+    the last STDERR_TAIL_LINES lines of stderr are kept.
+    If neither bytes nor media time advance for ``stall_timeout`` seconds,
+    the process group is killed and TransferStalled is raised.
+    Returns (returncode, stderr tail).
+    """
+    # Progress blocks go to stdout; -nostats drops the status line from stderr
+    cmd = cmd[:-1] + ["-progress", "pipe:1", "-nostats", cmd[-1]]
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        preexec_fn=os.setsid
+    )  # nosec B603
+    # cmd is fully controlled, no shell=True
+    FFMPEG_PROCS.append(proc)
+    FFMPEG_OWNERS[proc] = getattr(_owner, "tag", None)
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    parser = progress.ProgressParser()
+    # Drain stderr alongside stdout so neither pipe fills up and blocks ffmpeg
+    reader = threading.Thread(target=_drain_stderr, args=(proc.stderr, tail, parser), daemon=True)
+    reader.start()
+    mark = None
+    try:
+        with watchdog.Watchdog(stall_timeout, lambda: watchdog.kill_group(proc)) as dog:
+            for raw in proc.stdout:
+                event = parser.feed(raw.decode('utf-8', errors='replace'))
+                if not event:
+                    continue
+                # ffmpeg keeps reporting while blocked on a dead socket; only movement counts
+                if (event.out_time, event.total_size) != mark:
+                    mark = (event.out_time, event.total_size)
+                    dog.feed()
+                if on_progress:
+                    on_progress(event)
+            proc.wait()
+        reader.join()
+    finally:
+        try:
+            FFMPEG_PROCS.remove(proc)
+        except ValueError:
+            pass
+        FFMPEG_OWNERS.pop(proc, None)
+    if dog.stalled:
+        raise watchdog.TransferStalled(f"ffmpeg made no progress for {stall_timeout}s")
+    return proc.returncode, "\n".join(tail).strip()
+
+def _ffmpeg_transfer(num, cmd, stall_timeout=watchdog.STALL_TIMEOUT):
+    """
+    Run the ffmpeg transfer of episode ``num``, publishing its progress.
+    Returns (returncode, stderr tail, seconds of media written or None).
+    The duration is the last ``out_time`` in the progress stream: with
+    -nostats, stderr carries no status lines to read it from.
+    """
+    last = []
+    written = [None]
+    def report(event):
+        event = event._replace(num=num)
+        last[:] = [event]
+        if event.out_time:
+            written[0] = event.out_time
+        progress.emit(event)
+    try:
+        returncode, err_msg = _run_ffmpeg(cmd, report, stall_timeout=stall_timeout)
+    finally:
+        if not last or not last[0].done:
+            # Killed or failed runs never print progress=end; close the episode's bar share
+            progress.emit(progress.Progress(num, None, None, None, None, True))
+    return returncode, err_msg, written[0]
+
+def _part_path(outpath):
+    """Staging path the output container is written to before promotion."""
+    return outpath + ".part"
+
+def _stream_paths(outpath, track="stream"):
+    """Native engine staging stream and its segment journal; ``track`` is 'stream' or 'audio'."""
+    stream = f"{outpath}.{track}.part"
+    return stream, stream + ".json"
+
+def _ffmpeg_inputs(video, audio=None):
+    """ffmpeg input arguments, mapping a separate audio playlist or stream in beside the video."""
+    if not audio:
+        return ["-i", video]
+    return ["-i", video, "-i", audio, "-map", "0:v", "-map", "1:a"]
+
+def _promote(part, outpath):
+    """
+    Move a finished staging file into place atomically, so ``outpath``
+    only ever holds complete output. Empty or missing output is discarded.
+    """
+    if not os.path.exists(part) or os.path.getsize(part) == 0:
+        logging.error(f"Staged output {part} is missing or empty")
+        _discard_part(part)
         return False
+    with metrics.timer("postprocess"):
+        os.replace(part, outpath)
+    return True
+
+def _discard_part(part):
+    if os.path.exists(part):
+        os.remove(part)
+
+def _cleanup_stream(outpath):
+    """Drop native staging left behind once ffmpeg finished the episode instead."""
+    for track in ("stream", "audio"):
+        for path in _stream_paths(outpath, track):
+            _discard_part(path)
+
+def _fetch_stream(num, m3u8, stream, journal, options, engine):
+    # Only owned transfers can be cancelled, so only they are polled
+    extra = {'cancelled': _cancelled} if getattr(_owner, "transfer", None) else {}
+    if engine == 'async':
+        if hls_async.available():
+            concurrency = options.get('segment_workers', hls_async.CONCURRENCY)
+            per_host = options.get('per_host', hls_async.PER_HOST)
+            return hls_async.download_stream(m3u8, stream, concurrency, journal=journal, per_host=per_host, **extra)
+        logging.warning(f"[#{num}] aiohttp is not installed; using the threaded native engine")
+    workers = options.get('segment_workers', 8)
+    controller = None
+    if options.get('adaptive'):
+        controller = AIMDController(maximum=workers, initial=2, name=f"segment workers #{num}")
+    return hls.download_stream(m3u8, stream, concurrency=workers, journal=journal, controller=controller, **extra)
+
+def _download_native(num, m3u8, outpath, options, engine='native', audio=None):
+    """
+    Fetch the stream with an in-process segment engine (threaded, or asyncio
+    for ``engine='async'``), then remux the staged transport stream into the
+    output container without re-encoding. A separate ``audio`` playlist is
+    fetched the same way and muxed in.
+    The staged streams and their journals survive failures, so the next
+    attempt resumes from the last complete segment.
+    """
+    stream, journal = _stream_paths(outpath)
+    audio_stream, audio_journal = _stream_paths(outpath, "audio")
+    part = _part_path(outpath)
+    try:
+        result = _fetch_stream(num, m3u8, stream, journal, options, engine)
+        if audio:
+            track = _fetch_stream(num, audio, audio_stream, audio_journal, options, engine)
+            result = result._replace(bytes=result.bytes + track.bytes, segments=result.segments + track.segments,
+                                     retries=result.retries + track.retries,
+                                     retry_wait=result.retry_wait + track.retry_wait)
+        logging.info(f"[#{num}] native engine fetched {result.bytes} bytes in {result.segments} segments")
+        metrics.count("segments", result.segments)
+        metrics.count("retries", result.retries)
+        with metrics.timer("postprocess"):
+            cmd = ["ffmpeg", "-y", *_ffmpeg_inputs(stream, audio_stream if audio else None), "-c", "copy", "-f", "mp4",
+                   part]
+            returncode, err_msg = _run_ffmpeg(cmd,
+                                              stall_timeout=options.get('stall_timeout', watchdog.STALL_TIMEOUT))
+        if returncode != 0:
+            raise hls.HLSError(f"remux failed with code {returncode}: {err_msg}")
+        if not _promote(part, outpath):
+            raise hls.HLSError("remux produced no output")
+    except (hls.ManifestExpired, hls.TransferCancelled, watchdog.TransferStalled):
+        _discard_part(part)
+        raise
+    except (hls.HLSError, requests.RequestException, OSError) as e:
+        logging.warning(f"[#{num}] native engine failed: {e}")
+        _discard_part(part)
+        return None
+    os.remove(stream)
+    _discard_part(audio_stream)
+    if result.retries:
+        logging.info(f"[#{num}] {result.retries} segment retries, {result.retry_wait:.1f}s backing off")
+    return result
+
+def _record_complete(index, num, outpath, duration=None):
+    # The hash describes the saved file, whichever engine produced it
+    if not os.path.exists(outpath):
+        index.record(num, outpath, 0, duration)
+        return
+    index.record(num, outpath, os.path.getsize(outpath), duration, file_sha256(outpath))
 
 def download_episode(args):
+    """
+    Download one episode.
+    ``args`` is (drama_name, num, url, outdir), optionally followed by
+    throttle_kbps and retries, and then an options dict. Recognised options:
+    ``engine`` ('ffmpeg', 'native' or 'async'), ``segment_workers``
+    (segment requests in flight; 'async' also honours ``per_host``), ``quality``
+    (variant policy, see ``select_variant``), ``max_bandwidth`` and
+    ``browsers`` (size of the warm browser pool; 0 launches Chrome per episode),
+    ``manifest_wait`` and ``manifest_settle`` (capture deadline and settle window),
+    ``manifest_cache`` (reuse manifests resolved by earlier runs, default on),
+    ``manifest_ttl`` (cache lifetime for URLs without an expiry) and
+    ``adaptive`` (let the native engine tune segment concurrency, with
+    ``segment_workers`` as the ceiling).
+    A non-zero throttle_kbps caps the aggregate rate of every download
+    sharing this process's limiter (see ``ratelimit``); since ffmpeg cannot
+    be paced, throttled episodes are fetched with the native engine.
+    """
+    job = resolve_episode_job(args)
+    if isinstance(job, bool):
+        return job
+    return transfer_episode(job)
+
+def _parse_args(args):
     # Support throttle and retries if provided
+    options = {}
     if len(args) == 4:
         drama_name, num, url, outdir = args
         throttle_kbps = 0
         retries = 0
     elif len(args) == 6:
         drama_name, num, url, outdir, throttle_kbps, retries = args
+    elif len(args) == 7:
+        drama_name, num, url, outdir, throttle_kbps, retries, options = args
     else:
         raise ValueError(f"Invalid arguments: {args}")
+    return drama_name, num, url, outdir, throttle_kbps, retries, options
+
+def _manifest_cache(outdir, options):
+    if not options.get('manifest_cache', True):
+        return None
+    return ManifestCache(os.path.join(outdir, CACHE_FILE), options.get('manifest_ttl', DEFAULT_TTL))
+
+def resolve_episode_job(args):
+    """
+    Resolution stage of ``download_episode``: find the manifest, variant and
+    output path for an episode. Returns an EpisodeJob, or True/False when
+    the episode needs no transfer (already done, or resolution failed).
+    """
+    _, num, _, outdir = _parse_args(args)[:4]
+    with metrics.episode(num, outdir):
+        return _resolve_job(args)
+
+def _resolve_job(args):
+    drama_name, num, url, outdir, throttle_kbps, retries, options = _parse_args(args)
+    engine = options.get('engine', 'ffmpeg')
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    # Callers running a batch configure the shared limiter up front
+    if ratelimit.current() is None:
+        ratelimit.configure(throttle_kbps)
+    throttled = ratelimit.throttled()
+    # Finished in an earlier run: skip before any network work
+    index = CompletionIndex(outdir)
+    if index.is_complete(num):
+        msg = f"[#{num}] Skipping download; already complete: {index.get(num)['path']}"
+        logging.info(msg)
+        print(Fore.YELLOW + msg)
+        metrics.count("skipped")
+        return True
+    if options.get('browsers'):
+        browser_pool.configure(options['browsers'])
     logging.info(f"Episode {num}: starting download from {url}")
-    # Fetch episode page to extract title for filename
+    # Reuse a still-valid manifest capture from an earlier run
+    cache = _manifest_cache(outdir, options)
+    cached = cache.get(url) if cache else None
+    # One page load yields the title and the manifest candidates
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        page_soup = BeautifulSoup(resp.text, 'html.parser')
-    except requests.RequestException as e:
-        logging.warning(f"Failed to fetch page content from {url}: {e}")
-        raw_title = f"Episode {num}"
-    else:
-        raw_title = page_soup.title.string.strip() if page_soup.title else f"Episode {num}"
-    # Clean title text for filename (allow spaces only)
-    title_clean = re.sub(r'[^0-9a-zA-Z ]+', ' ', raw_title).strip()
-    # get manifest URL(s)
-    try:
-        manifests = get_manifest_urls(url)
+        capture = {key: options[opt] for opt, key in (('manifest_wait', 'wait'), ('manifest_settle', 'settle'))
+                   if opt in options}
+        info = resolve_episode(url, cached, browser=get_manifest_urls, **capture)
     except Exception as e:
         logging.error(f"Episode {num}: manifest retrieval error: {e}")
         print(Fore.RED + f"[#{num}] Manifest retrieval error: {e}")
+        metrics.count("failures")
         return False
-    if not manifests:
+    if not info.manifests:
         print(Fore.RED + f"[#{num}] No manifest found for {url}")
+        metrics.count("failures")
         return False
-    # pick first manifest
-    m3u8 = manifests.pop()
+    logging.info(f"Episode {num}: manifests resolved via {info.tier}")
+    if cache and info.tier != 'cache':
+        cache.put(url, info.manifests)
+    # Clean title text for filename (allow spaces only)
+    title_clean = re.sub(r'[^0-9a-zA-Z ]+', ' ', info.title or f"Episode {num}").strip()
+    # pick the variant matching the quality policy, with its separate audio if any
+    m3u8, audio = resolve_streams(info.manifests, options.get('quality', 'best'), options.get('max_bandwidth'))
     # Format display drama name
     drama_disp = drama_name.replace('_', ' ')
     out_filename = f"{drama_disp} - Episode {num:02d} - {title_clean}.mp4"
     outpath = os.path.join(outdir, out_filename)
-    # Resume: skip if file exists
+    # Resume: skip if file exists; partial output only ever lives in .part files
     if os.path.exists(outpath):
         msg = f"[#{num}] Skipping download; file already exists: {out_filename}"
         logging.info(msg)
         print(Fore.YELLOW + msg)
+        metrics.count("skipped")
         return True
-    # Build minimal working ffmpeg command
-    cmd = ["ffmpeg", "-y", "-i", m3u8, "-c", "copy", outpath]
-    # Run ffmpeg and capture output for better error reporting
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        preexec_fn=os.setsid
-    )  # nosec B603
-    # cmd is fully controlled, no shell=True
-    FFMPEG_PROCS.append(proc)
-    stdout_data, stderr_data = proc.communicate()
-    returncode = proc.returncode
-    try:
-        FFMPEG_PROCS.remove(proc)
-    except ValueError:
-        pass
-    if returncode == 0:
-        msg = f"[#{num}] Download complete → {outpath}"
-        logging.info(msg)
-        print(Fore.GREEN + msg)
-        return True
-    else:
-        err_msg = stderr_data.decode('utf-8', errors='replace').strip()
-        logging.error(f"[#{num}] ffmpeg returned code {returncode}: {err_msg}")
-        print(Fore.RED + f"[#{num}] ffmpeg error: {err_msg}")
-        # Retry logic
-        for attempt in range(1, retries+1):
-            logging.info(f"[#{num}] retry {attempt}/{retries}")
-            print(Fore.YELLOW + f"[#{num}] retry {attempt}/{retries}")
-            # restart process
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid
-            )  # nosec B603
-            # cmd is fully controlled, no shell=True
-            FFMPEG_PROCS.append(proc)
-            stdout_data, stderr_data = proc.communicate()
-            returncode = proc.returncode
-            try:
-                FFMPEG_PROCS.remove(proc)
-            except ValueError:
-                pass
-            if returncode == 0:
-                msg = f"[#{num}] Download complete on retry {attempt} → {outpath}"
-                logging.info(msg)
-                print(Fore.GREEN + msg)
-                return True
-        # If we reach here, all retries failed
-        last_err = stderr_data.decode('utf-8', errors='replace').strip()
-        msg = f"[#{num}] Download failed after {retries} retries. Last error: {last_err}"
-        logging.error(msg)
-        print(Fore.RED + msg)
+    # Signed manifests stop working at their expiry; transfers must start before it
+    expiries = [e for e in map(url_expiry, info.manifests) if e is not None]
+    return EpisodeJob(args, num, url, m3u8, outpath, engine, throttled, retries, options,
+                      min(expiries) if expiries else None, audio)
+
+def refresh_episode_job(job, margin=EXPIRY_MARGIN, force=False):
+    """Re-resolve ``job`` if its manifest expires within ``margin`` seconds (or always, with ``force``)."""
+    if not force and (job.expires is None or job.expires - time.time() > margin):
+        return job
+    logging.info(f"Episode {job.num}: manifest expires before transfer; resolving again")
+    cache = _manifest_cache(os.path.dirname(job.outpath), job.options)
+    if cache:
+        cache.discard(job.url)
+    return resolve_episode_job(job.args)
+
+def _ffmpeg_failure(stderr):
+    """Classify an ffmpeg failure from its stderr (see ``retry.classify``)."""
+    match = _FFMPEG_HTTP_RE.search(stderr)
+    if not match:
+        return retry.RETRY
+    status = int(match.group(1))
+    if status in retry.RERESOLVE_STATUSES:
+        return retry.RERESOLVE
+    return retry.RETRY if status in retry.RETRY_STATUSES else retry.FATAL
+
+def _complete(index, num, outpath, duration=None, note=""):
+    _record_complete(index, num, outpath, duration)
+    metrics.count("completed")
+    metrics.count("bytes", os.path.getsize(outpath))
+    msg = f"[#{num}] Download complete{note} → {outpath}"
+    logging.info(msg)
+    print(Fore.GREEN + msg)
+    return True
+
+class _ResolveFailed(Exception):
+    """Re-resolution failed; the resolve stage has already counted the failure."""
+
+def _reresolve(job, refreshes):
+    """Resolve ``job`` again after its tokens were rejected, then transfer it."""
+    if refreshes <= 0:
         return False
+    print(Fore.YELLOW + f"[#{job.num}] Stream tokens rejected; resolving the manifest again")
+    fresh = refresh_episode_job(job, force=True)
+    if fresh is False:
+        raise _ResolveFailed()
+    if fresh is True:
+        return fresh
+    return _transfer(fresh, refreshes - 1)
+
+def transfer_episode(job, refreshes=MAX_REFRESHES):
+    """
+    Transfer stage of ``download_episode``: fetch a resolved EpisodeJob.
+    Native engines retry individual segments; ffmpeg runs are retried whole
+    with jittered backoff. Rejected tokens (401/403/410) trigger up to
+    ``refreshes`` manifest re-resolutions, and a 404 fails fast.
+    A cancelled transfer returns False without counting as a failure.
+    A stalled transfer is killed and returned as Requeue, freeing the slot;
+    native staging and the cached manifest are kept for the next round.
+    """
+    with metrics.episode(job.num, os.path.dirname(job.outpath)), metrics.timer("transfer"):
+        try:
+            result = _transfer(job, refreshes)
+        except watchdog.TransferStalled as e:
+            _discard_part(_part_path(job.outpath))
+            msg = f"[#{job.num}] {e}; requeuing the episode"
+            logging.warning(msg)
+            print(Fore.YELLOW + msg)
+            metrics.count("requeues")
+            return Requeue(job.args)
+        except _ResolveFailed:
+            return False
+        except hls.TransferCancelled as e:
+            logging.info(str(e))
+            return False
+        if result is False:
+            metrics.count("failures")
+        return result
+
+def _transfer(job, refreshes):
+    num, url, m3u8, outpath, engine, retries, options = (
+        job.num, job.url, job.m3u8, job.outpath, job.engine, job.retries, job.options)
+    index = CompletionIndex(os.path.dirname(outpath))
+    # The cap can change while jobs wait, so it is checked as the transfer starts
+    throttled = ratelimit.throttled()
+    if throttled and engine == 'ffmpeg':
+        engine = 'native'
+    _check_cancelled(num)
+    if engine in ('native', 'async'):
+        try:
+            result = _download_native(num, m3u8, outpath, options, engine, job.audio)
+        except hls.ManifestExpired as e:
+            logging.warning(f"[#{num}] {e}")
+            return _reresolve(job, refreshes)
+        if result:
+            return _complete(index, num, outpath, result.duration)
+        # A cancelled drama's folder may be gone already; do not fetch it again with ffmpeg
+        _check_cancelled(num)
+        print(Fore.YELLOW + f"[#{num}] Native engine failed; falling back to ffmpeg")
+        if throttled:
+            logging.warning(f"[#{num}] ffmpeg fallback is not bandwidth limited")
+    # Build minimal working ffmpeg command; output is staged and promoted on success
+    part = _part_path(outpath)
+    cmd = ["ffmpeg", "-y", *_ffmpeg_inputs(m3u8, job.audio), "-c", "copy", "-f", "mp4", part]
+    # Run ffmpeg, streaming its progress and keeping the stderr tail for error reporting
+    stall_timeout = options.get('stall_timeout', watchdog.STALL_TIMEOUT)
+    returncode, err_msg, duration = _ffmpeg_transfer(num, cmd, stall_timeout)
+    if returncode == 0 and _promote(part, outpath):
+        _cleanup_stream(outpath)
+        return _complete(index, num, outpath, duration)
+    if _cancelled():
+        _discard_part(part)
+        _check_cancelled(num)
+    logging.error(f"[#{num}] ffmpeg returned code {returncode}: {err_msg}")
+    print(Fore.RED + f"[#{num}] ffmpeg error: {err_msg}")
+    stats = retry.RetryStats()
+    policy = retry.RetryPolicy(retries, retry.DEFAULT_POLICY.base, retry.DEFAULT_POLICY.cap)
+    # Retry logic; every failure, the first included, is classified before retrying
+    attempt = 0
+    while True:
+        kind = _ffmpeg_failure(err_msg)
+        if kind == retry.RERESOLVE:
+            # Re-resolution has its own budget (``refreshes``) and does not use up retries
+            _discard_part(part)
+            metrics.count("retries", stats.retries)
+            return _reresolve(job, refreshes)
+        if kind == retry.FATAL:
+            print(Fore.RED + f"[#{num}] Not retrying; the server says the stream does not exist")
+            break
+        if attempt >= retries:
+            break
+        attempt += 1
+        delay = retry.backoff(attempt, policy)
+        stats.add(delay)
+        logging.info(f"[#{num}] retry {attempt}/{retries} in {delay:.1f}s")
+        print(Fore.YELLOW + f"[#{num}] retry {attempt}/{retries}")
+        time.sleep(delay)
+        if _cancelled():
+            _discard_part(part)
+            _check_cancelled(num)
+        # restart process
+        returncode, err_msg, duration = _ffmpeg_transfer(num, cmd, stall_timeout)
+        if returncode == 0 and _promote(part, outpath):
+            _cleanup_stream(outpath)
+            logging.info(f"[#{num}] {stats}")
+            metrics.count("retries", stats.retries)
+            return _complete(index, num, outpath, duration, note=f" on retry {attempt}")
+    # If we reach here, all retries failed
+    _discard_part(part)
+    metrics.count("retries", stats.retries)
+    msg = f"[#{num}] Download failed after {stats.retries} retries. Last error: {err_msg}"
+    logging.error(msg)
+    print(Fore.RED + msg)
+    # The manifest may have gone stale; resolve it afresh next time
+    cache = _manifest_cache(os.path.dirname(outpath), options)
+    if cache:
+        cache.discard(url)
+    return False
+
+def with_requeue(run, pool_args, rounds=MAX_REQUEUES):
+    """
+    Yield the results of ``run(pool_args)``, running requeued episodes
+    again in up to ``rounds`` later passes, after everything else. An
+    episode still stalled after the last pass counts as failed.
+    """
+    for round_no in range(rounds + 1):
+        requeued = []
+        for result in run(pool_args):
+            if not isinstance(result, Requeue):
+                yield result
+            elif round_no < rounds:
+                requeued.append(result.args)
+            else:
+                yield False
+        if not requeued:
+            return
+        logging.info(f"Requeuing {len(requeued)} stalled episodes (round {round_no + 1}/{rounds})")
+        pool_args = requeued
+
+class _ErrorCapture(logging.Handler):
+    """Keeps the last error logged by the thread that created it."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.message = None
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.message = record.getMessage()
+
+class RecordAttempts:
+    """
+    Wrap an episode stage (``download_episode``, ``resolve_episode_job``,
+    ``refresh_episode_job`` or ``transfer_episode``) so each call is
+    recorded as an attempt on drama ``drama_id`` in the job store at
+    ``path``: outcome, size and the last error logged. An attempt begun
+    by the resolve stage stays open until its transfer settles. Picklable,
+    for process pools.
+    """
+
+    def __init__(self, func, path, drama_id):
+        self.func = func
+        self.path = path
+        self.drama_id = drama_id
+
+    def __call__(self, item):
+        args = item.args if isinstance(item, EpisodeJob) else item
+        num, outdir = args[1], args[3]
+        store = jobstore.open_store(self.path)
+        store.begin_attempt(self.drama_id, num)
+        capture = _ErrorCapture()
+        logging.getLogger().addHandler(capture)
+        try:
+            result = self.func(item)
+        except Exception as e:
+            store.finish_attempt(self.drama_id, num, jobstore.FAILED, error=str(e))
+            raise
+        finally:
+            logging.getLogger().removeHandler(capture)
+        if isinstance(result, Requeue):
+            store.finish_attempt(self.drama_id, num, jobstore.STALLED, error="transfer stalled")
+        elif result is True:
+            entry = CompletionIndex(outdir).get(num) or {}
+            store.finish_attempt(self.drama_id, num, jobstore.DONE, entry.get('size', 0), entry.get('path'))
+        elif result is False:
+            store.finish_attempt(self.drama_id, num, jobstore.FAILED, error=capture.message or "download failed")
+        return result
+
+def _recorded(func, job_store, drama_id):
+    return RecordAttempts(func, job_store, drama_id) if job_store else func
+
+def _init_worker(bucket, events):
+    """Pool initializer: share the bandwidth limiter and forward progress and metrics to the parent."""
+    if bucket:
+        ratelimit.install(bucket)
+    progress.install_queue(events)
+    metrics.install(events.put)
 
-def run_download(url, name_input, base_output, download_all, episode_list, workers):
+def _track_progress(results, total, events, controller=None, finish=None):
+    """
+    Iterate ``results`` under a tqdm bar that also advances with the
+    Progress events arriving on ``events``, so long episodes move the bar
+    before they finish. Metrics samples forwarded by workers on the same
+    queue go to the session registry. An AIMD ``controller`` adds its
+    level to the postfix. ``finish`` runs after the last result, before
+    the queue stops being read, so whatever the workers send while it
+    waits for them is still recorded.
+    """
+    bar = tqdm(total=total, desc="Downloading", unit="ep",
+               bar_format="{l_bar}{bar}| {n:.1f}/{total_fmt} [{elapsed}<{remaining}{postfix}]")
+    lock = threading.Lock()
+    tracker = progress.ProgressTracker()
+
+    def postfix():
+        workers = f", {controller.level} workers" if controller else ""
+        bar.set_postfix_str(tracker.describe() + workers)
+
+    def follow():
+        for event in iter(events.get, None):
+            if isinstance(event, metrics.Sample):
+                metrics.record(event)
+                continue
+            delta = tracker.update(event)
+            with lock:
+                if delta:
+                    bar.update(delta)
+                postfix()
+
+    follower = threading.Thread(target=follow, daemon=True)
+    follower.start()
+    try:
+        for result in results:
+            with lock:
+                bar.update(1)
+                postfix()
+            yield result
+        if finish is not None:
+            finish()
+    finally:
+        events.put(None)
+        follower.join()
+        bar.close()
+
+def _run_pool(pool_args, workers, bucket, adaptive, drama_dir, download=_safe_download_episode):
+    """Run whole episodes in worker processes, one per pool slot."""
+    events = mp.Queue()
+    with mp.Pool(workers, initializer=_init_worker, initargs=(bucket, events)) as pool:
+        if adaptive:
+            # ``workers`` becomes the ceiling; AIMD picks how many run at once. It only
+            # learns from finished episodes, so start from half the pool rather than one
+            controller = AIMDController(maximum=workers, initial=max(1, workers // 2), name="episode workers")
+            results = with_requeue(
+                lambda args: adaptive_imap(pool, download, args, controller,
+                                           weigh=lambda a, res: (CompletionIndex(drama_dir).get(a[1]) or {}).get('size', 0)),
+                pool_args)
+        else:
+            controller = None
+            results = with_requeue(lambda args: pool.imap_unordered(download, args), pool_args)
+
+        def finish():
+            # Let workers exit normally so their pooled browsers are quit and their last samples flushed
+            pool.close()
+            pool.join()
+
+        for _ in _track_progress(results, len(pool_args), events, controller, finish):
+            pass
+
+def drama_folder(url, name_input):
+    """Folder name for a series: the given name, or the last part of its URL."""
+    return name_input.replace(" ", "_") if name_input else re.sub(r'[^0-9a-zA-Z]+','_',url.rstrip("/").split("/")[-1])
+
+def select_episodes(url, download_all, episode_list, ask_total=None):
+    """
+    Return the (number, url) pairs to download for ``url``: a single
+    episode URL as is, otherwise the scraped links filtered by
+    ``episode_list``. When scraping finds nothing, the list (or, for
+    ``download_all``, the count from ``ask_total``) is mapped onto
+    guessed episode URLs. Returns None if ``ask_total`` is cancelled and
+    raises ValueError when there is nothing to go on.
+    """
+    m = re.search(r"episode[-_](\d+)", url, re.IGNORECASE)
+    if m:
+        return [(int(m.group(1)), url)]
+    with metrics.timer("scrape"):
+        all_eps = find_episode_links(url)
+    if not all_eps:
+        if download_all:
+            if ask_total is None:
+                raise ValueError("No episodes found; pass an episode list.")
+            total = ask_total()
+            if total is None:
+                return None
+            all_eps = [(n, f"{url.rstrip('/')}-episode-{n}/") for n in range(1, int(total)+1)]
+        elif episode_list:
+            want = expand_ranges(episode_list)
+            all_eps = [(n, f"{url.rstrip('/')}-episode-{n}/") for n in want]
+        else:
+            raise ValueError("No episodes found and no selection provided.")
+    return all_eps if download_all else [(n,u) for n,u in all_eps if n in expand_ranges(episode_list)]
+
+def episode_options(engine="ffmpeg", quality="best", stall_timeout=watchdog.STALL_TIMEOUT, reuse_browsers=False,
+                    adaptive=False):
+    """The ``download_episode`` options that differ from their defaults."""
+    options = {}
+    if engine != "ffmpeg":
+        options['engine'] = engine
+    if quality != "best":
+        options['quality'] = quality
+    if reuse_browsers:
+        # One warm browser per worker process, reused across its episodes
+        options['browsers'] = 1
+    if adaptive:
+        options['adaptive'] = True
+    if stall_timeout != watchdog.STALL_TIMEOUT:
+        options['stall_timeout'] = stall_timeout
+    return options
+
+def episode_args(drama_name, drama_dir, episodes, throttle_kbps=0, options=None):
+    """Build the per-episode argument tuples taken by ``download_episode``."""
+    if options:
+        return [(drama_name, n, u, drama_dir, throttle_kbps, 0, options) for n, u in episodes]
+    if throttle_kbps:
+        return [(drama_name, n, u, drama_dir, throttle_kbps, 0) for n, u in episodes]
+    return [(drama_name, n, u, drama_dir) for n, u in episodes]
+
+def run_download(url, name_input, base_output, download_all, episode_list, workers, engine="ffmpeg", quality="best",
+                 reuse_browsers=False, throttle_kbps=0, adaptive=False, resolvers=0, lookahead=None,
+                 stall_timeout=watchdog.STALL_TIMEOUT, metrics_textfile=None, job_store=None):
+    """
+    Download a series (or a single episode URL) into ``base_output``.
+    With ``job_store`` (a database path, see ``jobstore``) the series,
+    its episodes and every attempt are recorded there as they happen.
+    """
     banner()
     # Determine drama folder name
-    drama_name = name_input.replace(" ", "_") if name_input else re.sub(r'[^0-9a-zA-Z]+','_',url.rstrip("/").split("/")[-1])
+    drama_name = drama_folder(url, name_input)
     drama_dir = os.path.join(base_output, drama_name)
     os.makedirs(drama_dir, exist_ok=True)
 
@@ -147,45 +791,71 @@ def run_download(url, name_input, base_output, download_all, episode_list, worke
         format="%(asctime)s [%(levelname)s] %(message)s"
     )
     logging.info(f"Session start for '{drama_name}'")
+    # Stage timings and counters; ``metrics_textfile`` gets Prometheus text as the run progresses
+    session = metrics.reset(metrics_textfile)
 
     # Resolve episodes
-    m = re.search(r"episode[-_](\d+)", url, re.IGNORECASE)
-    if m:
-        episodes = [(int(m.group(1)), url)]
-    else:
-        all_eps = find_episode_links(url)
-        if not all_eps:
-            if download_all:
-                total = None
-                def ask_total():
-                    nonlocal total
-                    root = tk.Tk()
-                    root.withdraw()
-                    total = simpledialog.askstring("Input", "Could not auto-detect episodes. Enter total count:", initialvalue="1")
-                    root.destroy()
-                ask_total()
-                if total is None:
-                    return
-                all_eps = [(n, f"{url.rstrip('/')}-episode-{n}/") for n in range(1, int(total)+1)]
-            elif episode_list:
-                want = expand_ranges(episode_list)
-                all_eps = [(n, f"{url.rstrip('/')}-episode-{n}/") for n in want]
-            else:
-                root = tk.Tk()
-                root.withdraw()
-                messagebox.showerror("Error", "No episodes found and no selection provided.")
-                root.destroy()
-                return
-        episodes = all_eps if download_all else [(n,u) for n,u in all_eps if n in expand_ranges(episode_list)]
+    if reuse_browsers:
+        browser_pool.configure()
+    try:
+        episodes = select_episodes(url, download_all, episode_list, ask_total=dialogs.ask_total)
+    except ValueError as e:
+        dialogs.show_error("Error", str(e))
+        return
+    finally:
+        # Worker processes start their own pools; don't fork live browsers
+        browser_pool.shutdown()
+    if episodes is None:
+        return
+
+    drama_id = None
+    if job_store:
+        store = jobstore.open_store(job_store)
+        drama_id = store.open_drama(url, base_output, name_input, jobstore.drama_config(
+            jobstore.CLI, download_all=bool(download_all), episode_list=episode_list or "", engine=engine,
+            quality=quality, workers=workers, adaptive=bool(adaptive)))
+        # Attempts left open by a crashed run of this series
+        store.recover(drama_id)
+        store.update_drama(drama_id, status=jobstore.RUNNING, started=time.time(), finished=None)
+        store.add_episodes(drama_id, episodes)
+
+    # Skip episodes finished in earlier runs before spawning any workers
+    pending = CompletionIndex(drama_dir).pending(episodes)
+    if len(pending) < len(episodes):
+        logging.info(f"Skipping {len(episodes) - len(pending)} already completed episodes")
 
     # Parallel download
-    pool_args = [(drama_name, n, u, drama_dir) for n, u in episodes]
-    with mp.Pool(workers) as pool:
-        for _ in tqdm(pool.imap_unordered(_safe_download_episode, pool_args), total=len(pool_args), desc="Downloading"):
-            pass
+    options = episode_options(engine, quality, stall_timeout, reuse_browsers, adaptive)
+    pool_args = episode_args(drama_name, drama_dir, pending, throttle_kbps, options)
+    # One bucket in shared memory caps all worker processes together
+    bucket = ratelimit.configure(throttle_kbps)
+    if resolvers:
+        # A few pooled browsers resolve ahead while ``workers`` transfers drain the queue
+        browser_pool.configure(resolvers)
+        # Transfers run on threads here, so progress arrives through an in-process queue
+        events = queue.Queue()
+        progress.install(events.put)
+        try:
+            results = with_requeue(
+                lambda args: run_pipeline(args, _recorded(resolve_episode_job, job_store, drama_id),
+                                          _recorded(transfer_episode, job_store, drama_id), resolvers=resolvers,
+                                          transfers=workers, lookahead=lookahead,
+                                          refresh=_recorded(refresh_episode_job, job_store, drama_id)),
+                pool_args)
+            for _ in _track_progress(results, len(pool_args), events):
+                pass
+        finally:
+            progress.install(None)
+            browser_pool.shutdown()
+    else:
+        _run_pool(pool_args, workers, bucket, adaptive, drama_dir,
+                  _recorded(_safe_download_episode, job_store, drama_id))
+    session.write_json(os.path.join(drama_dir, metrics.METRICS_FILE), series=drama_dir)
+    session.write_textfile()
+    if drama_id is not None:
+        failed = store.summary(drama_id).get(jobstore.FAILED, 0)
+        store.update_drama(drama_id, status=jobstore.FAILED if failed else jobstore.DONE, finished=time.time(),
+                           last_error=f"{failed} episodes failed" if failed else None)
 
-    root = tk.Tk()
-    root.withdraw()
-    messagebox.showinfo("Done", f"✅ Done! {len(episodes)} files saved in:\n{drama_dir}")
-    root.destroy()
+    dialogs.show_info("Done", f"✅ Done! {len(episodes)} files saved in:\n{drama_dir}")
     logging.info("Session complete.")
\ No newline at end of file
@@ -1,6 +1,7 @@
 """
 Web driver module for NovaStream.
 """
+from src import metrics
 
 # Selenium-wire and webdriver-manager imports moved into function scope for optional packaging
 
@@ -16,6 +17,8 @@ def get_driver():
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    chrome_options.add_argument("--autoplay-policy=no-user-gesture-required")
+    with metrics.timer("browser"):
+        service = Service(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
     return driver 
\ No newline at end of file
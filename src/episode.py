@@ -0,0 +1,96 @@
+"""
+Episode metadata resolution for NovaStream.
+"""
+import html as html_lib
+import logging
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+
+from src import metrics, transport
+from src.manifest import get_manifest_urls, resolve_manifests
+
+# Everything downloads need to know about an episode page, from one page load.
+# ``tier`` records how the manifests were found ('cache', 'html', 'iframe', 'browser').
+EpisodeInfo = namedtuple("EpisodeInfo", ["url", "title", "manifests", "tier"])
+
+# Upper bound on bytes read when only the document head is needed
+HEAD_READ_LIMIT = 64 * 1024
+
+# Sites whose pages needed the browser tier; their later pages skip the static fetch
+_browser_hosts = set()
+
+_TITLE_RE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+_HEAD_END_RE = re.compile(rb"</title\s*>|</head\s*>", re.IGNORECASE)
+
+
+def page_title(html):
+    """Return the text of the document <title>, or None."""
+    match = _TITLE_RE.search(html or "")
+    if not match:
+        return None
+    title = html_lib.unescape(re.sub(r"\s+", " ", match.group(1))).strip()
+    return title or None
+
+
+def fetch_title(url, max_bytes=HEAD_READ_LIMIT):
+    """Read only as much of the page as needed to get its <title>."""
+    try:
+        resp = transport.get_session().get(url, timeout=10, stream=True)
+        try:
+            resp.raise_for_status()
+            head = b""
+            for chunk in resp.iter_content(chunk_size=4096):
+                head += chunk
+                if _HEAD_END_RE.search(head) or len(head) >= max_bytes:
+                    break
+        finally:
+            resp.close()
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch page content from {url}: {e}")
+        return None
+    return page_title(head.decode(resp.encoding or "utf-8", errors="replace"))
+
+
+def resolve_episode(url, manifests=None, browser=None, **capture):
+    """
+    Resolve an episode page into an EpisodeInfo. The page body fetched for
+    the title also feeds the static manifest tiers; the browser is only
+    launched when they find nothing. Once a site's page has needed the
+    browser, its later pages are loaded there only, title included, so
+    each costs one page load. When ``manifests`` are already known (e.g.
+    cached) only the document head is read for the title.
+    """
+    if manifests:
+        with metrics.timer("title"):
+            title = fetch_title(url)
+        return EpisodeInfo(url, title, set(manifests), "cache")
+    host = urlsplit(url).netloc
+    if host in _browser_hosts:
+        page = {}
+        with metrics.timer("manifest"):
+            found = (browser or get_manifest_urls)(url, page=page, **capture)
+        if found:
+            return EpisodeInfo(url, page.get("title"), found, "browser")
+        # The site may have changed; go through every tier again
+        _browser_hosts.discard(host)
+    page_html = ""
+    try:
+        with metrics.timer("title"):
+            resp = transport.get_session().get(url, timeout=10)
+            resp.raise_for_status()
+            page_html = resp.text
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch page content from {url}: {e}")
+    with metrics.timer("manifest"):
+        found, tier = resolve_manifests(url, page_html, browser=browser, **capture)
+    if tier == "browser" and found:
+        _browser_hosts.add(host)
+    return EpisodeInfo(url, page_title(page_html), found, tier)
+
+
+def reset():
+    """Forget which sites needed the browser."""
+    _browser_hosts.clear()
@@ -8,16 +8,19 @@ import multiprocessing as mp
 import os
 import re
 from threading import Thread
-from multiprocessing.dummy import Pool as ThreadPool
 import shutil
-import signal
-from src.downloader import FFMPEG_PROCS
+from src.downloader import ENGINES
 import logging
-import json
+import time
 
+from src import browser_pool, jobstore, metrics, progress, ratelimit
+from src.completion import CompletionIndex
+from src.pipeline import POLICIES, ROUND_ROBIN
+from src.scheduler import DEFAULT_BROWSERS, Scheduler, Stages
 from src.scraper import find_episode_links
 from src.utils import expand_ranges
-from src.downloader import download_episode
+from src.downloader import (OwnedTransfer, RecordAttempts, refresh_episode_job, resolve_episode_job, transfer_episode,
+                            with_requeue)
 
 
 def main():
@@ -73,6 +76,10 @@ def main():
     throttle_var = tk.IntVar(value=0)  # KB/s, 0 = unlimited
     retries_var = tk.IntVar(value=3)
     schedule_var = tk.IntVar(value=0)  # Delay start in minutes
+    engine_var = tk.StringVar(value="ffmpeg")
+    quality_var = tk.StringVar(value="best")
+    adaptive_var = tk.BooleanVar(value=False)  # Let native transfers tune their segment concurrency
+    share_var = tk.StringVar(value=ROUND_ROBIN)  # How running dramas share the workers
 
     # Input fields
     ttk.Label(main_frame, text="Drama URL:").grid(row=0, column=0, sticky="E", pady=5)
@@ -117,19 +124,47 @@ def main():
     ttk.Label(main_frame, text="Retries:").grid(row=9, column=0, sticky="E", pady=5)
     ttk.Spinbox(main_frame, from_=0, to=10, textvariable=retries_var, width=5).grid(row=9, column=1, sticky="W", pady=5)
 
+    # Transfer engine
+    ttk.Label(main_frame, text="Engine:").grid(row=10, column=0, sticky="E", pady=5)
+    ttk.Combobox(main_frame, textvariable=engine_var, values=ENGINES, state="readonly", width=10).grid(row=10, column=1, sticky="W", pady=5)
+
+    # Variant quality policy
+    ttk.Label(main_frame, text="Quality:").grid(row=11, column=0, sticky="E", pady=5)
+    ttk.Combobox(main_frame, textvariable=quality_var, values=("best", "1080p", "720p", "480p", "smallest"), width=10).grid(row=11, column=1, sticky="W", pady=5)
+
+    # Adaptive concurrency
+    ttk.Checkbutton(main_frame, text="Auto-tune workers", variable=adaptive_var).grid(row=12, column=1, sticky="W", pady=5)
+
+    # Sharing of the worker budget between dramas running at once
+    ttk.Label(main_frame, text="Sharing:").grid(row=13, column=0, sticky="E", pady=5)
+    ttk.Combobox(main_frame, textvariable=share_var, values=POLICIES, state="readonly", width=12).grid(row=13, column=1, sticky="W", pady=5)
+
     main_frame.columnconfigure(1, weight=1)
 
-    cancel_flag = {'canceled': False}
+    # One scheduler shares the workers, browsers and bandwidth between every running drama
+    scheduler_holder = {'scheduler': None}
+    def get_scheduler():
+        workers = workers_var.get()
+        budget = (workers, min(workers, DEFAULT_BROWSERS), share_var.get())
+        sched = scheduler_holder['scheduler']
+        if sched is not None and sched.budget() != budget and not sched.active:
+            sched.close()
+            sched = None
+        if sched is None:
+            sched = Scheduler(transfers=budget[0], browsers=budget[1], throttle_kbps=throttle_var.get() * 1000,
+                              policy=budget[2])
+            scheduler_holder['scheduler'] = sched
+        return sched
 
     # Buttons row
     btn_frame = ttk.Frame(main_frame)
-    btn_frame.grid(row=10, column=0, columnspan=3, pady=(10,0))
+    btn_frame.grid(row=14, column=0, columnspan=3, pady=(10,0))
     start_btn = ttk.Button(btn_frame, text="Start")
     start_btn.pack(side="right", padx=5)
 
-    # Multi-drama queue with persistence
+    # Multi-drama queue, persisted row by row in the job store
+    store = jobstore.open_store()
     drama_queue = []
-    queue_file = 'data/drama_queue.json'
     queue_frame = ttk.Frame(root, padding=(5,5), relief="groove")
     queue_frame.grid(row=1, column=1, rowspan=10, sticky="NSW", padx=(5,0))
     ttk.Label(queue_frame, text="Drama Queue").pack()
@@ -138,21 +173,20 @@ def main():
     btn_qf = ttk.Frame(queue_frame)
     btn_qf.pack(fill="x", pady=(5,0))
 
-    # Load persisted queue
+    # Load persisted queue; downloads cut short by a crash or reboot resume from their last finished episode.
+    # The store is shared with the CLI and daemon, so only this queue's dramas are listed, and a drama is
+    # recovered only when this window starts it
     try:
-        with open(queue_file, 'r') as f:
-            saved = json.load(f)
-            for cfg in saved:
-                drama_queue.append(cfg)
-                queue_listbox.insert(tk.END, cfg['name'] or cfg['url'])
+        store.import_queue()
+        for drama in store.dramas(source=jobstore.GUI_QUEUE):
+            drama_queue.append(drama)
+            queue_listbox.insert(tk.END, drama['name'] or drama['url'])
+            if drama['status'] == jobstore.DONE:
+                queue_listbox.itemconfig(tk.END, fg='green')
     except Exception as e:
-        logging.warning("Failed to load drama queue from file: %s", e)
-    def save_queue():
-        os.makedirs(os.path.dirname(queue_file), exist_ok=True)
-        with open(queue_file, 'w') as f:
-            json.dump(drama_queue, f)
-    def add_to_queue():
-        cfg = {
+        logging.warning("Failed to load drama queue: %s", e)
+    def current_config():
+        return {
             'url': url_var.get().strip(),
             'name': name_var.get().strip(),
             'output': output_var.get().strip(),
@@ -160,21 +194,25 @@ def main():
             'episode_list': episodes_var.get().strip(),
             'workers': workers_var.get(),
             'throttle': throttle_var.get(),
-            'retries': retries_var.get()
+            'retries': retries_var.get(),
+            'engine': engine_var.get(),
+            'quality': quality_var.get(),
+            'adaptive': bool(adaptive_var.get())
         }
-        drama_queue.append(cfg)
+    def add_to_queue():
+        cfg = current_config()
+        drama_id = store.add_drama(cfg['url'], cfg['name'], cfg['output'], jobstore.drama_config(jobstore.GUI_QUEUE, **cfg))
+        drama_queue.append(store.drama(drama_id))
         label = cfg['name'] or cfg['url']
         queue_listbox.insert(tk.END, label)
-        save_queue()
         update_controls()
     def remove_from_queue():
         sel = queue_listbox.curselection()
         if not sel: 
             return
         i = sel[0]
-        del drama_queue[i]
+        store.remove_drama(drama_queue.pop(i)['id'])
         queue_listbox.delete(i)
-        save_queue()
         update_controls()
     def move_queue(offset):
         sel = queue_listbox.curselection()
@@ -184,19 +222,19 @@ def main():
         j = i+offset
         if 0<=j<queue_listbox.size():
             item = queue_listbox.get(i)
-            cfg = drama_queue.pop(i)
+            drama = drama_queue.pop(i)
             queue_listbox.delete(i)
-            drama_queue.insert(j, cfg)
+            drama_queue.insert(j, drama)
             queue_listbox.insert(j, item)
             queue_listbox.selection_set(j)
-        save_queue()
+            store.move_drama(drama['id'], offset)
         update_controls()
     # Double-click to load selected drama's settings
     def on_queue_double(event):
         sel = queue_listbox.curselection()
         if not sel:
             return
-        cfg = drama_queue[sel[0]]
+        cfg = drama_queue[sel[0]]['config']
         url_var.set(cfg['url'])
         name_var.set(cfg['name'])
         output_var.set(cfg['output'])
@@ -205,6 +243,9 @@ def main():
         workers_var.set(cfg['workers'])
         throttle_var.set(cfg['throttle'])
         retries_var.set(cfg['retries'])
+        engine_var.set(cfg['engine'])
+        quality_var.set(cfg['quality'])
+        adaptive_var.set(cfg['adaptive'])
     queue_listbox.config(selectmode='extended')
     queue_listbox.bind('<Double-Button-1>', on_queue_double)
     # Add start controls
@@ -213,20 +254,10 @@ def main():
     def start_selected():
         # Download selected dramas one by one using the UI progress popup
         for idx in list(queue_listbox.curselection()):
-            cfg = drama_queue[idx]
             # mark as in progress
             queue_listbox.itemconfig(idx, fg='orange')
-            # load settings into UI variables
-            url_var.set(cfg['url'])
-            name_var.set(cfg['name'])
-            output_var.set(cfg['output'])
-            all_var.set(cfg['download_all'])
-            episodes_var.set(cfg['episode_list'])
-            workers_var.set(cfg['workers'])
-            throttle_var.set(cfg['throttle'])
-            retries_var.set(cfg['retries'])
             # run download with GUI progress, passing index for post-completion coloring
-            download_series(idx)
+            download_series(drama_queue[idx]['config'], idx)
     def start_all():
         queue_listbox.select_set(0, tk.END)
         start_selected()
@@ -240,8 +271,14 @@ def main():
     # Allow clearing selection so colors remain visible
     ttk.Button(btn_qf, text="Clear Selection", command=lambda: queue_listbox.selection_clear(0, tk.END)).pack(side="left", padx=2)
 
-    def download_series(target_index=None):
-        # Threaded download with responsive UI
+    def download_series(cfg, target_index=None):
+        # Threaded download with responsive UI; ``cfg`` holds this drama's own settings
+        drama_id = drama_queue[target_index]['id'] if target_index is not None else None
+        # Earlier queue entries go first under the priority policy
+        priority = -target_index if target_index is not None else 0
+        sched = get_scheduler()
+        cancel_flag = {'canceled': False}
+        group = {'id': None, 'transfer': None}
         progress_win = tk.Toplevel(root)
         progress_win.title("Downloading...")
         progress_win.resizable(False, False)
@@ -253,7 +290,6 @@ def main():
         stat.pack(padx=10, pady=(0,10))
         progress_win.transient(root)
         progress_win.grab_set()
-        pool_holder = {'pool': None}
         cancel_btn_popup = ttk.Button(progress_win, text="Cancel")
         cancel_btn_popup.pack(pady=(0,10))
         def on_popup_cancel():
@@ -264,14 +300,11 @@ def main():
                 prog.stop()
             except Exception as e:
                 logging.warning("Cancellation failed: %s", e)
-            for proc in FFMPEG_PROCS[:]:
-                try:
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-                except Exception as e:
-                    logging.warning("Cancellation failed: %s", e)
-            FFMPEG_PROCS.clear()
-            if pool_holder['pool']:
-                pool_holder['pool'].terminate()
+            if group['id'] is not None:
+                # Other dramas share the scheduler: stop only this drama's transfers,
+                # native segment engines included, before its folder is removed
+                sched.cancel(group['id'])
+                group['transfer'].cancel()
         cancel_btn_popup.config(command=on_popup_cancel)
         # Disable main controls
         start_btn.config(state="disabled")
@@ -284,15 +317,16 @@ def main():
         menubar.entryconfig("Help", state="disabled")
         # Background worker thread
         def worker():
-            # Gather parameters
-            url = url_var.get().strip()
-            name_input = name_var.get().strip()
-            base_output = output_var.get().strip() or "downloads"
-            download_all = bool(all_var.get())
-            episode_list = episodes_var.get().strip()
-            worker_count = workers_var.get()
-            throttle_kbps = throttle_var.get() * 1000
-            retries = retries_var.get()
+            # This drama's parameters; workers, browsers and bandwidth come from the shared scheduler
+            url = cfg['url']
+            name_input = cfg['name']
+            base_output = cfg['output'] or "downloads"
+            download_all = cfg['download_all']
+            episode_list = cfg['episode_list']
+            throttle_kbps = sched.throttle_kbps
+            retries = cfg['retries']
+            options = {'engine': cfg.get('engine', 'ffmpeg'), 'quality': cfg.get('quality', 'best'),
+                       'adaptive': cfg.get('adaptive', False)}
             drama_name = name_input.replace(" ", "_") if name_input else re.sub(r'[^0-9a-zA-Z]+','_',url.rstrip("/").split("/")[-1])
             drama_dir = os.path.join(base_output, drama_name)
             os.makedirs(drama_dir, exist_ok=True)
@@ -315,17 +349,39 @@ def main():
                 episodes = eps if download_all else [(n,u) for n,u in eps if n in expand_ranges(episode_list)]
             episodes.sort(key=lambda x: x[0])
             total = len(episodes)
+            # Record the series, its episodes and each attempt in the job store
+            record_id = drama_id if drama_id is not None else store.open_drama(
+                url, base_output, name_input, jobstore.drama_config(jobstore.GUI, **cfg))
+            store.recover(record_id)
+            store.update_drama(record_id, status=jobstore.RUNNING, started=time.time(), finished=None)
+            store.add_episodes(record_id, episodes)
+            # Episodes finished in earlier runs count as done without touching the network
+            episodes = CompletionIndex(drama_dir).pending(episodes)
+            already_done = total - len(episodes)
             # Switch to determinate
             progress_win.after(0, prog.stop)
-            progress_win.after(0, lambda: prog.config(mode="determinate", maximum=total, value=0))
-            progress_win.after(0, lambda: stat.config(text=f"Downloading 0/{total} episodes"))
-            # Start download pool
-            pool = ThreadPool(worker_count)
-            pool_holder['pool'] = pool
-            completed = successes = failures = 0
-            for result in pool.imap_unordered(download_episode, [(drama_name, num, u, drama_dir, throttle_kbps, retries) for num,u in episodes]):
+            progress_win.after(0, lambda: prog.config(mode="determinate", maximum=total, value=already_done))
+            progress_win.after(0, lambda: stat.config(text=f"Downloading {already_done}/{total} episodes"))
+            completed = successes = already_done
+            failures = 0
+            # ffmpeg progress moves the bar within episodes; finished episodes count through ``completed``
+            tracker = progress.ProgressTracker()
+            def on_progress(event):
+                if tracker.update(event):
+                    progress_win.after(0, lambda: prog.config(value=completed + tracker.partial))
+            pool_args = [(drama_name, num, u, drama_dir, throttle_kbps, retries, options) for num,u in episodes]
+            transfer = OwnedTransfer(RecordAttempts(transfer_episode, store.path, record_id), record_id)
+            stages = Stages(RecordAttempts(resolve_episode_job, store.path, record_id), transfer,
+                            RecordAttempts(refresh_episode_job, store.path, record_id))
+            group['transfer'] = transfer
+            group['id'] = record_id
+            # Stalled transfers are killed and retried after the rest of the batch
+            results = with_requeue(
+                lambda args: sched.imap(args, stages, record_id, priority=priority, on_progress=on_progress), pool_args)
+            for result in results:
                 if cancel_flag['canceled']:
-                    pool.terminate()
+                    sched.cancel(record_id)
+                    store.update_drama(record_id, status=jobstore.CANCELLED, finished=time.time())
                     try:
                         shutil.rmtree(drama_dir, ignore_errors=True)
                     except Exception as e:
@@ -337,16 +393,18 @@ def main():
                         progress_win.after(0, lambda c=child: c.state(['!disabled']))
                     menubar.after(0, lambda: menubar.entryconfig("File", state="normal"))
                     menubar.after(0, lambda: menubar.entryconfig("Help", state="normal"))
-                    cancel_flag['canceled'] = False
                     return
                 completed += 1
                 if result:
                     successes += 1
                 else:
                     failures += 1
-                progress_win.after(0, lambda c=completed, t=total: (stat.config(text=f"Downloaded {c}/{t} episodes"), prog.config(value=c)))
-            pool.close()
-            pool.join()
+                speed = f", {tracker.describe()}" if tracker.partial else ""
+                progress_win.after(0, lambda c=completed, t=total, s=speed: (stat.config(text=f"Downloaded {c}/{t} episodes{s}"), prog.config(value=c + tracker.partial)))
+            store.update_drama(record_id, status=jobstore.FAILED if failures else jobstore.DONE, finished=time.time(),
+                               last_error=f"{failures} episodes failed" if failures else None)
+            # Dramas started together share one registry; each export covers this drama's episodes only
+            metrics.current().write_json(os.path.join(drama_dir, metrics.METRICS_FILE), series=drama_dir)
             # Finish
             progress_win.after(0, lambda: status_bar.config(text="Completed"))
             def on_finish():
@@ -354,37 +412,41 @@ def main():
                 msg = f"✅ Done! {successes} succeeded, {failures} failed. Files saved in:\n{drama_dir}"
                 messagebox.showinfo("Done", msg)
                 logging.info(f"Session complete: {successes} succeeded, {failures} failed.")
-                start_btn.config(state="normal")
-                for child in main_frame.winfo_children():
-                    try: 
-                        child.state(['!disabled'])
-                    except Exception as e:
-                        logging.warning("Failed to re-enable widget: %s", e)
-                menubar.entryconfig("File", state="normal")
-                menubar.entryconfig("Help", state="normal")
+                restore_controls()
                 # mark queue item green and clear selection
                 if target_index is not None:
                     queue_listbox.itemconfig(target_index, fg='green')
                     queue_listbox.selection_clear(target_index)
-                cancel_flag['canceled'] = False
             progress_win.after(0, on_finish)
-        Thread(target=worker, daemon=True).start()
+        def restore_controls():
+            start_btn.config(state="normal")
+            for child in main_frame.winfo_children():
+                try:
+                    child.state(['!disabled'])
+                except Exception as e:
+                    logging.warning("Failed to re-enable widget: %s", e)
+            menubar.entryconfig("File", state="normal")
+            menubar.entryconfig("Help", state="normal")
+        def guarded_worker():
+            # An error must not leave the popup holding the grab over a dead download
+            try:
+                worker()
+            except Exception as e:
+                logging.error(f"Download of {cfg.get('url')} failed: {e}")
+                def on_error(error=str(e)):
+                    progress_win.destroy()
+                    messagebox.showerror("Download failed", error)
+                    status_bar.config(text="Failed")
+                    restore_controls()
+                progress_win.after(0, on_error)
+        Thread(target=guarded_worker, daemon=True).start()
 
     def on_start():
-        # Start concurrent downloads for all queued dramas
-        for idx, cfg in enumerate(drama_queue):
-            def start_cfg(i, c):
-                # apply to hidden vars then launch
-                url_var.set(c['url'])
-                name_var.set(c['name'])
-                output_var.set(c['output'])
-                all_var.set(c['download_all'])
-                episodes_var.set(c['episode_list'])
-                workers_var.set(c['workers'])
-                throttle_var.set(c['throttle'])
-                retries_var.set(c['retries'])
-                download_series(i)
-            Thread(target=lambda i=idx, c=cfg: start_cfg(i, c), daemon=True).start()
+        # Start every queued drama (or the form's drama when the queue is empty); they share one scheduler
+        if not drama_queue:
+            download_series(current_config())
+        for idx, drama in enumerate(drama_queue):
+            download_series(drama['config'], idx)
 
     start_btn.config(command=on_start)
 
@@ -407,14 +469,23 @@ def main():
         else:
             start_btn.config(state='disabled')
 
+    def update_throttle(*args):
+        # Retune running downloads; the slider stays live while they run
+        try:
+            ratelimit.set_rate(throttle_var.get() * 1000)
+        except tk.TclError:
+            pass
+
     # Bind variable changes
     url_var.trace('w', update_controls)
     episodes_var.trace('w', update_controls)
     all_var.trace('w', update_controls)
+    throttle_var.trace('w', update_throttle)
     # Initialize control states
     update_controls()
 
     root.mainloop()
+    browser_pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+"""
+Native HLS segment engine for NovaStream.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from src import ratelimit, retry, transport
+from src.concurrency import was_throttled
+from src.playlist import is_master_playlist, parse_media_playlist
+from src.utils import write_json_atomic
+
+# Segments fetched ahead of the writer, per worker
+PREFETCH_FACTOR = 2
+
+# Read size used when re-hashing a resumed staging file
+HASH_CHUNK = 1024 * 1024
+
+# Outcome of a native transfer; ``sha256`` hashes the fetched stream as written
+# to staging (not the remuxed file the downloader saves),
+# ``retries`` and ``retry_wait`` report segment-level retries and their backoff
+StreamResult = namedtuple("StreamResult", ["bytes", "segments", "duration", "sha256", "retries", "retry_wait"],
+                          defaults=(0, 0.0))
+
+
+class HLSError(Exception):
+    """Raised when a playlist cannot be handled by the native engine."""
+
+
+class ManifestExpired(HLSError):
+    """Raised when the CDN rejects the stream's tokens; resolve the manifest again."""
+
+
+class TransferCancelled(Exception):
+    """Raised when the caller cancels a transfer; unlike HLSError, there is nothing to fall back to."""
+
+
+def reraise_expired(exc, playlist_url):
+    """Turn an auth-style rejection into ManifestExpired; return otherwise."""
+    if retry.classify(exc) == retry.RERESOLVE:
+        raise ManifestExpired(f"{playlist_url}: {exc}") from exc
+
+
+def _range_header(byterange):
+    length, offset = byterange
+    return {"Range": f"bytes={offset}-{offset + length - 1}"}
+
+
+def _read_body(session, uri, headers, timeout, limiter):
+    if limiter is None:
+        resp = session.get(uri, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp, resp.content
+    # Stream the body so the limiter paces the socket reads themselves
+    resp = session.get(uri, headers=headers, timeout=timeout, stream=True)
+    try:
+        resp.raise_for_status()
+        chunks = []
+        for chunk in resp.iter_content(chunk_size=ratelimit.CHUNK_SIZE):
+            limiter.consume(len(chunk))
+            chunks.append(chunk)
+    finally:
+        resp.close()
+    return resp, b"".join(chunks)
+
+
+def _fetch(session, uri, byterange=None, timeout=20, limiter=None, controller=None):
+    headers = _range_header(byterange) if byterange else None
+    try:
+        resp, data = _read_body(session, uri, headers, timeout, limiter)
+    except Exception as e:
+        if controller:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            controller.record(error=True, throttled=status == 429)
+        raise
+    if controller:
+        controller.record(len(data), throttled=was_throttled(resp))
+    return data
+
+
+def crypto_available():
+    """True if cryptography, which AES-128 segments need, is installed."""
+    try:
+        # Dynamic import: cryptography is optional (the "aes" extra)
+        import cryptography  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _decrypt(data, key, iv):
+    """Decrypt an AES-128 segment and strip its PKCS#7 padding."""
+    # Dynamic import: cryptography is only needed for encrypted streams
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    plain = decryptor.update(data) + decryptor.finalize()
+    return plain[:-plain[-1]] if plain else plain
+
+
+def decrypt_segment(segment, data, keys):
+    """Decrypt ``data`` if ``segment`` is encrypted; ``keys`` maps key URIs to key bytes."""
+    if not segment.key:
+        return data
+    iv = segment.key.iv or segment.sequence.to_bytes(16, "big")
+    return _decrypt(data, keys[segment.key.uri], iv)
+
+
+def _fetch_segment(session, segment, keys, limiter=None, controller=None, policy=retry.DEFAULT_POLICY, stats=None):
+    # Retry just this segment (or byte range) on transient errors
+    data = retry.call(lambda: _fetch(session, segment.uri, segment.byterange, limiter=limiter, controller=controller),
+                      policy, stats, label=f"segment {segment.index}")
+    return decrypt_segment(segment, data, keys)
+
+
+def fetch_playlist(session, playlist_url):
+    """Fetch and parse a media playlist, rejecting master playlists."""
+    resp = session.get(playlist_url, timeout=10)
+    resp.raise_for_status()
+    return load_playlist(resp.text, playlist_url, resp.url)
+
+
+def load_playlist(text, playlist_url, final_url=None):
+    """Parse a fetched media playlist, rejecting what the engine cannot handle."""
+    if is_master_playlist(text):
+        raise HLSError(f"{playlist_url} is a master playlist")
+    try:
+        playlist = parse_media_playlist(text, final_url or playlist_url)
+    except ValueError as e:
+        raise HLSError(f"{playlist_url}: {e}") from e
+    if not playlist.segments:
+        raise HLSError(f"{playlist_url} has no segments")
+    for seg in playlist.segments:
+        if seg.key and seg.key.method != "AES-128":
+            raise HLSError(f"Unsupported encryption method {seg.key.method}")
+    if any(seg.key for seg in playlist.segments) and not crypto_available():
+        raise HLSError(f"{playlist_url} is AES-128 encrypted; install the aes extra (cryptography)")
+    return playlist
+
+
+def _playlist_id(segments):
+    # Signed query strings change between resolutions; paths do not
+    return [len(segments), urlsplit(segments[0].uri).path, urlsplit(segments[-1].uri).path]
+
+
+def _load_journal(journal, dest, segments):
+    """Return the usable journal state for ``dest``, or None to start over."""
+    try:
+        with open(journal, "r") as f:
+            state = json.load(f)
+        if state["playlist"] != _playlist_id(segments) or not 0 < state["done"] <= len(segments):
+            return None
+        if os.path.getsize(dest) < state["offset"]:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return state
+
+
+def _hash_prefix(path, length):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+
+class StageWriter:
+    """
+    Writes fetched segments to a staging file strictly in playlist order,
+    hashing as it goes and, with a ``journal`` path, recording the segments
+    safely written so an interrupted transfer resumes where it stopped.
+    ``start`` is the index of the first segment still to fetch.
+    """
+
+    def __init__(self, dest, segments, journal=None):
+        self.segments = segments
+        self.journal = journal
+        state = _load_journal(journal, dest, segments) if journal else None
+        if state:
+            # Drop any bytes written after the last journaled segment
+            os.truncate(dest, state["offset"])
+            self.digest = _hash_prefix(dest, state["offset"])
+            self.written = state["offset"]
+            self.start = state["done"]
+            self.current_init = segments[self.start - 1].init
+            logging.info(f"Native engine: resuming {dest} at segment {self.start}/{len(segments)}")
+        else:
+            self.digest = hashlib.sha256()
+            self.written = 0
+            self.start = 0
+            self.current_init = None
+        self.out = open(dest, "ab" if state else "wb")
+
+    def needs_init(self, seg):
+        """True if ``seg`` switches to an init section not yet written."""
+        return bool(seg.init) and seg.init != self.current_init
+
+    def _append(self, data):
+        self.out.write(data)
+        self.digest.update(data)
+        self.written += len(data)
+
+    def write(self, seg, data, init_data=None):
+        """Append ``seg`` (preceded by its init section, if it changed)."""
+        if init_data is not None:
+            self._append(init_data)
+            self.current_init = seg.init
+        self._append(data)
+        if self.journal:
+            self.out.flush()
+            write_json_atomic(self.journal, {"playlist": _playlist_id(self.segments), "done": seg.index + 1,
+                                             "offset": self.written})
+
+    def close(self):
+        self.out.close()
+
+    def finish(self, stats=None):
+        """Close the stage, drop the journal and return the StreamResult."""
+        self.close()
+        if self.journal and os.path.exists(self.journal):
+            os.remove(self.journal)
+        duration = sum(seg.duration for seg in self.segments)
+        return StreamResult(self.written, len(self.segments), duration, self.digest.hexdigest(),
+                            stats.retries if stats else 0, stats.waited if stats else 0.0)
+
+
+def download_stream(playlist_url, dest, concurrency=8, session=None, journal=None, limiter=None, controller=None,
+                    policy=retry.DEFAULT_POLICY, cancelled=None):
+    """
+    Download every segment of a media playlist into ``dest``.
+    Segments are fetched concurrently over one shared session and written
+    strictly in playlist order. The content hash is computed as the bytes
+    are written. Returns a StreamResult.
+    With a ``journal`` path, the count of segments safely written and the
+    byte offset they end at are recorded after each segment, so an
+    interrupted transfer resumes from the next segment instead of from
+    scratch. The journal is removed once the stream is complete.
+    Segment bodies are paced by ``limiter`` (default: the process-wide
+    bandwidth limiter, if one is configured).
+    With an AIMD ``controller`` the number of segments in flight follows
+    its level (up to ``controller.maximum``) instead of ``concurrency``.
+    Each segment is retried on its own under ``policy``; a 401/403/410 from
+    the CDN raises ManifestExpired so the caller can resolve a fresh manifest.
+    ``cancelled`` is polled between segments; once it returns True the
+    transfer stops with TransferCancelled, keeping the journal.
+    """
+    try:
+        return _download_stream(playlist_url, dest, concurrency, session, journal, limiter, controller, policy,
+                                cancelled)
+    except (ManifestExpired, TransferCancelled):
+        raise
+    except Exception as e:
+        reraise_expired(e, playlist_url)
+        raise
+
+
+def _download_stream(playlist_url, dest, concurrency, session, journal, limiter, controller, policy, cancelled):
+    # No hidden urllib3 retries: retry.call does them, so they show up in the stats
+    session = session or transport.get_session(retries=0)
+    limiter = limiter or ratelimit.current()
+    stats = retry.RetryStats()
+    playlist = retry.call(lambda: fetch_playlist(session, playlist_url), policy, stats, label=playlist_url)
+    segments = playlist.segments
+    keys = {}
+    for seg in segments:
+        if seg.key and seg.key.uri not in keys:
+            keys[seg.key.uri] = retry.call(lambda: _fetch(session, seg.key.uri), policy, stats, label=seg.key.uri)
+    if controller:
+        concurrency = controller.maximum
+    logging.info(f"Native engine: {len(segments)} segments from {playlist_url} "
+                 f"({'up to ' if controller else ''}{concurrency} workers)")
+
+    def window():
+        # Bound the read-ahead window so memory stays flat on long episodes
+        return controller.update() if controller else concurrency * PREFETCH_FACTOR
+
+    writer = StageWriter(dest, segments, journal)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            _write_all(pool, writer, session, keys, limiter, controller, window, policy, stats, cancelled)
+    except BaseException:
+        writer.close()
+        raise
+    return writer.finish(stats)
+
+
+def _write_all(pool, writer, session, keys, limiter, controller, window, policy, stats, cancelled=None):
+    """Fetch the remaining segments through ``pool`` and hand them to ``writer`` in order."""
+    pending = deque()
+    queue = iter(writer.segments[writer.start:])
+
+    def refill():
+        while len(pending) < window():
+            seg = next(queue, None)
+            if seg is None:
+                break
+            pending.append((seg, pool.submit(_fetch_segment, session, seg, keys, limiter, controller, policy, stats)))
+
+    refill()
+    while pending:
+        if cancelled and cancelled():
+            for _, other in pending:
+                other.cancel()
+            raise TransferCancelled("transfer cancelled")
+        seg, future = pending.popleft()
+        try:
+            data = future.result()
+        except Exception:
+            for _, other in pending:
+                other.cancel()
+            raise
+        init_data = None
+        if writer.needs_init(seg):
+            init_data = retry.call(lambda: _fetch(session, seg.init.uri, seg.init.byterange, limiter=limiter),
+                                   policy, stats, label=seg.init.uri)
+        writer.write(seg, data, init_data)
+        refill()
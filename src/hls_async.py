@@ -0,0 +1,177 @@
+"""
+asyncio segment engine for NovaStream.
+"""
+import asyncio
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+
+from src import ratelimit, retry, transport
+from src.hls import (PREFETCH_FACTOR, HLSError, ManifestExpired, StageWriter, _range_header, decrypt_segment,
+                     TransferCancelled, load_playlist, reraise_expired)
+
+# Segment requests in flight per episode
+CONCURRENCY = 64
+# Segment requests in flight per host
+PER_HOST = 16
+# Total seconds allowed for any single request
+TIMEOUT = 20
+
+
+def available():
+    """True if aiohttp, which the async engine needs, is installed."""
+    try:
+        # Dynamic import: aiohttp is optional
+        import aiohttp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HostLimits:
+    """
+    Per-host request semaphores. Share one instance between episodes running
+    on the same event loop to cap their combined load on each CDN host.
+    """
+
+    def __init__(self, per_host=PER_HOST):
+        self.per_host = per_host
+        self._semaphores = {}
+
+    def __call__(self, uri):
+        host = urlsplit(uri).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.BoundedSemaphore(self.per_host)
+        return self._semaphores[host]
+
+
+def open_session(concurrency=CONCURRENCY, per_host=PER_HOST):
+    """Create an aiohttp session whose connection pool matches the limits."""
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+                                 headers={"User-Agent": transport.USER_AGENT})
+
+
+async def _fetch(session, uri, byterange=None, limiter=None):
+    headers = _range_header(byterange) if byterange else None
+    async with session.get(uri, headers=headers) as resp:
+        resp.raise_for_status()
+        if limiter is None:
+            return await resp.read()
+        chunks = []
+        async for chunk in resp.content.iter_chunked(ratelimit.CHUNK_SIZE):
+            wait = limiter.reserve(len(chunk))
+            if wait:
+                await asyncio.sleep(wait)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+async def _fetch_segment(session, segment, keys, episode, hosts, limiter, policy, stats):
+    async def attempt():
+        async with episode, hosts(segment.uri):
+            return await _fetch(session, segment.uri, segment.byterange, limiter)
+    # Retry just this segment; backoff happens outside the semaphores
+    data = await retry.call_async(attempt, policy, stats, label=f"segment {segment.index}")
+    return decrypt_segment(segment, data, keys)
+
+
+async def _fetch_playlist(session, playlist_url):
+    async with session.get(playlist_url) as resp:
+        resp.raise_for_status()
+        return load_playlist(await resp.text(), playlist_url, str(resp.url))
+
+
+async def _write_all(session, writer, keys, episode, hosts, limiter, window, policy, stats, cancelled=None):
+    pending = deque()
+    queue = iter(writer.segments[writer.start:])
+
+    def refill():
+        while len(pending) < window:
+            seg = next(queue, None)
+            if seg is None:
+                break
+            task = asyncio.ensure_future(_fetch_segment(session, seg, keys, episode, hosts, limiter, policy, stats))
+            pending.append((seg, task))
+
+    refill()
+    try:
+        while pending:
+            if cancelled and cancelled():
+                raise TransferCancelled("transfer cancelled")
+            seg, task = pending.popleft()
+            data = await task
+            init_data = None
+            if writer.needs_init(seg):
+                init_data = await retry.call_async(lambda: _fetch(session, seg.init.uri, seg.init.byterange, limiter),
+                                                   policy, stats, label=seg.init.uri)
+            writer.write(seg, data, init_data)
+            refill()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+
+async def download_stream_async(playlist_url, dest, concurrency=CONCURRENCY, session=None, journal=None,
+                                limiter=None, hosts=None, policy=retry.DEFAULT_POLICY, cancelled=None):
+    """
+    Coroutine counterpart of ``hls.download_stream``: all segment requests
+    of the episode share one event loop, bounded by an episode semaphore of
+    ``concurrency`` and the per-host semaphores in ``hosts``. Output,
+    journaling, per-segment retries, cancellation and the returned
+    StreamResult match the threaded engine.
+    """
+    own_session = session is None
+    if own_session:
+        session = open_session(concurrency, hosts.per_host if hosts else PER_HOST)
+    limiter = limiter or ratelimit.current()
+    hosts = hosts or HostLimits()
+    stats = retry.RetryStats()
+    try:
+        playlist = await retry.call_async(lambda: _fetch_playlist(session, playlist_url), policy, stats,
+                                          label=playlist_url)
+        segments = playlist.segments
+        keys = {}
+        for seg in segments:
+            if seg.key and seg.key.uri not in keys:
+                keys[seg.key.uri] = await retry.call_async(lambda: _fetch(session, seg.key.uri), policy, stats,
+                                                           label=seg.key.uri)
+        logging.info(f"Async engine: {len(segments)} segments from {playlist_url} "
+                     f"({concurrency} in flight, {hosts.per_host} per host)")
+        writer = StageWriter(dest, segments, journal)
+        episode = asyncio.BoundedSemaphore(concurrency)
+        try:
+            await _write_all(session, writer, keys, episode, hosts, limiter, concurrency * PREFETCH_FACTOR,
+                             policy, stats, cancelled)
+        except BaseException:
+            writer.close()
+            raise
+        return writer.finish(stats)
+    except (ManifestExpired, TransferCancelled):
+        raise
+    except Exception as e:
+        reraise_expired(e, playlist_url)
+        raise
+    finally:
+        if own_session:
+            await session.close()
+
+
+def download_stream(playlist_url, dest, concurrency=CONCURRENCY, journal=None, limiter=None, per_host=PER_HOST,
+                    cancelled=None):
+    """
+    Synchronous wrapper: run one transfer on a private event loop, so it
+    drops into ``download_episode`` in place of the threaded engine.
+    Network failures surface as HLSError.
+    """
+    if not available():
+        raise HLSError("the async engine needs aiohttp (pip install aiohttp)")
+    import aiohttp
+    try:
+        return asyncio.run(download_stream_async(playlist_url, dest, concurrency, journal=journal,
+                                                 limiter=limiter, hosts=HostLimits(per_host),
+                                                 cancelled=cancelled))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HLSError(f"{playlist_url}: {e}") from e
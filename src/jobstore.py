@@ -0,0 +1,329 @@
+"""
+Persistent job store for NovaStream.
+
+One SQLite database (WAL mode) records the drama queue, every episode of
+every drama and each attempt to download one. Updates touch single rows,
+so a crash loses at most the attempt in flight, and a restarted queue
+knows which episodes are already done without any network work.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Shared by the GUI queue, run_download and the daemon
+DEFAULT_PATH = os.path.join("data", "novastream.db")
+# Queue file used before the job store; imported once, then renamed
+LEGACY_QUEUE = os.path.join("data", "drama_queue.json")
+
+# Drama states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Episode and attempt states (plus RUNNING, DONE and FAILED)
+PENDING = "pending"
+STALLED = "stalled"
+INTERRUPTED = "interrupted"
+
+# Who recorded a drama; the GUI queue and the daemon each pick up only their own
+GUI_QUEUE = "gui_queue"
+GUI = "gui"
+CLI = "cli"
+BATCH = "batch"
+DAEMON = "daemon"
+
+# The drama config every writer stores; keys missing from a row, or of the wrong type, read as these
+CONFIG_DEFAULTS = {"source": "", "download_all": True, "episode_list": "", "engine": "ffmpeg", "quality": "best",
+                   "workers": 4, "throttle": 0, "retries": 0, "adaptive": False}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dramas (
+    -- Never reuse the id of a removed drama: it names jobs in the daemon API
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    output TEXT NOT NULL DEFAULT '',
+    config TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    drama_id INTEGER NOT NULL REFERENCES dramas(id) ON DELETE CASCADE,
+    num INTEGER NOT NULL,
+    url TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    bytes INTEGER NOT NULL DEFAULT 0,
+    path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    last_error TEXT,
+    PRIMARY KEY (drama_id, num)
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    drama_id INTEGER NOT NULL,
+    num INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    bytes INTEGER NOT NULL DEFAULT 0,
+    started REAL NOT NULL,
+    finished REAL,
+    error TEXT,
+    FOREIGN KEY (drama_id, num) REFERENCES episodes(drama_id, num) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS attempts_open ON attempts(drama_id, num) WHERE finished IS NULL;
+"""
+
+# Drama columns callers may change through update_drama
+_DRAMA_FIELDS = ("url", "name", "output", "config", "status", "started", "finished", "last_error")
+
+# One connection per process and path, for worker processes
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class JobStore:
+    """
+    Dramas, episodes and attempts as rows of a SQLite database. One
+    instance may be shared by threads; other processes open their own
+    (see ``open_store``) and WAL lets them write alongside each other.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable against crashes; only power loss can drop the last commits
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._tx() as db:
+            db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _tx(self):
+        """Run the block as one transaction on the shared connection."""
+        with self._lock, self._conn:
+            yield self._conn
+
+    # Dramas
+
+    def add_drama(self, url, name="", output="", config=None, status=QUEUED):
+        """Append a drama to the queue; returns its id."""
+        with self._tx() as db:
+            position = db.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM dramas").fetchone()[0]
+            cur = db.execute(
+                "INSERT INTO dramas (position, url, name, output, config, status, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (position, url, name or "", output or "", json.dumps(config or {}), status, time.time()))
+            return cur.lastrowid
+
+    def remove_drama(self, drama_id):
+        # Episodes and their attempts cascade
+        with self._tx() as db:
+            db.execute("DELETE FROM dramas WHERE id = ?", (drama_id,))
+
+    def move_drama(self, drama_id, offset):
+        """Move a drama ``offset`` places up (negative) or down the queue."""
+        with self._tx() as db:
+            ids = [row[0] for row in db.execute("SELECT id FROM dramas ORDER BY position, id")]
+            if drama_id not in ids:
+                return
+            i = ids.index(drama_id)
+            j = min(max(i + offset, 0), len(ids) - 1)
+            ids.insert(j, ids.pop(i))
+            db.executemany("UPDATE dramas SET position = ? WHERE id = ?", [(p, d) for p, d in enumerate(ids, 1)])
+
+    def update_drama(self, drama_id, **fields):
+        unknown = set(fields) - set(_DRAMA_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown drama fields: {sorted(unknown)}")
+        if "config" in fields:
+            fields["config"] = json.dumps(fields["config"])
+        if not fields:
+            return
+        with self._tx() as db:
+            db.execute(f"UPDATE dramas SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",  # nosec B608
+                       (*fields.values(), drama_id))
+
+    def drama(self, drama_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM dramas WHERE id = ?", (drama_id,)).fetchone()
+        return _drama(row) if row else None
+
+    def dramas(self, status=None, source=None):
+        """
+        Queued dramas in queue order, optionally only those in ``status``
+        or recorded by ``source``.
+        """
+        query, params = "SELECT * FROM dramas", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY position, id", params).fetchall()
+        dramas = [_drama(row) for row in rows]
+        return [d for d in dramas if d["config"]["source"] == source] if source else dramas
+
+    def find_drama(self, url, output):
+        """Most recent drama downloading ``url`` into ``output``, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM dramas WHERE url = ? AND output = ? ORDER BY id DESC LIMIT 1",
+                                     (url, output)).fetchone()
+        return _drama(row) if row else None
+
+    def open_drama(self, url, output, name="", config=None):
+        """Id of the drama downloading ``url`` into ``output``, added to the queue if new."""
+        drama = self.find_drama(url, output)
+        return drama["id"] if drama else self.add_drama(url, name, output, config)
+
+    # Episodes
+
+    def add_episodes(self, drama_id, episodes):
+        """Record (num, url) pairs for a drama; known episodes keep their state."""
+        with self._tx() as db:
+            db.executemany("INSERT INTO episodes (drama_id, num, url) VALUES (?, ?, ?) "
+                           "ON CONFLICT (drama_id, num) DO UPDATE SET url = excluded.url",
+                           [(drama_id, n, u) for n, u in episodes])
+
+    def episodes(self, drama_id):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM episodes WHERE drama_id = ? ORDER BY num",
+                                      (drama_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, drama_id):
+        """Episode counts by status, e.g. {'done': 8, 'failed': 1}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM episodes WHERE drama_id = ? GROUP BY status",
+                                      (drama_id,)).fetchall()
+        return {status: count for status, count in rows}
+
+    # Attempts
+
+    def begin_attempt(self, drama_id, num):
+        """
+        Mark episode ``num`` as running and open an attempt for it;
+        returns the attempt id. An attempt already open for the episode
+        (its resolve stage began it) is continued instead.
+        """
+        now = time.time()
+        with self._tx() as db:
+            row = db.execute("SELECT id FROM attempts WHERE drama_id = ? AND num = ? AND finished IS NULL",
+                             (drama_id, num)).fetchone()
+            if row:
+                return row[0]
+            db.execute("INSERT OR IGNORE INTO episodes (drama_id, num) VALUES (?, ?)", (drama_id, num))
+            db.execute("UPDATE episodes SET status = ?, attempts = attempts + 1, started = COALESCE(started, ?) "
+                       "WHERE drama_id = ? AND num = ?", (RUNNING, now, drama_id, num))
+            return db.execute("INSERT INTO attempts (drama_id, num, started) VALUES (?, ?, ?)",
+                              (drama_id, num, now)).lastrowid
+
+    def finish_attempt(self, drama_id, num, status, nbytes=0, path=None, error=None):
+        """Close the episode's open attempt as ``status`` (done, failed or stalled)."""
+        now = time.time()
+        with self._tx() as db:
+            db.execute("UPDATE attempts SET status = ?, bytes = ?, finished = ?, error = ? "
+                       "WHERE drama_id = ? AND num = ? AND finished IS NULL",
+                       (status, nbytes, now, error, drama_id, num))
+            # A stalled episode goes back in line
+            db.execute("UPDATE episodes SET status = ?, bytes = MAX(bytes, ?), path = COALESCE(?, path), "
+                       "finished = ?, last_error = COALESCE(?, last_error) WHERE drama_id = ? AND num = ?",
+                       (PENDING if status == STALLED else status, nbytes, path, now if status == DONE else None,
+                        error, drama_id, num))
+
+    def attempts(self, drama_id, num):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM attempts WHERE drama_id = ? AND num = ? ORDER BY id",
+                                      (drama_id, num)).fetchall()
+        return [dict(row) for row in rows]
+
+    # Recovery
+
+    def recover(self, drama_id=None):
+        """
+        Settle what a crash left behind: open attempts become interrupted,
+        their episodes pending again and running dramas queued. Pass
+        ``drama_id`` to limit this to one drama another process is not
+        working on. Returns the number of interrupted attempts.
+        """
+        now = time.time()
+        scope, params = ("", ()) if drama_id is None else (" AND drama_id = ?", (drama_id,))
+        with self._tx() as db:
+            count = db.execute(f"UPDATE attempts SET status = ?, finished = ? WHERE finished IS NULL{scope}",  # nosec B608
+                               (INTERRUPTED, now, *params)).rowcount
+            db.execute(f"UPDATE episodes SET status = ? WHERE status = ?{scope}",  # nosec B608
+                       (PENDING, RUNNING, *params))
+            drama_scope = "" if drama_id is None else " AND id = ?"
+            db.execute(f"UPDATE dramas SET status = ? WHERE status = ?{drama_scope}",  # nosec B608
+                       (QUEUED, RUNNING, *params))
+        if count:
+            logging.info(f"Job store: {count} interrupted attempts reset")
+        return count
+
+    def import_queue(self, path=LEGACY_QUEUE):
+        """
+        Import a drama_queue.json written by older versions, then rename it
+        so it is imported only once. Returns the number of dramas added.
+        """
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        for cfg in saved:
+            self.add_drama(cfg.get("url", ""), cfg.get("name", ""), cfg.get("output", ""),
+                           drama_config(GUI_QUEUE, **cfg))
+        os.replace(path, path + ".imported")
+        logging.info(f"Imported {len(saved)} queued dramas from {path}")
+        return len(saved)
+
+
+def drama_config(source, **settings):
+    """The config to store for a drama recorded by ``source``; unknown ``settings`` are dropped."""
+    return {**CONFIG_DEFAULTS, **{k: v for k, v in settings.items() if k in CONFIG_DEFAULTS}, "source": source}
+
+
+def _config(drama, stored):
+    if "source" not in stored:
+        # Rows written before sources were recorded: the daemon's used "episodes", the GUI queue's "workers"
+        if "episodes" in stored:
+            stored = {**stored, "source": DAEMON, "episode_list": stored["episodes"],
+                      "download_all": not stored["episodes"]}
+        elif "workers" in stored:
+            stored = {**stored, "source": GUI_QUEUE}
+    config = {key: stored[key] if type(stored.get(key)) is type(default) else default
+              for key, default in CONFIG_DEFAULTS.items()}
+    config.update(url=drama["url"], name=drama["name"], output=drama["output"])
+    return config
+
+
+def _drama(row):
+    drama = dict(row)
+    drama["config"] = _config(drama, json.loads(drama["config"] or "{}"))
+    return drama
+
+
+def open_store(path=DEFAULT_PATH):
+    """Return this process's JobStore for ``path``, opening it on first use."""
+    key = (os.getpid(), os.path.abspath(path))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = JobStore(path)
+        return store
@@ -2,15 +2,102 @@
 Manifest URL retriever for NovaStream.
 """
 
+import html as html_lib
+import logging
+import re
 import time
+from urllib.parse import urljoin
+
+import requests
+
+from src import browser_pool, metrics, transport
+from src.playlist import (
+    is_master_playlist,
+    parse_master_playlist,
+    parse_media_playlist,
+    select_variant,
+)
+
 # Selenium-wire imports moved into function scope for optional packaging
 
+# Seconds between scans of the captured request log
+POLL_INTERVAL = 0.25
+# Embedded player iframes followed by the static resolver
+MAX_IFRAMES = 3
+
+# Quoted playlist references (attributes, inline JSON) and bare absolute URLs
+_QUOTED_M3U8_RE = re.compile(r"""["']([^"'\s<>]+?\.m3u8(?:\?[^"'\s<>]*)?)["']""", re.IGNORECASE)
+_BARE_M3U8_RE = re.compile(r"""(?:https?:)?//[^\s"'<>()]+?\.m3u8(?:\?[^\s"'<>()]*)?""", re.IGNORECASE)
+_IFRAME_RE = re.compile(r"""<iframe\b[^>]*?\bsrc\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def extract_manifest_urls(html, base_url):
+    """Return the .m3u8 URLs referenced directly in HTML or inline player JSON."""
+    # Undo JSON escaping so "https:\/\/cdn\/a.m3u8" matches like a plain URL
+    text = html.replace("\\/", "/").replace("\\u0026", "&")
+    found = set(_QUOTED_M3U8_RE.findall(text)) | set(_BARE_M3U8_RE.findall(text))
+    return {urljoin(base_url, html_lib.unescape(u)) for u in found}
+
+
+def _fetch_html(url, referer=None):
+    headers = {"Referer": referer} if referer else None
+    try:
+        resp = transport.get_session().get(url, headers=headers, timeout=10)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch {url}: {e}")
+        return None
+    return resp.text
+
 
-def get_manifest_urls(url, wait=10):
+def static_manifests(url, html=None):
+    """
+    Try the browserless tiers: the page HTML itself, then embedded player
+    iframes one level down. Returns (manifests, tier) with tier 'html' or
+    'iframe', or (set(), None) when neither finds a playlist. ``html`` may
+    carry an already-fetched page body ('' if the fetch failed).
+    """
+    if html is None:
+        html = _fetch_html(url) or ""
+    manifests = extract_manifest_urls(html, url)
+    if manifests:
+        return manifests, "html"
+    for src in _IFRAME_RE.findall(html)[:MAX_IFRAMES]:
+        frame_url = urljoin(url, html_lib.unescape(src))
+        frame_html = _fetch_html(frame_url, referer=url)
+        if frame_html:
+            manifests = extract_manifest_urls(frame_html, frame_url)
+            if manifests:
+                return manifests, "iframe"
+    return set(), None
+
+
+def resolve_manifests(url, html=None, browser=None, **capture):
+    """
+    Tiered manifest discovery: static HTML, then player iframes, then the
+    selenium-wire capture (``browser``, default ``get_manifest_urls``, called
+    with ``capture`` keyword arguments). Returns (manifests, tier).
+    """
+    manifests, tier = static_manifests(url, html)
+    if manifests:
+        return manifests, tier
+    browser = browser or get_manifest_urls
+    return browser(url, **capture), "browser"
+
+
+def get_manifest_urls(url, wait=10, pool=None, settle=1.0, page=None):
     """
     Return a set of m3u8 manifest URLs found on the page.
-    Uses selenium-wire to capture network requests from a headless Chrome instance.
+    Uses selenium-wire to capture network requests from a headless Chrome instance,
+    leased from ``pool`` (or the process-wide browser pool) when one is active.
+    Returns as soon as a playlist is seen, after waiting up to ``settle``
+    more seconds for sibling variants; ``wait`` is the overall deadline.
+    A ``page`` dict receives the loaded document's "title".
     """
+    pool = pool or browser_pool.current()
+    if pool is not None:
+        with pool.lease() as driver:
+            return _capture_manifests(driver, url, wait, settle, page)
     # Dynamic imports to avoid bundling selenium-wire by default
     from seleniumwire import webdriver
     from selenium.webdriver.chrome.options import Options
@@ -19,18 +106,15 @@ def get_manifest_urls(url, wait=10):
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--autoplay-policy=no-user-gesture-required")
 
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-
-    # Try to auto-play video so the manifest is requested
+    with metrics.timer("browser"):
+        driver = webdriver.Chrome(options=chrome_options)
     try:
-        driver.execute_script("const v = document.querySelector('video'); if(v) v.play();")
-    except Exception as e:
-        print(f"Warning: Failed to auto-play video: {e}")
+        return _capture_manifests(driver, url, wait, settle, page)
+    finally:
+        driver.quit()
 
-    # Wait for network requests to fire
-    time.sleep(wait)
 
+def _matching_requests(driver):
     manifests = set()
     for req in driver.requests:
         # Some responses may be missing headers
@@ -39,6 +123,74 @@ def get_manifest_urls(url, wait=10):
         # Look for .m3u8 URLs or Apple HLS content types
         if "m3u8" in req.url.lower() or "application/vnd.apple.mpegurl" in content_type:
             manifests.add(req.url)
+    return manifests
+
+
+def _capture_manifests(driver, url, wait, settle, page=None):
+    deadline = time.monotonic() + wait
+    driver.get(url)
+    if page is not None:
+        page["title"] = " ".join((driver.title or "").split()) or None
+
+    # Try to auto-play video so the manifest is requested
+    try:
+        driver.execute_script("const v = document.querySelector('video'); if(v) v.play();")
+    except Exception as e:
+        print(f"Warning: Failed to auto-play video: {e}")
 
-    driver.quit()
-    return manifests 
\ No newline at end of file
+    # Poll the request log until the first playlist shows up
+    manifests = _matching_requests(driver)
+    while not manifests and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        manifests = _matching_requests(driver)
+    # Give sibling variants a short window to arrive, within the deadline
+    if manifests and settle:
+        remaining = min(settle, deadline - time.monotonic())
+        if remaining > 0:
+            time.sleep(remaining)
+            manifests = _matching_requests(driver)
+    return manifests
+
+
+def resolve_streams(manifests, policy="best", max_bandwidth=None):
+    """
+    Choose the playlists to download from a set of captured manifest URLs;
+    returns (playlist, audio). Master playlists are expanded and a variant
+    is picked with ``select_variant``; ``audio`` is that variant's separate
+    audio rendition, or None when the audio is muxed in. When only media
+    playlists were captured, the longest one wins so short ad manifests are
+    ignored. Falls back to the first URL in sorted order when nothing can
+    be fetched.
+    """
+    candidates = sorted(manifests)
+    if not candidates:
+        return None, None
+    variants = {}
+    media = []
+    for url in candidates:
+        try:
+            resp = transport.get_session().get(url, timeout=10)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Failed to fetch playlist {url}: {e}")
+            continue
+        # Relative URIs resolve against where a redirect landed
+        base = resp.url or url
+        if is_master_playlist(resp.text):
+            for variant in parse_master_playlist(resp.text, base):
+                variants.setdefault(variant.uri, variant)
+        else:
+            try:
+                playlist = parse_media_playlist(resp.text, base)
+            except ValueError:
+                continue
+            media.append((sum(s.duration for s in playlist.segments), url))
+    if variants:
+        chosen = select_variant(list(variants.values()), policy, max_bandwidth)
+        logging.info(f"Selected variant {chosen.uri} ({chosen.bandwidth} bps, {chosen.resolution})")
+        if chosen.audio:
+            logging.info(f"Variant audio from {chosen.audio}")
+        return chosen.uri, chosen.audio
+    if media:
+        return max(media)[1], None
+    return candidates[0], None
@@ -0,0 +1,96 @@
+"""
+Persistent manifest-resolution cache for NovaStream.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from src import transport
+from src.utils import file_lock, write_json_atomic
+
+# Default cache file name, stored in each drama's output folder
+CACHE_FILE = ".manifest_cache.json"
+# Lifetime of entries whose URLs carry no expiry hint (seconds)
+DEFAULT_TTL = 6 * 3600
+# Signed-URL expiry parameters (CloudFront Expires=, Akamai exp=, generic expires=)
+_EXPIRY_RE = re.compile(r"(?:^|[?&~;/])(?:expires|expiry|exp)=(\d{9,13})\b", re.IGNORECASE)
+
+
+def url_expiry(url):
+    """Return the expiry timestamp embedded in a signed URL, or None."""
+    parts = urlsplit(url)
+    match = _EXPIRY_RE.search(parts.query) or _EXPIRY_RE.search(parts.path)
+    if not match:
+        return None
+    value = int(match.group(1))
+    # Millisecond timestamps
+    return value / 1000 if value > 10**11 else float(value)
+
+
+def is_reachable(url, timeout=5):
+    """Check a manifest URL with HEAD, falling back to a streamed GET."""
+    try:
+        session = transport.get_session()
+        resp = session.head(url, timeout=timeout, allow_redirects=True)
+        if resp.status_code in (405, 501):
+            resp = session.get(url, timeout=timeout, stream=True)
+            resp.close()
+    except requests.RequestException as e:
+        logging.info(f"Cached manifest {url} unreachable: {e}")
+        return False
+    return resp.status_code < 400
+
+
+class ManifestCache:
+    """
+    JSON file mapping episode page URLs to the manifest URLs they resolved to.
+    Each entry records its capture time and an expiry taken from signed-URL
+    parameters, or ``ttl`` seconds after capture when none is present.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, page_url, validate=True):
+        """Return the cached manifest set for ``page_url`` if it is still valid."""
+        with self._lock:
+            entry = self._load().get(page_url)
+        if not entry or entry["expires"] <= time.time():
+            return None
+        manifests = set(entry["manifests"])
+        if validate and not is_reachable(sorted(manifests)[0]):
+            self.discard(page_url)
+            return None
+        return manifests
+
+    def put(self, page_url, manifests):
+        """Record the manifests captured for ``page_url``."""
+        captured = time.time()
+        expiries = [e for e in map(url_expiry, manifests) if e is not None]
+        expires = min(expiries) if expiries else captured + self.ttl
+        # Merge with entries written by other instances and worker processes
+        with self._lock, file_lock(self.path):
+            entries = self._load()
+            entries[page_url] = {"manifests": sorted(manifests), "captured": captured, "expires": expires}
+            write_json_atomic(self.path, entries)
+
+    def discard(self, page_url):
+        """Forget ``page_url``, e.g. after its manifest stopped working."""
+        with self._lock, file_lock(self.path):
+            entries = self._load()
+            if entries.pop(page_url, None) is not None:
+                write_json_atomic(self.path, entries)
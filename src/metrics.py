@@ -0,0 +1,192 @@
+"""
+Stage timings and transfer counters for NovaStream.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+from src.utils import write_json_atomic
+
+# JSON export written next to download.log
+METRICS_FILE = "metrics.json"
+
+# Minimum seconds between rewrites of the Prometheus text file
+TEXTFILE_INTERVAL = 5.0
+
+# One measurement: kind is "timer" (value in seconds) or "counter"; ``series``
+# (the drama folder) tells apart same-numbered episodes of different series
+Sample = namedtuple("Sample", ["episode", "kind", "name", "value", "series"], defaults=(None,))
+
+_local = threading.local()
+_sink = None
+
+
+def _series_key(series):
+    # Series are drama folders; "out/Show" and "out/Show/" are one series
+    return os.path.normpath(series) if series else None
+
+
+def _totals():
+    return {"timers": defaultdict(lambda: [0, 0.0]), "counters": defaultdict(float),
+            "episodes": defaultdict(lambda: {"timers": defaultdict(float), "counters": defaultdict(float)})}
+
+
+def _add(totals, sample):
+    if sample.kind == "timer":
+        total = totals["timers"][sample.name]
+        total[0] += 1
+        total[1] += sample.value
+    else:
+        totals["counters"][sample.name] += sample.value
+    if sample.episode is not None:
+        totals["episodes"][sample.episode][sample.kind + "s"][sample.name] += sample.value
+
+
+def _view(totals):
+    return {
+        "stages": {name: {"count": count, "seconds": round(seconds, 3)}
+                   for name, (count, seconds) in sorted(totals["timers"].items())},
+        "counters": dict(sorted(totals["counters"].items())),
+        "episodes": {str(num): {"timers": {k: round(v, 3) for k, v in sorted(ep["timers"].items())},
+                                "counters": dict(sorted(ep["counters"].items()))}
+                     for num, ep in sorted(totals["episodes"].items())},
+    }
+
+
+class Registry:
+    """Thread-safe totals per session, per series and per episode of a series."""
+
+    def __init__(self, textfile=None, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.clock = clock
+        self.started = clock()
+        self.textfile = textfile
+        self._written = None
+        self.totals = _totals()
+        self.series = defaultdict(_totals)
+
+    def record(self, sample):
+        with self._lock:
+            _add(self.totals, sample._replace(episode=None))
+            _add(self.series[sample.series], sample)
+            due = self.textfile and (self._written is None or self.clock() - self._written >= TEXTFILE_INTERVAL)
+        if due:
+            self.write_textfile()
+
+    def snapshot(self, series=None):
+        """
+        Session totals, with episodes recorded outside any series and a
+        breakdown per series; or, given ``series``, that series alone.
+        """
+        with self._lock:
+            wall = {"wall_seconds": round(self.clock() - self.started, 3)}
+            if series is not None:
+                return {**wall, **_view(self.series.get(_series_key(series)) or _totals())}
+            data = {**wall, **_view(self.totals)}
+            data["episodes"] = _view(self.series.get(None) or _totals())["episodes"]
+            named = {name: _view(totals) for name, totals in self.series.items() if name is not None}
+            if named:
+                data["series"] = dict(sorted(named.items()))
+            return data
+
+    def prometheus(self):
+        """Session totals in the Prometheus text exposition format."""
+        data = self.snapshot()
+        lines = ["# TYPE novastream_stage_seconds_total counter"]
+        lines += [f'novastream_stage_seconds_total{{stage="{name}"}} {stage["seconds"]}'
+                  for name, stage in data["stages"].items()]
+        lines.append("# TYPE novastream_stage_runs_total counter")
+        lines += [f'novastream_stage_runs_total{{stage="{name}"}} {stage["count"]}'
+                  for name, stage in data["stages"].items()]
+        for name, value in data["counters"].items():
+            lines.append(f"# TYPE novastream_{name}_total counter")
+            lines.append(f"novastream_{name}_total {value:g}")
+        lines.append("# TYPE novastream_wall_seconds gauge")
+        lines.append(f"novastream_wall_seconds {data['wall_seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path, series=None):
+        """Write ``snapshot(series)`` to ``path``."""
+        write_json_atomic(path, self.snapshot(series))
+
+    def write_textfile(self):
+        """Rewrite the Prometheus text file atomically, for node_exporter style scrapers."""
+        if not self.textfile:
+            return
+        self._written = self.clock()
+        tmp = self.textfile + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp, self.textfile)
+        except OSError as e:
+            logging.warning(f"Failed to write metrics to {self.textfile}: {e}")
+
+
+_registry = Registry()
+
+
+def reset(textfile=None):
+    """Start a new session; ``textfile`` receives Prometheus text while it runs."""
+    global _registry
+    _registry = Registry(textfile)
+    return _registry
+
+
+def current():
+    return _registry
+
+
+def install(sink):
+    """Send samples from this process to ``sink`` instead of the local registry (None to stop)."""
+    global _sink
+    _sink = sink
+
+
+def record(sample):
+    """Add ``sample`` to the session, or forward it when a sink is installed."""
+    sink = _sink
+    if sink is None:
+        _registry.record(sample)
+        return
+    try:
+        sink(sample)
+    except Exception as e:
+        logging.debug(f"Metrics sink failed: {e}")
+
+
+@contextmanager
+def episode(num, series=None):
+    """Attribute samples recorded by this thread inside the block to episode ``num`` of ``series``."""
+    previous = getattr(_local, "episode", None), getattr(_local, "series", None)
+    _local.episode, _local.series = num, _series_key(series)
+    try:
+        yield
+    finally:
+        _local.episode, _local.series = previous
+
+
+def count(name, value=1, num=None, series=None):
+    """Add ``value`` to counter ``name`` (bytes, segments, retries, failures...)."""
+    if value:
+        if num is None:
+            num, series = getattr(_local, "episode", None), getattr(_local, "series", None)
+        record(Sample(num, "counter", name, value, _series_key(series)))
+
+
+@contextmanager
+def timer(stage):
+    """
+    Time the block as ``stage`` of the current episode (or the session).
+    Stages used: scrape, title, browser, manifest, transfer, postprocess;
+    nested stages (browser inside manifest) overlap.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record(Sample(getattr(_local, "episode", None), "timer", stage, time.monotonic() - start,
+                      getattr(_local, "series", None)))
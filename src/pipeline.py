@@ -0,0 +1,172 @@
+"""
+Two-stage resolve/transfer pipeline for NovaStream.
+"""
+import logging
+import queue
+import threading
+from collections import OrderedDict, deque
+
+# Marks the end of the resolved-job queue
+_DONE = object()
+
+# Feed policies for FairQueue
+ROUND_ROBIN = "round_robin"
+PRIORITY = "priority"
+POLICIES = (ROUND_ROBIN, PRIORITY)
+
+
+def _safe_call(func, item, stage):
+    try:
+        return func(item)
+    except Exception as e:
+        logging.error(f"Pipeline {stage} error: {e}")
+        return False
+
+
+class FairQueue:
+    """
+    Pipeline feed that shares the stages between groups of items (one
+    group per series) instead of serving them first come, first served.
+    ``key(entry)`` names an entry's group. With ROUND_ROBIN every group
+    with waiting items gets one turn in rotation; with PRIORITY the
+    group with the highest ``priority(entry)`` goes first and equal
+    priorities rotate. The pipeline's end markers are served last.
+    """
+
+    def __init__(self, key, priority=lambda entry: 0, policy=ROUND_ROBIN):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}")
+        self.key = key
+        self.priority = priority
+        self.policy = policy
+        self._groups = OrderedDict()
+        self._closing = 0
+        self._cond = threading.Condition()
+
+    def put(self, entry):
+        with self._cond:
+            if entry is _DONE:
+                self._closing += 1
+            else:
+                self._groups.setdefault(self.key(entry), deque()).append(entry)
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._groups and not self._closing:
+                self._cond.wait()
+            if not self._groups:
+                self._closing -= 1
+                return _DONE
+            group = next(iter(self._groups))
+            if self.policy == PRIORITY:
+                group = max(self._groups, key=lambda g: self.priority(self._groups[g][0]))
+            items = self._groups.pop(group)
+            entry = items.popleft()
+            if items:
+                # Back of the rotation
+                self._groups[group] = items
+            return entry
+
+    def remove(self, group):
+        """Take every waiting entry of ``group`` off the queue and return them."""
+        with self._cond:
+            return list(self._groups.pop(group, ()))
+
+    def pending(self, group):
+        with self._cond:
+            return len(self._groups.get(group, ()))
+
+
+class Pipeline:
+    """
+    Long-lived resolve/transfer stages with their own thread pools. Items
+    passed to ``submit`` are resolved and transferred like in
+    ``run_pipeline``; each one's final result is passed to its callback on
+    a stage thread. The threads, and the per-thread HTTP sessions and
+    leased browsers they use, outlive any single batch of items until
+    ``close``. ``feed`` replaces the FIFO that orders submitted items,
+    e.g. with a FairQueue.
+    """
+
+    def __init__(self, resolve, transfer, resolvers=1, transfers=4, lookahead=None, refresh=None, feed=None):
+        self.resolve = resolve
+        self.transfer = transfer
+        self.refresh = refresh
+        self._feed = feed or queue.Queue()
+        self._jobs = queue.Queue(maxsize=lookahead or transfers)
+        self._transfers = transfers
+        self._remaining = resolvers
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._resolver, name=f"resolver-{i}", daemon=True)
+                         for i in range(resolvers)]
+        self._threads += [threading.Thread(target=self._transferrer, name=f"transfer-{i}", daemon=True)
+                          for i in range(transfers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item, callback):
+        """Queue ``item``; ``callback(result)`` runs once it is settled."""
+        self._feed.put((item, callback))
+
+    def close(self):
+        """Finish the submitted items, then stop the stage threads."""
+        for _ in range(self._remaining):
+            self._feed.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+
+    def _resolver(self):
+        while True:
+            entry = self._feed.get()
+            if entry is _DONE:
+                break
+            item, callback = entry
+            job = _safe_call(self.resolve, item, "resolve")
+            if isinstance(job, bool):
+                callback(job)
+            else:
+                self._jobs.put((job, callback))
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            for _ in range(self._transfers):
+                self._jobs.put(_DONE)
+
+    def _transferrer(self):
+        while True:
+            entry = self._jobs.get()
+            if entry is _DONE:
+                break
+            job, callback = entry
+            if self.refresh:
+                job = _safe_call(self.refresh, job, "refresh")
+                if isinstance(job, bool):
+                    callback(job)
+                    continue
+            callback(_safe_call(self.transfer, job, "transfer"))
+
+
+def run_pipeline(items, resolve, transfer, resolvers=1, transfers=4, lookahead=None, refresh=None):
+    """
+    Run ``resolve`` and ``transfer`` over ``items`` as two stages with their
+    own thread pools, yielding each item's final result as it finishes.
+    ``resolve`` returns a job for ``transfer``, or a bool when the item is
+    already settled (skipped or failed). Resolved jobs wait in a queue that
+    holds at most ``lookahead`` of them (default ``transfers``), so
+    resolution runs ahead of the transfers without outliving the jobs it
+    produced. ``refresh`` is applied to each job as it leaves the queue,
+    e.g. to re-resolve a manifest that is about to expire.
+    """
+    items = list(items)
+    if not items:
+        return
+    results = queue.Queue()
+    pipeline = Pipeline(resolve, transfer, resolvers=max(1, min(resolvers, len(items))), transfers=transfers,
+                        lookahead=lookahead, refresh=refresh)
+    for item in items:
+        pipeline.submit(item, results.put)
+    for _ in items:
+        yield results.get()
+    pipeline.close()
@@ -0,0 +1,174 @@
+"""
+HLS playlist parsing for NovaStream.
+"""
+import re
+from collections import namedtuple
+from urllib.parse import urljoin
+
+# A single media segment; ``byterange`` is a (length, offset) tuple or None,
+# ``key`` is the Key in effect (or None) and ``init`` the InitSection in effect.
+Segment = namedtuple("Segment", ["index", "sequence", "uri", "duration", "byterange", "key", "init"])
+Key = namedtuple("Key", ["method", "uri", "iv"])
+InitSection = namedtuple("InitSection", ["uri", "byterange"])
+MediaPlaylist = namedtuple("MediaPlaylist", ["segments", "target_duration", "media_sequence", "endlist"])
+# A master playlist entry; ``resolution`` is a (width, height) tuple or None
+# and ``audio`` is the URI of its separate audio rendition playlist, if any.
+Variant = namedtuple("Variant", ["uri", "bandwidth", "resolution", "codecs", "audio"])
+
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+# RFC 6381 sample entries of video codecs, as they start CODECS entries
+_VIDEO_CODECS = ("avc1", "avc3", "hvc1", "hev1", "dvh1", "dvhe", "vp08", "vp09", "av01", "mp4v")
+
+
+def parse_attributes(value):
+    """Parse an HLS attribute list ('A=1,B="x,y"') into a dict."""
+    attrs = {}
+    for name, raw in _ATTR_RE.findall(value):
+        attrs[name] = raw[1:-1] if raw.startswith('"') else raw
+    return attrs
+
+
+def _parse_byterange(value, last_end):
+    """Parse '<length>[@<offset>]'; a missing offset continues from ``last_end``."""
+    length, _, offset = value.partition("@")
+    return int(length), int(offset) if offset else last_end
+
+
+def is_master_playlist(text):
+    """Return True if the playlist text is a master (multivariant) playlist."""
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master_playlist(text, base_url):
+    """
+    Parse the #EXT-X-STREAM-INF entries of a master playlist into Variants.
+    Variant and audio rendition URIs are resolved against ``base_url``; of
+    a group's audio renditions the DEFAULT one is used, else the first.
+    """
+    variants = []
+    # Audio group -> rendition playlist, for groups not muxed into the variants
+    external_audio = {}
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MEDIA:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            group = attrs.get("GROUP-ID")
+            if attrs.get("TYPE") == "AUDIO" and "URI" in attrs and \
+                    (group not in external_audio or attrs.get("DEFAULT") == "YES"):
+                external_audio[group] = urljoin(base_url, attrs["URI"])
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            pending = parse_attributes(line.split(":", 1)[1])
+        elif line and not line.startswith("#") and pending is not None:
+            resolution = None
+            if "RESOLUTION" in pending:
+                width, _, height = pending["RESOLUTION"].lower().partition("x")
+                resolution = (int(width), int(height))
+            variants.append(Variant(urljoin(base_url, line), int(pending.get("BANDWIDTH", 0)), resolution,
+                                    pending.get("CODECS"), pending.get("AUDIO")))
+            pending = None
+    # Only name an audio playlist when the rendition must be fetched separately
+    return [v._replace(audio=external_audio.get(v.audio)) for v in variants]
+
+
+def has_video(variant):
+    """True if the variant declares a RESOLUTION or a video codec."""
+    if variant.resolution:
+        return True
+    codecs = [c.strip().lower() for c in (variant.codecs or "").split(",")]
+    return any(c.startswith(_VIDEO_CODECS) for c in codecs)
+
+
+def select_variant(variants, policy="best", max_bandwidth=None):
+    """
+    Pick one Variant deterministically.
+    ``policy`` is 'best' (highest quality), 'smallest' (lowest bitrate) or a
+    height cap such as '720p' (best variant no taller than 720 lines).
+    ``max_bandwidth`` (bits/s) additionally caps the bitrate. When no
+    variant satisfies the caps the smallest one is returned. Audio-only
+    variants are considered only when no variant has video.
+    """
+    if not variants:
+        return None
+    variants = [v for v in variants if has_video(v)] or list(variants)
+
+    def quality(v):
+        height = v.resolution[1] if v.resolution else 0
+        return (height, v.bandwidth, v.uri)
+
+    def size(v):
+        return (v.bandwidth, quality(v))
+
+    allowed = list(variants)
+    if max_bandwidth:
+        allowed = [v for v in allowed if v.bandwidth <= max_bandwidth]
+    if policy == "smallest":
+        return min(allowed or variants, key=size)
+    if policy != "best":
+        match = re.fullmatch(r"(\d+)p", policy)
+        if not match:
+            raise ValueError(f"Unknown variant policy: {policy}")
+        cap = int(match.group(1))
+        allowed = [v for v in allowed if v.resolution is None or v.resolution[1] <= cap]
+    if not allowed:
+        return min(variants, key=size)
+    return max(allowed, key=quality)
+
+
+def parse_media_playlist(text, base_url):
+    """
+    Parse a media playlist into a MediaPlaylist.
+    Segment and key URIs are resolved against ``base_url``.
+    """
+    if not text.lstrip().startswith("#EXTM3U"):
+        raise ValueError("Not an M3U8 playlist")
+    segments = []
+    target_duration = None
+    media_sequence = 0
+    endlist = False
+    key = None
+    init = None
+    duration = None
+    byterange = None
+    # Byte ranges without an explicit offset continue from the previous range
+    last_end = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            endlist = True
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            byterange = line.split(":", 1)[1]
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            method = attrs.get("METHOD", "NONE")
+            if method == "NONE":
+                key = None
+            else:
+                iv = attrs.get("IV")
+                key = Key(method, urljoin(base_url, attrs.get("URI", "")),
+                          bytes.fromhex(iv[2:]) if iv else None)
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            uri = urljoin(base_url, attrs["URI"])
+            init_range = _parse_byterange(attrs["BYTERANGE"], 0) if "BYTERANGE" in attrs else None
+            init = InitSection(uri, init_range)
+        elif not line.startswith("#"):
+            uri = urljoin(base_url, line)
+            seg_range = None
+            if byterange is not None:
+                seg_range = _parse_byterange(byterange, last_end.get(uri, 0))
+                last_end[uri] = seg_range[0] + seg_range[1]
+            index = len(segments)
+            segments.append(Segment(index, media_sequence + index, uri, duration or 0.0,
+                                    seg_range, key, init))
+            duration = None
+            byterange = None
+    return MediaPlaylist(segments, target_duration, media_sequence, endlist)
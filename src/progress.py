@@ -0,0 +1,119 @@
+"""
+Transfer progress reporting for NovaStream.
+"""
+import logging
+import re
+import threading
+from collections import namedtuple
+
+# One progress report for an episode transfer. ``out_time`` and ``duration``
+# are seconds of media (duration may be None), ``total_size`` bytes written,
+# ``speed`` the realtime factor and ``done`` marks the end of a run.
+Progress = namedtuple("Progress", ["num", "out_time", "duration", "total_size", "speed", "done"])
+
+# Input duration announced on ffmpeg's stderr, e.g. "Duration: 00:45:12.04, start: ..."
+DURATION_RE = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+_sink = None
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_duration(line):
+    """Return the input duration (seconds) announced in an ffmpeg log line, or None."""
+    match = DURATION_RE.search(line)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+class ProgressParser:
+    """
+    Incremental parser for ffmpeg's ``-progress`` output: key=value lines in
+    blocks terminated by ``progress=continue`` or ``progress=end``.
+    """
+
+    def __init__(self, num=None):
+        self.num = num
+        self.duration = None
+        self._fields = {}
+
+    def feed(self, line):
+        """Consume one line; returns a Progress at the end of each block."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._fields[key] = value
+            return None
+        fields, self._fields = self._fields, {}
+        out_us = _number(fields.get("out_time_us"), int)
+        return Progress(self.num, out_us / 1e6 if out_us is not None else None, self.duration,
+                        _number(fields.get("total_size"), int), _number(fields.get("speed")), value == "end")
+
+
+class ProgressTracker:
+    """
+    Folds Progress events from concurrent transfers into a fractional count
+    of finished episodes, for progress bars.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._partial = {}
+        self._speed = {}
+
+    def update(self, event):
+        """Record ``event``; returns the change in the partial episode count."""
+        fraction = 0.0
+        if not event.done and event.duration and event.out_time:
+            # A finished episode is counted by its result, never by its events
+            fraction = min(0.99, event.out_time / event.duration)
+        with self._lock:
+            old = self._partial.pop(event.num, 0.0)
+            self._speed.pop(event.num, None)
+            if not event.done:
+                self._partial[event.num] = fraction
+                if event.speed:
+                    self._speed[event.num] = event.speed
+        return fraction - old
+
+    @property
+    def partial(self):
+        with self._lock:
+            return sum(self._partial.values())
+
+    def describe(self):
+        """Short status text, e.g. '3 active, 4.2x'."""
+        with self._lock:
+            active = len(self._partial)
+            speed = sum(self._speed.values())
+        return f"{active} active, {speed:.1f}x" if speed else f"{active} active"
+
+
+def install(sink):
+    """Route Progress events emitted in this process to ``sink`` (None to stop)."""
+    global _sink
+    _sink = sink
+
+
+def install_queue(queue):
+    """Pool initializer: forward events to a multiprocessing queue."""
+    install(queue.put)
+
+
+def emit(event):
+    """Deliver ``event`` to the installed sink, if any."""
+    sink = _sink
+    if sink is None:
+        return
+    try:
+        sink(event)
+    except Exception as e:
+        logging.debug(f"Progress sink failed: {e}")
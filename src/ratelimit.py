@@ -0,0 +1,117 @@
+"""
+Shared bandwidth limiter for NovaStream.
+"""
+import logging
+import multiprocessing as mp
+import time
+
+# Bytes debited per read while streaming a throttled response
+CHUNK_SIZE = 64 * 1024
+# Smallest burst allowance, so a single chunk never waits on itself
+MIN_BURST = 2 * CHUNK_SIZE
+
+_bucket = None
+
+
+def kbps_to_bytes(kbps):
+    """Convert a rate in kilobits per second to bytes per second."""
+    return kbps * 1000 / 8
+
+
+class TokenBucket:
+    """
+    Token bucket whose state lives in shared memory, so every thread and
+    every pool process that inherits it draws from the same budget. The rate
+    is in bytes per second (0 disables limiting) and can be changed at any
+    time with ``set_rate``. Callers that overdraw go into debt and sleep it
+    off, which keeps the aggregate rate at the cap under any concurrency.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self._lock = mp.Lock()
+        self._rate = mp.RawValue("d", rate)
+        self._burst = mp.RawValue("d", burst or max(rate, MIN_BURST))
+        self._tokens = mp.RawValue("d", self._burst.value)
+        self._stamp = mp.RawValue("d", clock())
+        self.clock = clock
+        self.sleep = sleep
+
+    @property
+    def rate(self):
+        return self._rate.value
+
+    def set_rate(self, rate, burst=None):
+        """Change the cap; takes effect for the next consumer."""
+        with self._lock:
+            self._refill()
+            self._rate.value = rate
+            self._burst.value = burst or max(rate, MIN_BURST)
+            self._tokens.value = min(self._tokens.value, self._burst.value)
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = max(0.0, now - self._stamp.value)
+        self._stamp.value = now
+        if self._rate.value > 0:
+            self._tokens.value = min(self._burst.value, self._tokens.value + elapsed * self._rate.value)
+
+    def reserve(self, amount):
+        """Debit ``amount`` bytes and return how long the caller must wait."""
+        with self._lock:
+            if self._rate.value <= 0:
+                return 0.0
+            self._refill()
+            self._tokens.value -= amount
+            return -self._tokens.value / self._rate.value if self._tokens.value < 0 else 0.0
+
+    def consume(self, amount):
+        """Debit ``amount`` bytes, sleeping until the budget allows it."""
+        wait = self.reserve(amount)
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+def configure(kbps):
+    """
+    Set the process-wide limit to ``kbps`` kilobits per second, creating the
+    shared bucket on first use; 0 leaves it unlimited but still shared, so
+    a cap can be applied later. Returns the bucket.
+    """
+    global _bucket
+    rate = kbps_to_bytes(kbps)
+    if _bucket is None:
+        _bucket = TokenBucket(rate)
+        if rate > 0:
+            logging.info(f"Bandwidth limit set to {kbps} kbps")
+    elif _bucket.rate != rate:
+        _bucket.set_rate(rate)
+        logging.info(f"Bandwidth limit changed to {kbps} kbps")
+    return _bucket
+
+
+def install(bucket):
+    """Adopt a bucket created by the parent process (pool initializer)."""
+    global _bucket
+    _bucket = bucket
+
+
+def current():
+    """Return the active bucket, or None."""
+    return _bucket
+
+
+def throttled():
+    """Whether a non-zero limit is active right now."""
+    return _bucket is not None and _bucket.rate > 0
+
+
+def set_rate(kbps):
+    """Change the shared limit at runtime; 0 lifts it."""
+    configure(kbps)
+
+
+def reset():
+    """Drop the process-wide bucket."""
+    global _bucket
+    _bucket = None
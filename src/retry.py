@@ -0,0 +1,116 @@
+"""
+Retry policy for NovaStream transfers.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+# What to do after a failure
+RETRY = "retry"          # transient: timeouts, resets, 5xx, 429
+RERESOLVE = "reresolve"  # the signed manifest or its tokens expired
+FATAL = "fatal"          # retrying cannot help, e.g. 404
+
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+RERESOLVE_STATUSES = frozenset({401, 403, 410})
+
+# ``attempts`` counts retries after the first try; delays are capped exponential with full jitter
+RetryPolicy = namedtuple("RetryPolicy", ["attempts", "base", "cap"])
+DEFAULT_POLICY = RetryPolicy(attempts=5, base=0.5, cap=30.0)
+
+
+def _status(exc):
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    # aiohttp.ClientResponseError carries the status itself
+    return status if status is not None else getattr(exc, "status", None)
+
+
+def _transient_types():
+    types = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+             ConnectionError, TimeoutError, asyncio.TimeoutError)
+    try:
+        # Dynamic import: aiohttp is optional
+        import aiohttp
+        types += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+    except ImportError:
+        pass
+    return types
+
+
+def classify(exc):
+    """Map a transfer failure to RETRY, RERESOLVE or FATAL."""
+    status = _status(exc)
+    if status is not None:
+        if status in RERESOLVE_STATUSES:
+            return RERESOLVE
+        if status in RETRY_STATUSES:
+            return RETRY
+        return FATAL
+    if isinstance(exc, _transient_types()):
+        return RETRY
+    return FATAL
+
+
+def backoff(attempt, policy=DEFAULT_POLICY, rng=random.random):
+    """Full-jitter delay before retry number ``attempt`` (1-based)."""
+    return rng() * min(policy.cap, policy.base * 2 ** (attempt - 1))
+
+
+class RetryStats:
+    """Thread-safe tally of retries and the time spent waiting on them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.waited = 0.0
+
+    def add(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.waited += delay
+
+    def __str__(self):
+        return f"{self.retries} retries, {self.waited:.1f}s backing off"
+
+
+def call(func, policy=DEFAULT_POLICY, stats=None, label="", sleep=None):
+    """
+    Call ``func`` until it succeeds, retrying only RETRY-class failures with
+    jittered exponential backoff. Other failures, and the last one once the
+    attempts are used up, propagate to the caller.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            if attempt > policy.attempts or classify(e) != RETRY:
+                raise
+            delay = backoff(attempt, policy)
+            logging.info(f"Retry {attempt}/{policy.attempts} for {label or 'request'} in {delay:.2f}s: {e}")
+            if stats:
+                stats.add(delay)
+            (sleep or time.sleep)(delay)
+
+
+async def call_async(func, policy=DEFAULT_POLICY, stats=None, label=""):
+    """Coroutine counterpart of ``call``; ``func`` returns an awaitable."""
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            attempt += 1
+            if attempt > policy.attempts or classify(e) != RETRY:
+                raise
+            delay = backoff(attempt, policy)
+            logging.info(f"Retry {attempt}/{policy.attempts} for {label or 'request'} in {delay:.2f}s: {e}")
+            if stats:
+                stats.add(delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,141 @@
+"""
+Global fair-share scheduler for NovaStream.
+
+One Scheduler owns the process's download budget: ``browsers`` pooled
+browsers resolving manifests, ``transfers`` concurrent transfers and one
+bandwidth cap. Series submitted to it share that budget by round-robin or
+by priority, however many of them run at once.
+"""
+import logging
+import queue
+import threading
+from collections import namedtuple
+
+from src import browser_pool, progress, ratelimit
+from src.pipeline import ROUND_ROBIN, FairQueue, Pipeline
+
+# Browsers kept warm for resolution when the caller does not say
+DEFAULT_BROWSERS = 2
+
+# Per-series stage functions; ``refresh`` may be None
+Stages = namedtuple("Stages", ["resolve", "transfer", "refresh"])
+
+# One submitted item: its series, that series' priority and stages
+Task = namedtuple("Task", ["group", "priority", "stages"])
+
+
+class Scheduler:
+    """
+    Shares ``transfers`` transfer threads, ``browsers`` resolver threads
+    (each with a pooled browser) and a ``throttle_kbps`` bandwidth cap
+    between every series submitted through ``imap``. ``policy`` is
+    ROUND_ROBIN (equal turns) or PRIORITY (highest priority first).
+    """
+
+    def __init__(self, transfers=4, browsers=DEFAULT_BROWSERS, throttle_kbps=0, policy=ROUND_ROBIN,
+                 lookahead=None):
+        self.transfers = transfers
+        self.browsers = browsers
+        self.throttle_kbps = throttle_kbps
+        self.policy = policy
+        self._feed = FairQueue(key=lambda entry: entry[0][0].group, priority=lambda entry: entry[0][0].priority,
+                               policy=policy)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._cancelled = set()
+        self._progress = {}
+        self._local = threading.local()
+        browser_pool.configure(browsers)
+        ratelimit.configure(throttle_kbps)
+        progress.install(self._on_progress)
+        self._pipeline = Pipeline(self._resolve, self._transfer, resolvers=browsers, transfers=transfers,
+                                  lookahead=lookahead, refresh=self._refresh, feed=self._feed)
+
+    @property
+    def active(self):
+        """Number of series with items still in flight."""
+        with self._lock:
+            return sum(1 for count in self._active.values() if count)
+
+    def budget(self):
+        """The fixed part of the budget; the bandwidth cap can be retuned live through ``ratelimit``."""
+        return (self.transfers, self.browsers, self.policy)
+
+    def imap(self, items, stages, group, priority=0, on_progress=None):
+        """
+        Run ``items`` of series ``group`` through the shared stages,
+        yielding each result as it settles. Progress events of the
+        series' transfers go to ``on_progress``.
+        """
+        items = list(items)
+        results = queue.Queue()
+        task = Task(group, priority, stages)
+        with self._lock:
+            self._cancelled.discard(group)
+            self._active[group] = self._active.get(group, 0) + len(items)
+            if on_progress:
+                self._progress[group] = on_progress
+        for item in items:
+            self._pipeline.submit((task, item), lambda result: self._settle(group, results, result))
+        for _ in items:
+            yield results.get()
+
+    def cancel(self, group):
+        """Drop the waiting items of ``group``; its in-flight transfers are left to finish."""
+        with self._lock:
+            self._cancelled.add(group)
+        dropped = self._feed.remove(group)
+        for _, callback in dropped:
+            callback(False)
+        logging.info(f"Scheduler: cancelled {group}, {len(dropped)} waiting items dropped")
+
+    def close(self):
+        """Finish every submitted item and release the budget."""
+        self._pipeline.close()
+        progress.install(None)
+        browser_pool.shutdown()
+
+    def _settle(self, group, results, result):
+        with self._lock:
+            self._active[group] -= 1
+            if not self._active[group]:
+                del self._active[group]
+                self._progress.pop(group, None)
+        results.put(result)
+
+    def _is_cancelled(self, task):
+        with self._lock:
+            return task.group in self._cancelled
+
+    def _resolve(self, entry):
+        task, item = entry
+        if self._is_cancelled(task):
+            return False
+        job = task.stages.resolve(item)
+        return job if isinstance(job, bool) else (task, job)
+
+    def _refresh(self, entry):
+        task, job = entry
+        if self._is_cancelled(task):
+            return False
+        if task.stages.refresh is None:
+            return entry
+        fresh = task.stages.refresh(job)
+        return fresh if isinstance(fresh, bool) else (task, fresh)
+
+    def _transfer(self, entry):
+        task, job = entry
+        if self._is_cancelled(task):
+            return False
+        # Progress events raised on this thread belong to this series
+        self._local.group = task.group
+        try:
+            return task.stages.transfer(job)
+        finally:
+            self._local.group = None
+
+    def _on_progress(self, event):
+        with self._lock:
+            sink = self._progress.get(getattr(self._local, "group", None))
+        if sink:
+            sink(event)
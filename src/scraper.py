@@ -1,57 +1,112 @@
 """
 Episode link scraper for NovaStream.
 """
+import functools
 import re
 import time
 import requests
 import logging
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from bs4 import BeautifulSoup, SoupStrainer
+from urllib.parse import urljoin, urlparse
+from src import browser_pool, transport
 from src.driver import get_driver
 
+# 'ep' or 'episode' as its own token, then the number: matches /ep-3, episode_12/
+# and ?ep=4, but not 'deep-5', 'step2' or 'ep1080p'
+EPISODE_PATTERN = re.compile(r"(?<![a-z])(?:episode|ep)[-_/=]?(\d+)(?![a-z0-9])", re.IGNORECASE)
 
-def find_episode_links(homepage_url):
+# Per-site link patterns by host name, see register_site_pattern
+SITE_PATTERNS = {}
+
+
+def register_site_pattern(host, pattern):
+    """
+    Use ``pattern`` instead of EPISODE_PATTERN for links on ``host`` and
+    its subdomains. Its first group must capture the episode number.
+    """
+    pattern = re.compile(pattern, re.IGNORECASE) if isinstance(pattern, str) else pattern
+    if pattern.groups < 1:
+        raise ValueError("Site pattern needs a group capturing the episode number")
+    SITE_PATTERNS[_bare_host(host.lower())] = pattern
+
+
+def _bare_host(host):
+    return host[4:] if host.startswith("www.") else host
+
+
+def _pattern_for(url):
+    host = _bare_host(urlparse(url).hostname or "")
+    while host:
+        if host in SITE_PATTERNS:
+            return SITE_PATTERNS[host]
+        host = host.partition(".")[2]
+    return EPISODE_PATTERN
+
+
+@functools.lru_cache(maxsize=None)
+def _parser():
+    try:
+        # Dynamic import: lxml is optional and parses large pages much faster
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+
+def extract_episode_links(html, base_url, pattern=None):
+    """
+    Return (num, absolute url) pairs for the episode links in ``html``.
+    Only anchors whose href matches the pattern are built into the tree,
+    so large series pages stay cheap to parse.
+    """
+    pattern = pattern or _pattern_for(base_url)
+    anchors = BeautifulSoup(html, _parser(), parse_only=SoupStrainer("a", href=pattern))
+    links = []
+    for a in anchors.find_all("a"):
+        m = pattern.search(a["href"])
+        links.append((int(m.group(1)), urljoin(base_url, a["href"])))
+    return links
+
+
+def _render_page(url, pool):
+    """Return the JS-rendered page source, using a pooled browser when available."""
+    if pool is not None:
+        with pool.lease() as driver:
+            driver.get(url)
+            time.sleep(5)
+            return driver.page_source
+    driver = get_driver()
+    try:
+        driver.get(url)
+        time.sleep(5)
+        return driver.page_source
+    finally:
+        driver.quit()
+
+
+def find_episode_links(homepage_url, pool=None):
     """
     Scrape homepage for episode links using static HTTP parse first,
-    then fall back to Selenium if none are found.
+    then fall back to Selenium if none are found. The fallback leases a
+    browser from ``pool`` (or the process-wide browser pool) when one is active.
     """
     # Static HTTP parse
+    links = []
     try:
-        r = requests.get(homepage_url, timeout=10)
+        r = transport.get_session().get(homepage_url, timeout=10)
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
+        links = extract_episode_links(r.text, homepage_url)
     except requests.RequestException as e:
         logging.warning(f"Failed to fetch homepage from {homepage_url}: {e}")
-        soup = None
-
-    links = []
-    if soup:
-        for a in soup.find_all("a", href=True):
-            # match both 'ep' and 'episode' prefixes
-            m = re.search(r"(?:ep(?:isode)?[-_/]?)(\d+)", a["href"], re.IGNORECASE)
-            if m:
-                num = int(m.group(1))
-                full = urljoin(homepage_url, a["href"])
-                links.append((num, full))
 
     # If none found, use Selenium to render JS
     if not links:
         try:
-            driver = get_driver()
-            driver.get(homepage_url)
-            time.sleep(5)
-            dyn_soup = BeautifulSoup(driver.page_source, "html.parser")
-            driver.quit()
-            for a in dyn_soup.find_all("a", href=True):
-                # match both 'ep' and 'episode' prefixes
-                m = re.search(r"(?:ep(?:isode)?[-_/]?)(\d+)", a["href"], re.IGNORECASE)
-                if m:
-                    num = int(m.group(1))
-                    full = urljoin(homepage_url, a["href"])
-                    links.append((num, full))
+            page_source = _render_page(homepage_url, pool or browser_pool.current())
+            links = extract_episode_links(page_source, homepage_url)
         except Exception as e:
             logging.warning(f"Selenium fallback scraping failed: {e}")
 
     # Deduplicate and sort by episode number
     unique = {num: url for num, url in links}
-    return sorted(unique.items(), key=lambda x: x[0]) 
\ No newline at end of file
+    return sorted(unique.items(), key=lambda x: x[0])
@@ -0,0 +1,70 @@
+"""
+Shared HTTP transport for NovaStream.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+# Connections kept alive per host
+POOL_MAXSIZE = 16
+# Distinct hosts whose pools are cached
+POOL_CONNECTIONS = 8
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Hard per-host connection caps applied to every worker session, e.g. {"cdn.example.com": 4}
+HOST_LIMITS = {}
+
+_local = threading.local()
+
+
+def build_session(pool_maxsize=POOL_MAXSIZE, retries=RETRIES, host_limits=None, user_agent=USER_AGENT):
+    """
+    Create a requests.Session with keep-alive connection pools, urllib3
+    retries on idempotent requests, compression and a default User-Agent.
+    ``host_limits`` maps a host name to a hard cap on its open connections.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    for host, limit in (HOST_LIMITS if host_limits is None else host_limits).items():
+        # Blocking pool: callers wait for a free connection instead of opening more
+        host_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit, pool_block=True, max_retries=retry)
+        session.mount(f"http://{host}/", host_adapter)
+        session.mount(f"https://{host}/", host_adapter)
+    session.headers.update({
+        "User-Agent": user_agent,
+        "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+    })
+    return session
+
+
+def get_session(retries=RETRIES):
+    """
+    Return this worker thread's shared session, creating it on first use.
+    Callers that retry failures themselves (and count them) pass
+    ``retries=0`` for a session that returns 5xx/429 responses at once.
+    """
+    # Never reuse sockets inherited from a parent process over fork
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.sessions = {}
+        _local.pid = os.getpid()
+    session = _local.sessions.get(retries)
+    if session is None:
+        session = _local.sessions[retries] = build_session(retries=retries)
+    return session
@@ -1,15 +1,23 @@
 """
 Utilities for NovaStream.
 """
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
 
-from art import text2art
-from colorama import init as colorama_init, Fore
-
-# initialize colorama
-colorama_init(autoreset=True)
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 def banner():
     """Print the NovaStream ASCII art banner."""
+    # Dynamic imports: keep ``import src.utils`` light for workers and scripts
+    from art import text2art
+    from colorama import Fore
     art = text2art("NovaStream")
     print(Fore.CYAN + art)
 
@@ -22,4 +30,41 @@ def expand_ranges(s):
             nums.update(range(int(a), int(b) + 1))
         else:
             nums.add(int(part))
-    return sorted(nums) 
\ No newline at end of file
+    return sorted(nums)
+
+def write_json_atomic(path, data):
+    """Write ``data`` as JSON so readers never observe a half-written file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex sha256 of the file at ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on ``path``.lock for the block. The lock is
+    taken on a fresh descriptor, so it excludes other threads as well as
+    other processes, whichever object they use to reach the file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
@@ -0,0 +1,69 @@
+"""
+Stall detection for NovaStream transfers.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+# Seconds a transfer may go without progress before it is stopped and requeued
+STALL_TIMEOUT = 120
+
+
+class TransferStalled(Exception):
+    """A transfer made no progress within its stall window and was stopped."""
+
+
+class Watchdog:
+    """
+    Calls ``on_stall`` once if ``feed`` is not called for ``timeout``
+    seconds. Watches from a daemon thread while used as a context manager;
+    a timeout of 0 or None disables it.
+    """
+
+    def __init__(self, timeout, on_stall, clock=time.monotonic):
+        self.timeout = timeout
+        self.on_stall = on_stall
+        self.clock = clock
+        self.stalled = False
+        self._last = clock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def feed(self):
+        """Record progress, restarting the stall window."""
+        self._last = self.clock()
+
+    def check(self):
+        """Fire ``on_stall`` if the window has run out; returns True once stalled."""
+        if not self.stalled and self.timeout and self.clock() - self._last >= self.timeout:
+            self.stalled = True
+            self.on_stall()
+        return self.stalled
+
+    def _watch(self):
+        interval = min(self.timeout / 4, 5.0)
+        while not self._done.wait(interval):
+            if self.check():
+                break
+
+    def __enter__(self):
+        if self.timeout:
+            self._last = self.clock()
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self._thread:
+            self._thread.join()
+
+
+def kill_group(proc):
+    """Kill ``proc`` and the rest of its process group (started with ``os.setsid``)."""
+    try:
+        os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
+    except (ProcessLookupError, PermissionError) as e:
+        logging.debug(f"Could not kill process group of {proc.pid}: {e}")
@@ -1,6 +1,8 @@
 import sys
 import types
 
+import pytest
+
 # Create a dummy tkinter module
 _tkinter = types.ModuleType("tkinter")
 _tkinter.Tk = lambda *args, **kwargs: types.SimpleNamespace(withdraw=lambda: None, destroy=lambda: None)
@@ -16,4 +18,13 @@ sys.modules['tkinter.messagebox'] = _messagebox
 _simpledialog = types.ModuleType("tkinter.simpledialog")
 _simpledialog.askinteger = lambda *args, **kwargs: None
 _simpledialog.askstring = lambda *args, **kwargs: None
-sys.modules['tkinter.simpledialog'] = _simpledialog 
\ No newline at end of file
+sys.modules['tkinter.simpledialog'] = _simpledialog 
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_state():
+    # Any run creates the process-wide bucket, even an unlimited one, and remembers browser-only sites
+    yield
+    from src import episode, ratelimit
+    ratelimit.reset()
+    episode.reset()
@@ -0,0 +1,21 @@
+"""Fakes shared by several test modules."""
+import io
+
+import src.downloader as dlmod
+
+
+class FakeProc:
+    # Popen stand-in; subclasses set returncode and return (stdout, stderr) from communicate()
+    @property
+    def stdout(self):
+        return io.BytesIO(self.communicate()[0])
+    @property
+    def stderr(self):
+        return io.BytesIO(self.communicate()[1])
+    def wait(self):
+        return self.returncode
+
+
+def make_job(tmp_path, engine='ffmpeg', retries=3):
+    return dlmod.EpisodeJob(('Show', 1, 'http://x/ep-1', str(tmp_path)), 1, 'http://x/ep-1', 'http://cdn/old.m3u8',
+                            str(tmp_path / 'Show - Episode 01.mp4'), engine, False, retries, {}, None)
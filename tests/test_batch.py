@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+import src.batch as bmod
+from src import jobstore, ratelimit
+from src.completion import CompletionIndex
+from src.downloader import EpisodeJob
+
+
+def episode_job(args):
+    return EpisodeJob(args, args[1], args[2], 'http://cdn/a.m3u8', f'{args[3]}/{args[1]}.mp4', 'ffmpeg', False, 0,
+                      {}, None)
+
+
+@pytest.fixture
+def batch(monkeypatch, tmp_path):
+    monkeypatch.setattr('src.scheduler.browser_pool.configure', lambda size=1, max_uses=25: None)
+    monkeypatch.setattr('src.scheduler.browser_pool.shutdown', lambda: None)
+    monkeypatch.setattr(bmod, 'select_episodes',
+                        lambda url, download_all, episode_list: [(1, f'{url}ep-1'), (2, f'{url}ep-2')])
+    monkeypatch.setattr(bmod, 'resolve_episode_job', episode_job)
+    monkeypatch.setattr(bmod, 'refresh_episode_job', lambda job: job)
+    transferred = []
+    monkeypatch.setattr(bmod, 'transfer_episode', lambda job: transferred.append((job.args[0], job.num)) or True)
+    yield transferred
+    ratelimit.reset()
+
+
+def test_series_share_one_scheduler(batch, monkeypatch, tmp_path):
+    made = []
+    real = bmod.Scheduler
+    monkeypatch.setattr(bmod, 'Scheduler', lambda **kwargs: made.append(kwargs) or real(**kwargs))
+    jobs = [bmod.SeriesJob('http://s/a/', name='Show A', output=str(tmp_path)), {'url': 'http://s/b/',
+                                                                                'output': str(tmp_path)}]
+    results = bmod.run_batch(jobs, workers=3)
+    assert len(made) == 1 and made[0]['transfers'] == 3
+    assert [r.folder for r in results] == [str(tmp_path / 'Show_A'), str(tmp_path / 'b')]
+    assert [(r.total, r.completed, r.failed, r.error) for r in results] == [(2, 2, 0, None)] * 2
+    assert sorted(batch) == [('Show_A', 1), ('Show_A', 2), ('b', 1), ('b', 2)]
+
+
+def test_failures_are_reported_not_raised(batch, monkeypatch, tmp_path):
+    def select(url, download_all, episode_list):
+        if 'broken' in url:
+            raise ValueError('No episodes found; pass an episode list.')
+        return [(1, f'{url}ep-1'), (2, f'{url}ep-2')]
+    monkeypatch.setattr(bmod, 'select_episodes', select)
+    monkeypatch.setattr(bmod, 'transfer_episode', lambda job: job.num == 1)
+    broken, partial = bmod.run_batch([{'url': 'http://s/broken/', 'output': str(tmp_path)},
+                                      {'url': 'http://s/a/', 'output': str(tmp_path)}])
+    assert broken.error == 'No episodes found; pass an episode list.' and broken.total == 0
+    assert (partial.completed, partial.failed, partial.error) == (1, 1, '1 of 2 episodes failed')
+
+
+def test_completed_episodes_are_skipped(batch, tmp_path):
+    folder = tmp_path / 'a'
+    folder.mkdir()
+    (folder / '1.mp4').write_bytes(b'x' * 2048)
+    CompletionIndex(str(folder)).record(1, str(folder / '1.mp4'), 2048)
+    result, = bmod.run_batch([{'url': 'http://s/a/', 'output': str(tmp_path)}])
+    assert (result.total, result.completed, result.skipped) == (2, 2, 1)
+    assert batch == [('a', 2)]
+
+
+def test_batch_records_job_store(batch, tmp_path):
+    db = str(tmp_path / 'jobs.db')
+    bmod.run_batch([{'url': 'http://s/a/', 'output': str(tmp_path)}], job_store=db)
+    store = jobstore.open_store(db)
+    drama = store.find_drama('http://s/a/', str(tmp_path))
+    assert drama['status'] == 'done'
+    assert store.summary(drama['id']) == {'done': 2}
+
+
+def test_load_jobs_csv_and_json(tmp_path):
+    csv_file = tmp_path / 'downloads.csv'
+    csv_file.write_text('url,name,base_output,download_all,episode_list,workers\n'
+                        'http://s/a/,Show A,out,true,,4\n'
+                        'http://s/b/,,,,1-3,2\n')
+    a, b = bmod.load_jobs(str(csv_file))
+    assert (a.url, a.name, a.output, a.download_all) == ('http://s/a/', 'Show A', 'out', True)
+    assert (b.output, b.download_all, b.episode_list) == ('downloads', False, '1-3')
+    json_file = tmp_path / 'downloads.json'
+    json_file.write_text(json.dumps({'jobs': [{'url': 'http://s/c/', 'episodes': '2', 'priority': '5'}]}))
+    c, = bmod.load_jobs(str(json_file))
+    assert (c.episode_list, c.download_all, c.priority) == ('2', False, 5)
+    (tmp_path / 'bad.json').write_text('[{"name": "x"}]')
+    with pytest.raises(ValueError, match='no url'):
+        bmod.load_jobs(str(tmp_path / 'bad.json'))
+
+
+def test_dict_jobs_read_like_manifest_rows(batch, monkeypatch, tmp_path):
+    seen = []
+    monkeypatch.setattr(bmod, 'select_episodes',
+                        lambda url, download_all, episode_list: seen.append((download_all, episode_list)) or [])
+    bmod.run_batch([{'url': 'http://s/a/', 'episode_list': '1-3', 'output': str(tmp_path)}])
+    assert seen == [(False, '1-3')]
+
+
+def test_errors_after_discovery_become_results(batch, monkeypatch, tmp_path):
+    def broken_store(path):
+        raise OSError('database is locked')
+    monkeypatch.setattr(bmod.jobstore, 'open_store', broken_store)
+    result, = bmod.run_batch([{'url': 'http://s/a/', 'output': str(tmp_path)}], job_store=str(tmp_path / 'j.db'))
+    assert (result.folder, result.total, result.error) == (str(tmp_path / 'a'), 2, 'database is locked')
@@ -0,0 +1,47 @@
+import pytest
+
+from benchmarks.run import compare
+from benchmarks.server import FixtureServer, encryption_available
+from src import hls
+from src.episode import resolve_episode
+from src.retry import RetryPolicy
+from src.scraper import find_episode_links
+
+
+@pytest.fixture(scope='module')
+def server():
+    with FixtureServer(episodes=2, segments=4, segment_size=4096) as fixture:
+        yield fixture
+
+
+def test_fixture_site_is_discoverable(server):
+    assert [num for num, _ in find_episode_links(server.homepage())] == [1, 2]
+    tiers = [resolve_episode(server.episode_url(n), browser=lambda url, **kw: set()).tier for n in (1, 2)]
+    assert tiers == ['html', 'iframe']
+
+
+@pytest.mark.parametrize('variant', ['hi', 'br', 'enc'])
+def test_fixture_streams_download(server, variant, tmp_path):
+    if variant == 'enc' and not encryption_available():
+        pytest.skip('cryptography is not installed')
+    dest = tmp_path / 'out.ts'
+    result = hls.download_stream(server.playlist_url(1, variant), str(dest), concurrency=2,
+                                 policy=RetryPolicy(0, 0, 0))
+    expected = b''.join(server.segment(1, 'hi', i) for i in range(4))
+    assert dest.read_bytes() == expected
+    assert result.segments == 4
+
+
+def test_error_injection_is_seeded():
+    a, b = FixtureServer(error_rate=0.5, seed=7), FixtureServer(error_rate=0.5, seed=7)
+    try:
+        assert [a._inject_error() for _ in range(20)] == [b._inject_error() for _ in range(20)]
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_compare_reports_direction():
+    lines = compare({'streams': {'hi': {'mb_per_s': 20.0}}, 'ttfb': {'ttfb_ms': 5.0}},
+                    {'streams': {'hi': {'mb_per_s': 10.0}}, 'ttfb': {'ttfb_ms': 4.0}})
+    assert lines == ['streams.hi.mb_per_s: 10.0 -> 20.0 (+100.0%, better)', 'ttfb.ttfb_ms: 4.0 -> 5.0 (+25.0%, worse)']
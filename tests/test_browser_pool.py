@@ -0,0 +1,115 @@
+import pytest
+
+from src import browser_pool
+from src.browser_pool import BrowserPool
+from src.manifest import get_manifest_urls
+from src.scraper import find_episode_links
+
+class DummyReq:
+    def __init__(self, url):
+        self.url = url
+        self.response = None
+
+class DummyDriver:
+    created = 0
+    def __init__(self):
+        DummyDriver.created += 1
+        self._requests = [DummyReq('http://x/media.m3u8')]
+        self.visited = []
+        self.quit_called = False
+        self.crashed = False
+        self.page_source = '<a href="/show/episode-4">4</a>'
+    # selenium-wire clears captured traffic on `del driver.requests`
+    @property
+    def requests(self):
+        return self._requests
+    @requests.deleter
+    def requests(self):
+        self._requests = []
+    @property
+    def current_url(self):
+        if self.crashed:
+            raise RuntimeError('session deleted')
+        return self.visited[-1] if self.visited else ''
+    def get(self, url):
+        self.visited.append(url)
+    def execute_script(self, script):
+        pass
+    def delete_all_cookies(self):
+        pass
+    def quit(self):
+        self.quit_called = True
+
+@pytest.fixture(autouse=True)
+def reset_counter(monkeypatch):
+    DummyDriver.created = 0
+    monkeypatch.setattr('src.manifest.time.sleep', lambda x: None)
+    monkeypatch.setattr('src.scraper.time.sleep', lambda x: None)
+    yield
+    browser_pool.shutdown()
+
+
+def test_lease_reuses_and_resets_driver():
+    pool = BrowserPool(size=1, factory=DummyDriver)
+    with pool.lease() as first:
+        first.get('http://page')
+    with pool.lease() as second:
+        pass
+    assert first is second
+    assert DummyDriver.created == 1
+    # reset navigates away and clears captured requests
+    assert first.visited[-1] == 'about:blank'
+    assert first.requests == []
+
+
+def test_driver_recycled_after_max_uses():
+    pool = BrowserPool(size=1, max_uses=2, factory=DummyDriver)
+    drivers = []
+    for _ in range(3):
+        with pool.lease() as d:
+            drivers.append(d)
+    assert drivers[0] is drivers[1]
+    assert drivers[2] is not drivers[0]
+    assert drivers[0].quit_called
+
+
+def test_crashed_driver_is_recycled():
+    pool = BrowserPool(size=1, factory=DummyDriver)
+    with pytest.raises(RuntimeError):
+        with pool.lease() as d:
+            d.crashed = True
+            raise RuntimeError('tab crashed')
+    assert d.quit_called
+    with pool.lease() as d2:
+        assert d2 is not d
+
+
+def test_close_quits_idle_drivers():
+    pool = BrowserPool(size=2, factory=DummyDriver)
+    with pool.lease() as d:
+        pass
+    pool.close()
+    assert d.quit_called
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
+
+
+def test_get_manifest_urls_uses_active_pool(monkeypatch):
+    pool = browser_pool.configure()
+    monkeypatch.setattr(pool, 'factory', DummyDriver)
+    assert get_manifest_urls('http://ep1', wait=0) == {'http://x/media.m3u8'}
+    assert get_manifest_urls('http://ep2', wait=0) == set()  # requests were cleared on reset
+    assert DummyDriver.created == 1
+
+
+def test_find_episode_links_fallback_uses_pool(monkeypatch):
+    class EmptyResp:
+        text = ''
+        def raise_for_status(self): pass
+    monkeypatch.setattr('src.scraper.requests.Session.get', lambda *args, **kwargs: EmptyResp())
+    monkeypatch.setattr('src.scraper.get_driver', lambda: pytest.fail('should lease from pool'))
+    pool = BrowserPool(size=1, factory=DummyDriver)
+    links = find_episode_links('https://site.test', pool=pool)
+    assert links == [(4, 'https://site.test/show/episode-4')]
+    assert DummyDriver.created == 1
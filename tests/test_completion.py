@@ -0,0 +1,49 @@
+import threading
+
+from src.completion import CompletionIndex
+
+
+def test_record_and_reload(tmp_path):
+    out = tmp_path / 'Show - Episode 01 - Pilot.mp4'
+    out.write_bytes(b'abcd')
+    CompletionIndex(str(tmp_path)).record(1, str(out), 4, 1320.5, 'deadbeef')
+    index = CompletionIndex(str(tmp_path))
+    assert index.is_complete(1)
+    assert index.get(1)['sha256'] == 'deadbeef'
+    assert index.get(1)['duration'] == 1320.5
+    assert not index.is_complete(2)
+
+
+def test_missing_or_truncated_file_is_not_complete(tmp_path):
+    out = tmp_path / 'ep.mp4'
+    out.write_bytes(b'abcd')
+    index = CompletionIndex(str(tmp_path))
+    index.record(3, str(out), 4)
+    out.write_bytes(b'ab')
+    assert not index.is_complete(3)
+    out.unlink()
+    assert not index.is_complete(3)
+
+
+def test_pending_filters_completed(tmp_path):
+    out = tmp_path / 'ep.mp4'
+    out.write_bytes(b'x')
+    index = CompletionIndex(str(tmp_path))
+    index.record(2, str(out), 1)
+    eps = [(1, 'u1'), (2, 'u2'), (3, 'u3')]
+    assert index.pending(eps) == [(1, 'u1'), (3, 'u3')]
+
+
+def test_concurrent_records_from_separate_instances(tmp_path):
+    # Workers each open their own index; every entry must survive the merge
+    def record(num):
+        out = tmp_path / f'{num}.mp4'
+        out.write_bytes(b'x')
+        CompletionIndex(str(tmp_path)).record(num, str(out), 1)
+    threads = [threading.Thread(target=record, args=(n,)) for n in range(1, 101)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    index = CompletionIndex(str(tmp_path))
+    assert all(index.is_complete(n) for n in range(1, 101))
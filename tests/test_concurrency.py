@@ -0,0 +1,98 @@
+import threading
+from multiprocessing.pool import ThreadPool
+from types import SimpleNamespace
+
+from src import hls
+from src.concurrency import AIMDController, adaptive_imap, was_throttled
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def make_controller(**kwargs):
+    clock = FakeClock()
+    kwargs.setdefault('memory_check', lambda: False)
+    return AIMDController(window=1.0, clock=clock, **kwargs), clock
+
+
+def test_level_grows_while_throughput_improves_then_holds():
+    ctl, clock = make_controller(maximum=8)
+    for rate in (100, 200, 300, 305):
+        ctl.record(rate)
+        clock.now += 1
+        ctl.update()
+    # 1 -> 2 -> 3 -> 4, then a plateau holds the level
+    assert ctl.level == 4
+
+
+def test_level_halves_on_rate_limiting():
+    ctl, clock = make_controller(maximum=16, initial=8)
+    ctl.record(1000, throttled=True)
+    clock.now += 1
+    assert ctl.update() == 4
+
+
+def test_level_halves_on_errors_and_respects_minimum():
+    ctl, clock = make_controller(minimum=2, maximum=16, initial=3)
+    for _ in range(5):
+        ctl.record(error=True)
+    clock.now += 1
+    assert ctl.update() == 2
+
+
+def test_memory_pressure_backs_off():
+    ctl, clock = make_controller(maximum=8, initial=6, memory_check=lambda: True)
+    ctl.record(1000)
+    clock.now += 1
+    assert ctl.update() == 3
+
+
+def test_level_waits_for_a_full_window():
+    ctl, clock = make_controller(maximum=8)
+    ctl.record(1000)
+    clock.now += 0.5
+    assert ctl.update() == 1
+
+
+def test_was_throttled_reads_retry_history():
+    history = (SimpleNamespace(status=503), SimpleNamespace(status=429))
+    resp = SimpleNamespace(raw=SimpleNamespace(retries=SimpleNamespace(history=history)))
+    assert was_throttled(resp)
+    assert not was_throttled(SimpleNamespace())
+
+
+def test_adaptive_imap_caps_tasks_in_flight():
+    ctl, _ = make_controller(maximum=4, initial=2)
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+    release = threading.Semaphore(0)
+    def task(n):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        release.acquire(timeout=1)
+        with lock:
+            state['active'] -= 1
+        return n
+    with ThreadPool(4) as pool:
+        results = adaptive_imap(pool, task, list(range(6)), ctl)
+        threading.Timer(0.05, lambda: [release.release() for _ in range(6)]).start()
+        assert sorted(results) == list(range(6))
+    assert state['peak'] == 2
+
+
+def test_download_stream_follows_controller_level(tmp_path):
+    pages = {'http://x/index.m3u8': '#EXTM3U\n' + ''.join(f'#EXTINF:1,\ns{i}.ts\n' for i in range(6)) + '#EXT-X-ENDLIST\n'}
+    pages.update({f'http://x/s{i}.ts': bytes([i]) for i in range(6)})
+    class Session:
+        def get(self, url, headers=None, timeout=None):
+            body = pages[url]
+            return SimpleNamespace(url=url, text=body, content=body, raise_for_status=lambda: None)
+    ctl, _ = make_controller(maximum=4, initial=1)
+    result = hls.download_stream('http://x/index.m3u8', str(tmp_path / 'o.ts'), session=Session(), controller=ctl)
+    assert result.segments == 6
+    assert (tmp_path / 'o.ts').read_bytes() == bytes(range(6))
+    # Every segment fetch was reported to the controller
+    assert ctl._tasks == 6 and ctl._bytes == 6
@@ -0,0 +1,196 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import src.daemon as dmod
+from src.downloader import EpisodeJob
+
+
+def episode_job(args):
+    return EpisodeJob(args, args[1], args[2], 'http://cdn/a.m3u8', f'{args[3]}/{args[1]}.mp4', 'ffmpeg', False, 0,
+                      {}, None)
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    monkeypatch.setattr(dmod.browser_pool, 'configure', lambda size=1, max_uses=25: None)
+    monkeypatch.setattr(dmod, 'select_episodes',
+                        lambda url, download_all, episode_list: [(1, f'{url}ep-1'), (2, f'{url}ep-2')])
+    monkeypatch.setattr(dmod, 'resolve_episode_job', episode_job)
+    monkeypatch.setattr(dmod, 'refresh_episode_job', lambda job: job)
+    transferred = []
+    monkeypatch.setattr(dmod, 'transfer_episode', lambda job: transferred.append(job.num) or True)
+    d = dmod.Daemon(str(tmp_path), workers=2)
+    d.transferred = transferred
+    yield d
+    d.stop()
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.finished is None and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_jobs_share_one_pipeline(daemon, tmp_path):
+    daemon.start()
+    pipeline = daemon._pipeline
+    first = wait_for(daemon.submit('http://s/a/', name='Show A'))
+    second = wait_for(daemon.submit('http://s/b/'))
+    assert daemon._pipeline is pipeline
+    assert first.status()['state'] == 'done' and first.completed == 2
+    assert second.folder == str(tmp_path / 'b')
+    assert sorted(daemon.transferred) == [1, 1, 2, 2]
+    assert json.loads((tmp_path / 'Show_A' / 'metrics.json').read_text())['wall_seconds'] >= 0
+    assert daemon.status()['jobs'] == {'done': 2}
+
+
+def test_stalled_episode_is_requeued(daemon, monkeypatch):
+    stalls = []
+    def transfer(job):
+        if job.num == 2 and not stalls:
+            stalls.append(job)
+            return dmod.Requeue(job.args)
+        return True
+    monkeypatch.setattr(dmod, 'transfer_episode', transfer)
+    daemon.start()
+    job = wait_for(daemon.submit('http://s/a/'))
+    assert (job.state, job.completed, job.requeues) == ('done', 2, {2: 1})
+
+
+def test_failed_episodes_fail_the_job(daemon, monkeypatch):
+    monkeypatch.setattr(dmod, 'transfer_episode', lambda job: job.num == 1)
+    daemon.start()
+    job = wait_for(daemon.submit('http://s/a/'))
+    assert (job.state, job.completed, job.failed) == ('failed', 1, 1)
+    assert job.error == '1 of 2 episodes failed'
+
+
+def test_cancelled_job_never_starts(daemon):
+    job = daemon.submit('http://s/a/')
+    daemon.cancel(job.id)
+    daemon.start()
+    later = wait_for(daemon.submit('http://s/b/'))
+    assert later.state == 'done'
+    assert job.state == 'cancelled' and job.started is None
+
+
+def test_cancel_drops_episodes_resolved_ahead(daemon, monkeypatch):
+    monkeypatch.setattr(dmod, 'select_episodes',
+                        lambda url, download_all, episode_list: [(n, f'{url}ep-{n}') for n in range(1, 6)])
+    resolved, release, transferred = [], threading.Event(), []
+    monkeypatch.setattr(dmod, 'resolve_episode_job', lambda args: resolved.append(args[1]) or episode_job(args))
+    def transfer(job):
+        transferred.append(job.num)
+        release.wait(5)
+        return True
+    monkeypatch.setattr(dmod, 'transfer_episode', transfer)
+    daemon.start()
+    job = daemon.submit('http://s/a/')
+    deadline = time.time() + 5
+    # Two transfers in flight, two more resolved and waiting in the queue
+    while (len(transferred) < 2 or len(resolved) < 4) and time.time() < deadline:
+        time.sleep(0.01)
+    daemon.cancel(job.id)
+    release.set()
+    wait_for(job)
+    assert sorted(transferred) == [1, 2]
+    assert (job.state, job.completed, job.cancelled) == ('cancelled', 2, 3)
+
+
+def test_cancelling_a_finished_job_keeps_its_outcome(daemon):
+    daemon.start()
+    job = wait_for(daemon.submit('http://s/a/'))
+    daemon.cancel(job.id)
+    assert job.state == 'done'
+    assert daemon._store.drama(int(job.id))['status'] == 'done'
+
+
+def test_submit_validates(daemon):
+    with pytest.raises(ValueError):
+        daemon.submit('')
+    with pytest.raises(ValueError, match='engine'):
+        daemon.submit('http://s/a/', engine='wget')
+
+
+def test_http_api(daemon):
+    daemon.start()
+    server = dmod.make_server(daemon, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        r = requests.post(f'{base}/jobs', json={'url': 'http://s/a/', 'episodes': '1-2'}, timeout=5)
+        assert r.status_code == 201
+        job_id = r.json()['id']
+        wait_for(daemon.get(job_id))
+        assert requests.get(f'{base}/jobs/{job_id}', timeout=5).json()['completed'] == 2
+        assert [j['id'] for j in requests.get(f'{base}/jobs', timeout=5).json()] == [job_id]
+        assert requests.get(f'{base}/status', timeout=5).json()['jobs'] == {'done': 1}
+        assert requests.post(f'{base}/jobs', json={'name': 'x'}, timeout=5).status_code == 400
+        assert requests.delete(f'{base}/jobs/99', timeout=5).status_code == 404
+        assert requests.get(f'{base}/nope', timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_api_refuses_browsers_and_foreign_hosts(daemon, tmp_path):
+    daemon.start()
+    server = dmod.make_server(daemon, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    body = '{"url": "http://s/a/"}'
+    try:
+        # A no-cors fetch from a web page sends text/plain and an Origin
+        assert requests.post(f'{base}/jobs', data=body, headers={'Content-Type': 'text/plain'},
+                             timeout=5).status_code == 415
+        assert requests.post(f'{base}/shutdown', timeout=5).status_code == 415
+        assert requests.post(f'{base}/jobs', json={'url': 'http://s/a/'}, headers={'Origin': 'https://evil.test'},
+                             timeout=5).status_code == 403
+        assert requests.get(f'{base}/jobs', headers={'Host': 'evil.test:8765'}, timeout=5).status_code == 403
+        assert requests.post(f'{base}/jobs', json={'url': 'http://s/a/', 'output': '../../etc'},
+                             timeout=5).status_code == 400
+        assert daemon.jobs() == []
+        job = wait_for(daemon.submit('http://s/a/', output='shows'))
+        assert job.folder == str(tmp_path / 'shows' / 'a')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cli_without_daemon(capsys):
+    # Port 9 (discard) is closed on test machines
+    assert dmod.main(['--port', '9', 'status']) == 1
+    assert 'No daemon' in capsys.readouterr().err
+
+
+def test_restart_resumes_queued_jobs(daemon, tmp_path):
+    job = daemon.submit('http://s/a/', episodes='1-2')
+    restarted = dmod.Daemon(str(tmp_path), workers=1).start()
+    try:
+        resumed = wait_for(restarted.get(job.id))
+        assert (resumed.state, resumed.episodes, resumed.completed) == ('done', '1-2', 2)
+        store = dmod.jobstore.open_store(restarted.job_store)
+        assert [e['status'] for e in store.episodes(int(job.id))] == ['done', 'done']
+    finally:
+        restarted.stop()
+
+
+def test_shared_store_resumes_only_daemon_jobs(daemon, tmp_path):
+    store = dmod.jobstore.open_store(daemon.job_store)
+    gui = store.add_drama('http://s/gui/', '', str(tmp_path),
+                          dmod.jobstore.drama_config(dmod.jobstore.GUI_QUEUE, episode_list='1', download_all=False))
+    cli = store.open_drama('http://s/cli/', str(tmp_path), config=dmod.jobstore.drama_config(dmod.jobstore.CLI))
+    store.update_drama(cli, status='running')
+    own = daemon.submit('http://s/a/', episodes='2')
+    daemon.start()
+    assert wait_for(daemon.get(own.id)).state == 'done'
+    assert daemon.get(str(gui)) is None and daemon.get(str(cli)) is None
+    assert (store.drama(gui)['status'], store.drama(cli)['status']) == ('queued', 'running')
+    assert store.episodes(gui) == [] and store.episodes(cli) == []
@@ -0,0 +1,24 @@
+import io
+
+from src import dialogs
+
+
+def test_headless_messages_go_to_console(monkeypatch, capsys):
+    monkeypatch.setattr(dialogs, '_tk', lambda: None)
+    dialogs.show_info('Done', 'All saved')
+    dialogs.show_error('Error', 'Nothing found')
+    out = capsys.readouterr().out
+    assert 'All saved' in out and 'Nothing found' in out
+
+
+def test_headless_total_without_terminal_is_cancelled(monkeypatch):
+    monkeypatch.setattr(dialogs, '_tk', lambda: None)
+    monkeypatch.setattr(dialogs.sys, 'stdin', io.StringIO('5\n'))
+    assert dialogs.ask_total() is None
+
+
+def test_no_display_means_headless(monkeypatch):
+    monkeypatch.setattr(dialogs.sys, 'platform', 'linux')
+    monkeypatch.delenv('DISPLAY', raising=False)
+    monkeypatch.delenv('WAYLAND_DISPLAY', raising=False)
+    assert dialogs._tk() is None
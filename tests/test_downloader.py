@@ -1,21 +1,43 @@
 from src.downloader import download_episode, run_download
 import src.downloader as dlmod
+import hashlib
+import io
 import pytest
 import logging
+import threading
+
+from tests.helpers import FakeProc
 
 class DummyRes:
     def __init__(self, code):
         self.returncode = code
 
-class DummyPopen:
-    def __init__(self, *args, **kwargs):
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retry backoff sleeps are real time; skip them in tests
+    monkeypatch.setattr(dlmod.time, 'sleep', lambda s: None)
+
+def write_output(cmd):
+    # ffmpeg stages into cmd[-1]; an empty staging file is never promoted
+    with open(cmd[-1], 'wb') as f:
+        f.write(b'mp4')
+
+class DummyBar:
+    def __init__(self, *args, **kwargs): pass
+    def update(self, n=1): pass
+    def set_postfix_str(self, s): pass
+    def close(self): pass
+
+class DummyPopen(FakeProc):
+    def __init__(self, cmd, *args, **kwargs):
         self.returncode = 0
+        write_output(cmd)
     def communicate(self):
         return (b'', b'')
 
 def test_download_episode_no_manifest(tmp_path, capsys, monkeypatch):
     # No manifests => error message
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: set())
     args = ('Show', 1, 'http://x', str(tmp_path))
     download_episode(args)
@@ -26,7 +48,7 @@ def test_download_episode_no_manifest(tmp_path, capsys, monkeypatch):
 def test_download_episode_skip_existing(tmp_path, capsys, monkeypatch):
     # Manifest present but file exists => skip
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
     # Create existing file matching new naming scheme
     filename = tmp_path / 'Show - Episode 01 - Episode 1.mp4'
     filename.write_text('')
@@ -39,7 +61,7 @@ def test_download_episode_skip_existing(tmp_path, capsys, monkeypatch):
 def test_download_episode_success(tmp_path, capsys, monkeypatch):
     # Manifest present and file not exists => download
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
     # Stub subprocess.Popen to succeed
     monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopen)
     args = ('Show', 2, 'http://x', str(tmp_path))
@@ -51,13 +73,15 @@ def test_download_episode_success(tmp_path, capsys, monkeypatch):
 def test_download_episode_retry_success(tmp_path, capsys, monkeypatch):
     # Manifest present, first ffmpeg fails then retry succeeds
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
     call = {'count': 0}
-    class DummyPopenSeq:
-        def __init__(self, *args, **kwargs):
+    class DummyPopenSeq(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
             idx = call['count']
             call['count'] += 1
             self.returncode = 1 if idx == 0 else 0
+            if self.returncode == 0:
+                write_output(cmd)
         def communicate(self):
             return (b'', b'error' if self.returncode != 0 else b'')
     monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenSeq)
@@ -72,8 +96,8 @@ def test_download_episode_retry_success(tmp_path, capsys, monkeypatch):
 def test_download_episode_retry_failure(tmp_path, capsys, monkeypatch):
     # Manifest present, ffmpeg always fails
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
-    class DummyPopenFail:
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    class DummyPopenFail(FakeProc):
         def __init__(self, *args, **kwargs):
             self.returncode = 1
         def communicate(self):
@@ -92,13 +116,15 @@ def test_download_episode_title_extract(tmp_path, capsys, monkeypatch):
     # Manifest present and title extracted from HTML
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
     class DummyResponse:
+        url = None
         def __init__(self, text):
             self.text = text
         def raise_for_status(self): pass
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: DummyResponse('<html><head><title>My Title![]</title></head></html>'))
-    class DummyPopen2:
-        def __init__(self, *args, **kwargs):
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: DummyResponse('<html><head><title>My Title![]</title></head></html>'))
+    class DummyPopen2(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
             self.returncode = 0
+            write_output(cmd)
         def communicate(self):
             return (b'', b'')
     monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopen2)
@@ -113,7 +139,7 @@ def test_download_episode_title_extract(tmp_path, capsys, monkeypatch):
 def test_download_episode_manifest_error(tmp_path, capsys, monkeypatch):
     # get_manifest_urls raises error
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: (_ for _ in ()).throw(Exception('oops')))
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
     args = ('Show', 6, 'http://x', str(tmp_path))
     result = download_episode(args)
     captured = capsys.readouterr()
@@ -145,20 +171,18 @@ def test_run_download_single_episode(tmp_path, monkeypatch):
     monkeypatch.setattr(dlmod, 'banner', lambda: None)
     # Stub multiprocessing pool
     class DummyPool:
-        def __init__(self, workers): pass
+        def __init__(self, workers, **kwargs): pass
         def __enter__(self): return self
         def __exit__(self, exc_type, exc, tb): pass
+        def close(self): pass
+        def join(self): pass
         def imap_unordered(self, func, args_list): return [None for _ in args_list]
     monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool)
     # Stub tqdm to no-op
-    monkeypatch.setattr(dlmod, 'tqdm', lambda it, total=None, desc=None: it)
-    # Stub Tk and messagebox
-    class DummyTk:
-        def withdraw(self): pass
-        def destroy(self): pass
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
+    monkeypatch.setattr(dlmod, 'tqdm', DummyBar)
+    # Stub the completion dialog
     info = {}
-    monkeypatch.setattr(dlmod.messagebox, 'showinfo', lambda title, msg: info.update({'msg': msg}))
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, msg: info.update({'msg': msg}))
     run_download(url, name_input, str(tmp_path), download_all=False, episode_list=[], workers=1)
     # Expect one file saved
     assert '1 files saved' in info.get('msg', '')
@@ -169,12 +193,8 @@ def test_run_download_no_episodes_error(tmp_path, monkeypatch):
     url = 'http://example.com/'
     monkeypatch.setattr(dlmod, 'banner', lambda: None)
     monkeypatch.setattr(dlmod, 'find_episode_links', lambda x: [])
-    class DummyTk:
-        def withdraw(self): pass
-        def destroy(self): pass
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
     err = {}
-    monkeypatch.setattr(dlmod.messagebox, 'showerror', lambda title, msg: err.update({'msg': msg}))
+    monkeypatch.setattr(dlmod.dialogs, 'show_error', lambda title, msg: err.update({'msg': msg}))
     result = run_download(url, None, str(tmp_path), download_all=False, episode_list=[], workers=1)
     assert 'No episodes found' in err.get('msg', '')
     assert result is None
@@ -184,11 +204,7 @@ def test_run_download_download_all_no_input(tmp_path, monkeypatch):
     url = 'http://example.com/'
     monkeypatch.setattr(dlmod, 'banner', lambda: None)
     monkeypatch.setattr(dlmod, 'find_episode_links', lambda x: [])
-    monkeypatch.setattr(dlmod.simpledialog, 'askstring', lambda *args, **kwargs: None)
-    class DummyTk:
-        def withdraw(self): pass
-        def destroy(self): pass
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
+    monkeypatch.setattr(dlmod.dialogs, 'ask_total', lambda: None)
     result = run_download(url, None, str(tmp_path), download_all=True, episode_list=[], workers=1)
     assert result is None
 
@@ -197,21 +213,19 @@ def test_run_download_download_all_with_input(tmp_path, monkeypatch):
     url = 'http://example.com/'
     monkeypatch.setattr(dlmod, 'banner', lambda: None)
     monkeypatch.setattr(dlmod, 'find_episode_links', lambda x: [])
-    monkeypatch.setattr(dlmod.simpledialog, 'askstring', lambda *args, **kwargs: '2')
-    class DummyTk:
-        def withdraw(self): pass
-        def destroy(self): pass
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
+    monkeypatch.setattr(dlmod.dialogs, 'ask_total', lambda: '2')
     # Stub pool and tqdm and showinfo
     class DummyPool2:
-        def __init__(self, w): pass
+        def __init__(self, w, **kwargs): pass
         def __enter__(self): return self
         def __exit__(self, a,b,c): pass
+        def close(self): pass
+        def join(self): pass
         def imap_unordered(self, func, args_list): return [None]*len(args_list)
     monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool2)
-    monkeypatch.setattr(dlmod, 'tqdm', lambda it, total=None, desc=None: it)
+    monkeypatch.setattr(dlmod, 'tqdm', DummyBar)
     info2 = {}
-    monkeypatch.setattr(dlmod.messagebox, 'showinfo', lambda title, msg: info2.update({'msg': msg}))
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, msg: info2.update({'msg': msg}))
     run_download(url, None, str(tmp_path), download_all=True, episode_list=[], workers=1)
     assert '2 files saved' in info2.get('msg', '')
     assert str(tmp_path.joinpath('example_com')) in info2.get('msg', '')
@@ -223,20 +237,18 @@ def test_run_download_with_episode_list(tmp_path, monkeypatch):
     monkeypatch.setattr(dlmod, 'find_episode_links', lambda x: [])
     # Override expand_ranges to specific list
     monkeypatch.setattr(dlmod, 'expand_ranges', lambda lst: [1,3])
-    monkeypatch.setattr(dlmod.simpledialog, 'askstring', lambda *args, **kwargs: None)
-    class DummyTk:
-        def withdraw(self): pass
-        def destroy(self): pass
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
+    monkeypatch.setattr(dlmod.dialogs, 'ask_total', lambda: None)
     class DummyPool3:
-        def __init__(self, w): pass
+        def __init__(self, w, **kwargs): pass
         def __enter__(self): return self
         def __exit__(self, a,b,c): pass
+        def close(self): pass
+        def join(self): pass
         def imap_unordered(self, func, args_list): return [None]*len(args_list)
     monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool3)
-    monkeypatch.setattr(dlmod, 'tqdm', lambda it, total=None, desc=None: it)
+    monkeypatch.setattr(dlmod, 'tqdm', DummyBar)
     info3 = {}
-    monkeypatch.setattr(dlmod.messagebox, 'showinfo', lambda title, msg: info3.update({'msg': msg}))
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, msg: info3.update({'msg': msg}))
     run_download(url, None, str(tmp_path), download_all=False, episode_list=['1-3'], workers=1)
     assert '2 files saved' in info3.get('msg', '')
     assert str(tmp_path.joinpath('example_com')) in info3.get('msg', '')
@@ -244,8 +256,8 @@ def test_run_download_with_episode_list(tmp_path, monkeypatch):
 def test_download_episode_failure_no_retries(tmp_path, capsys, monkeypatch):
     # Manifest present but ffmpeg fails and no retries => error and final failure
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
-    class DummyPopenErr:
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    class DummyPopenErr(FakeProc):
         def __init__(self, *args, **kwargs):
             self.returncode = 1
         def communicate(self):
@@ -261,16 +273,254 @@ def test_download_episode_no_title(tmp_path, capsys, monkeypatch):
     # HTML missing title tag falls back to default
     html = '<html><head></head><body></body></html>'
     class DummyResponse2:
+        url = None
         def __init__(self, text): self.text = text
         def raise_for_status(self): pass
-    monkeypatch.setattr(dlmod.requests, 'get', lambda *args, **kwargs: DummyResponse2(html))
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: DummyResponse2(html))
     monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
-    class DummyPopenOK2:
-        def __init__(self, *args, **kwargs): self.returncode = 0
+    class DummyPopenOK2(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            self.returncode = 0
+            write_output(cmd)
         def communicate(self): return (b'', b'')
     monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenOK2)
     result = download_episode(('Show', 8, 'http://x', str(tmp_path)))
     captured = capsys.readouterr()
     assert result is True
     # Default title 'Episode 8' should appear in filename
-    assert 'Episode 08 - Episode 8.mp4' in captured.out 
\ No newline at end of file
+    assert 'Episode 08 - Episode 8.mp4' in captured.out 
+def test_download_episode_native_engine(tmp_path, capsys, monkeypatch):
+    # Native engine fetches the stream, then ffmpeg only remuxes the staged file
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    fetched = []
+    def fake_stream(m3u8, dest, concurrency=8, journal=None, controller=None):
+        fetched.append((m3u8, concurrency))
+        with open(dest, 'wb') as f:
+            f.write(b'ts')
+        return dlmod.hls.StreamResult(2, 1, 6.0, 'abc123')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', fake_stream)
+    cmds = []
+    class DummyPopenRemux(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            cmds.append(cmd)
+            self.returncode = 0
+            write_output(cmd)
+        def communicate(self): return (b'', b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenRemux)
+    result = download_episode(('Show', 9, 'http://x', str(tmp_path), 0, 0, {'engine': 'native', 'segment_workers': 4}))
+    assert result is True
+    assert fetched == [('http://x/media.m3u8', 4)]
+    assert cmds[0][3].endswith('.mp4.stream.part')
+    assert not list(tmp_path.glob('*.part*'))
+    assert 'Download complete' in capsys.readouterr().out
+    # Recorded against the remuxed file, not the deleted staging stream
+    entry = dlmod.CompletionIndex(str(tmp_path)).get(9)
+    assert entry['sha256'] == dlmod.file_sha256(entry['path']) != 'abc123'
+
+def audio_job(tmp_path, engine):
+    return dlmod.EpisodeJob(('Show', 11, 'http://x', str(tmp_path)), 11, 'http://x', 'http://x/lo.m3u8',
+                            str(tmp_path / 'Show - Episode 11.mp4'), engine, False, 0, {}, None, 'http://x/en.m3u8')
+
+def test_native_engine_muxes_separate_audio(tmp_path, monkeypatch):
+    fetched = []
+    def fake_stream(m3u8, dest, concurrency=8, journal=None, controller=None):
+        fetched.append(m3u8)
+        with open(dest, 'wb') as f:
+            f.write(b'ts')
+        return dlmod.hls.StreamResult(2, 1, 6.0, 'abc123')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', fake_stream)
+    cmds = []
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', lambda cmd, on_progress=None, stall_timeout=None:
+                        cmds.append(cmd) or write_output(cmd) or (0, ''))
+    assert dlmod.transfer_episode(audio_job(tmp_path, 'native'))
+    assert fetched == ['http://x/lo.m3u8', 'http://x/en.m3u8']
+    assert cmds[0][3].endswith('.mp4.stream.part') and cmds[0][5].endswith('.mp4.audio.part')
+    assert cmds[0][6:10] == ['-map', '0:v', '-map', '1:a']
+    assert not list(tmp_path.glob('*.part*'))
+
+def test_ffmpeg_engine_maps_separate_audio(tmp_path, monkeypatch):
+    cmds = []
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', lambda cmd, on_progress=None, stall_timeout=None:
+                        cmds.append(cmd) or write_output(cmd) or (0, ''))
+    assert dlmod.transfer_episode(audio_job(tmp_path, 'ffmpeg'))
+    assert cmds[0][2:10] == ['-i', 'http://x/lo.m3u8', '-i', 'http://x/en.m3u8', '-map', '0:v', '-map', '1:a']
+
+def test_download_episode_native_falls_back_to_ffmpeg(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/master.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    def fail_stream(*args, **kwargs):
+        raise dlmod.hls.HLSError('master playlist')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', fail_stream)
+    cmds = []
+    class DummyPopenNet(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            cmds.append(cmd)
+            self.returncode = 0
+            write_output(cmd)
+        def communicate(self): return (b'', b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenNet)
+    result = download_episode(('Show', 10, 'http://x', str(tmp_path), 0, 0, {'engine': 'native'}))
+    out = capsys.readouterr().out
+    assert result is True
+    assert 'falling back to ffmpeg' in out
+    assert cmds == [['ffmpeg', '-y', '-i', 'http://x/master.m3u8', '-c', 'copy', '-f', 'mp4',
+                     '-progress', 'pipe:1', '-nostats', cmds[0][-1]]]
+    assert cmds[0][-1].endswith('.mp4.part')
+
+def test_cancelled_transfer_does_not_fall_back_to_ffmpeg(tmp_path, monkeypatch):
+    def fake_stream(m3u8, dest, concurrency=8, journal=None, controller=None, cancelled=None):
+        assert not cancelled()
+        transfer.cancel()
+        assert cancelled()
+        # The drama folder is removed on cancel
+        raise OSError('No such file or directory')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', fake_stream)
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', lambda *args, **kwargs: pytest.fail('ffmpeg ran'))
+    transfer = dlmod.OwnedTransfer(dlmod.transfer_episode, 'drama-1')
+    registry = dlmod.metrics.reset()
+    assert transfer(audio_job(tmp_path, 'native')) is False
+    assert 'failures' not in registry.snapshot()['counters']
+    # Later transfers of the cancelled owner do not start at all
+    assert transfer(audio_job(tmp_path, 'ffmpeg')) is False
+
+
+def test_download_episode_reuses_cached_manifests(tmp_path, monkeypatch):
+    # Second run skips browser discovery while the cached manifest is valid
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    monkeypatch.setattr('src.manifest_cache.is_reachable', lambda url: True)
+    captures = []
+    def capture(url):
+        captures.append(url)
+        return {'http://x/media.m3u8'}
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', capture)
+    class DummyPopenCount(FakeProc):
+        calls = 0
+        def __init__(self, cmd, *args, **kwargs):
+            DummyPopenCount.calls += 1
+            self.returncode = 0
+            write_output(cmd)
+        def communicate(self): return (b'', b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenCount)
+    assert download_episode(('Show', 11, 'http://x/ep-11', str(tmp_path)))
+    (tmp_path / 'Show - Episode 11 - Episode 11.mp4').unlink(missing_ok=True)
+    assert download_episode(('Show', 11, 'http://x/ep-11', str(tmp_path)))
+    assert captures == ['http://x/ep-11']
+    assert DummyPopenCount.calls == 2
+
+def test_download_episode_static_manifest_skips_browser(tmp_path, capsys, monkeypatch):
+    html = '<html><head><title>Pilot</title></head><body><video src="https://cdn/ep12/index.m3u8"></video></body></html>'
+    class DummyPage:
+        text = html
+        url = None
+        def raise_for_status(self): pass
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: DummyPage())
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: pytest.fail('browser should not launch'))
+    cmds = []
+    class DummyPopenStatic(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            cmds.append(cmd)
+            self.returncode = 0
+            write_output(cmd)
+        def communicate(self): return (b'', b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenStatic)
+    assert download_episode(('Show', 12, 'https://site/ep-12', str(tmp_path)))
+    assert cmds[0][3] == 'https://cdn/ep12/index.m3u8'
+
+def test_download_episode_records_completion(tmp_path, monkeypatch):
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    class DummyPopenWrites(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            self.returncode = 0
+            with open(cmd[-1], 'wb') as f:
+                f.write(b'movie')
+        # The closing block may lack a time; the last one reported is the duration
+        def communicate(self): return (b'out_time_us=62500000\nprogress=continue\nout_time_us=N/A\nprogress=end\n',
+                                       b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenWrites)
+    assert download_episode(('Show', 13, 'http://x/ep-13', str(tmp_path)))
+    entry = dlmod.CompletionIndex(str(tmp_path)).get(13)
+    assert entry['size'] == 5
+    assert entry['duration'] == 62.5
+    # The hash is of the saved file, for the ffmpeg engine too
+    assert entry['sha256'] == hashlib.sha256(b'movie').hexdigest()
+    # Second run never touches the network
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: pytest.fail('should skip'))
+    assert download_episode(('Show', 13, 'http://x/ep-13', str(tmp_path)))
+
+def test_download_episode_failed_ffmpeg_leaves_no_output(tmp_path, monkeypatch):
+    # A killed or failed ffmpeg run must not leave a truncated .mp4 behind
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    class DummyPopenPartial(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            self.returncode = 255
+            write_output(cmd)
+        def communicate(self): return (b'', b'Connection reset')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenPartial)
+    assert download_episode(('Show', 14, 'http://x/ep-14', str(tmp_path))) is False
+    assert not list(tmp_path.glob('*.mp4*'))
+
+def test_download_episode_native_keeps_journal_for_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    journals = []
+    def interrupted_stream(m3u8, dest, concurrency=8, journal=None, controller=None):
+        journals.append(journal)
+        with open(dest, 'wb') as f:
+            f.write(b'seg0')
+        with open(journal, 'w') as f:
+            f.write('{}')
+        raise dlmod.requests.ConnectionError('reset')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', interrupted_stream)
+    class DummyPopenFail(FakeProc):
+        def __init__(self, cmd, *args, **kwargs): self.returncode = 1
+        def communicate(self): return (b'', b'fail')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenFail)
+    assert download_episode(('Show', 15, 'http://x/ep-15', str(tmp_path), 0, 0, {'engine': 'native'})) is False
+    assert journals[0].endswith('.mp4.stream.part.json')
+    # Staged segments survive for the next attempt; no final file appears
+    staged = sorted(p.name for p in tmp_path.glob('*.part*'))
+    assert [name.split('.mp4')[1] for name in staged] == ['.stream.part', '.stream.part.json']
+    assert not list(tmp_path.glob('*.mp4'))
+
+
+def test_kill_ffmpeg_only_stops_its_owner(monkeypatch):
+    released = {}
+    started = threading.Semaphore(0)
+    class BlockingProc:
+        def __init__(self, cmd, **kwargs):
+            self.pid = int(cmd[1])
+            self.returncode = None
+            released[self.pid] = threading.Event()
+            self.stderr = io.BytesIO(b'')
+        @property
+        def stdout(self):
+            # Read once the process is registered for cancellation
+            started.release()
+            released[self.pid].wait(5)
+            return iter(())
+        def wait(self):
+            self.returncode = -15
+            return self.returncode
+    killed = []
+    def killpg(pgid, sig):
+        killed.append(pgid)
+        released[pgid].set()
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', BlockingProc)
+    monkeypatch.setattr(dlmod.os, 'getpgid', lambda pid: pid)
+    monkeypatch.setattr(dlmod.os, 'killpg', killpg)
+    run = lambda pid: dlmod._run_ffmpeg(['ffmpeg', str(pid), 'out.mp4'], stall_timeout=None)
+    threads = [threading.Thread(target=dlmod.OwnedTransfer(run, owner), args=(pid,))
+               for pid, owner in ((101, 'a'), (202, 'b'))]
+    for t in threads:
+        t.start()
+    started.acquire(timeout=5)
+    started.acquire(timeout=5)
+    dlmod.kill_ffmpeg('a')
+    threads[0].join(5)
+    assert killed == [101] and threads[1].is_alive()
+    released[202].set()
+    threads[1].join(5)
+    assert not dlmod.FFMPEG_PROCS and not dlmod.FFMPEG_OWNERS
@@ -0,0 +1,76 @@
+from src import episode
+from src.episode import fetch_title, page_title, resolve_episode
+
+class StreamResp:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.consumed = 0
+        self.closed = False
+        self.encoding = 'utf-8'
+    def raise_for_status(self):
+        pass
+    def iter_content(self, chunk_size=None):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+    def close(self):
+        self.closed = True
+
+class PageResp:
+    def __init__(self, text):
+        self.text = text
+    def raise_for_status(self):
+        pass
+
+
+def test_page_title():
+    assert page_title('<html><head><TITLE>\n Tom &amp; Jerry  Ep 1 </TITLE>') == 'Tom & Jerry Ep 1'
+    assert page_title('<html><head></head>') is None
+    assert page_title(None) is None
+
+
+def test_fetch_title_reads_only_the_head(monkeypatch):
+    resp = StreamResp([b'<html><head><title>Pilot</ti', b'tle></head>', b'<body>' + b'x' * 10000, b'never'])
+    monkeypatch.setattr(episode.requests.Session, 'get', lambda self, url, timeout=None, stream=False: resp)
+    assert fetch_title('http://site/ep-1') == 'Pilot'
+    assert resp.consumed == 2
+    assert resp.closed
+
+
+def test_resolve_episode_single_page_load(monkeypatch):
+    calls = []
+    def fake_get(self, url, **kwargs):
+        calls.append(url)
+        return PageResp('<title>Ep 2</title><video src="https://cdn/2.m3u8">')
+    monkeypatch.setattr(episode.requests.Session, 'get', fake_get)
+    info = resolve_episode('http://site/ep-2', browser=lambda url: set())
+    assert info.title == 'Ep 2'
+    assert info.manifests == {'https://cdn/2.m3u8'}
+    assert info.tier == 'html'
+    assert calls == ['http://site/ep-2']
+
+
+def test_resolve_episode_with_known_manifests(monkeypatch):
+    monkeypatch.setattr(episode, 'fetch_title', lambda url: 'Cached Title')
+    info = resolve_episode('http://site/ep-3', {'https://cdn/3.m3u8'}, browser=lambda url: set())
+    assert info == episode.EpisodeInfo('http://site/ep-3', 'Cached Title', {'https://cdn/3.m3u8'}, 'cache')
+
+
+def test_browser_sites_load_each_later_page_once(monkeypatch):
+    gets, loads = [], []
+    def fake_get(self, url, **kwargs):
+        gets.append(url)
+        return PageResp('<title>Player</title>')
+    monkeypatch.setattr(episode.requests.Session, 'get', fake_get)
+    def browser(url, page=None):
+        loads.append(url)
+        if page is not None:
+            page['title'] = f'Title of {url}'
+        return {url + '.m3u8'}
+    first = resolve_episode('http://site/ep-1', browser=browser)
+    second = resolve_episode('http://site/ep-2', browser=browser)
+    assert (first.tier, first.title) == ('browser', 'Player')
+    assert (second.tier, second.title, second.manifests) == ('browser', 'Title of http://site/ep-2',
+                                                             {'http://site/ep-2.m3u8'})
+    # The second page skipped the static fetch: one load in the browser only
+    assert gets == ['http://site/ep-1'] and loads == ['http://site/ep-1', 'http://site/ep-2']
@@ -0,0 +1,196 @@
+import hashlib
+import os
+
+import pytest
+
+from src import hls
+from src.retry import RetryPolicy
+from src.playlist import parse_master_playlist, parse_media_playlist, select_variant
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:5
+#EXTINF:6.0,
+seg0.ts
+#EXTINF:6.0,
+seg1.ts
+#EXTINF:4.5,
+http://cdn/seg2.ts
+#EXT-X-ENDLIST
+"""
+
+class DummyResp:
+    def __init__(self, url, content=b'', text=''):
+        self.url = url
+        self.content = content
+        self.text = text
+    def raise_for_status(self):
+        pass
+
+class DummySession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append((url, headers))
+        body = self.pages[url]
+        if isinstance(body, str):
+            return DummyResp(url, text=body)
+        return DummyResp(url, content=body)
+
+
+def test_parse_media_playlist_segments():
+    playlist = parse_media_playlist(MEDIA, 'http://x/path/index.m3u8')
+    assert [s.uri for s in playlist.segments] == [
+        'http://x/path/seg0.ts', 'http://x/path/seg1.ts', 'http://cdn/seg2.ts']
+    assert playlist.segments[2].duration == 4.5
+    assert playlist.segments[0].sequence == 5
+    assert playlist.endlist
+
+
+def test_parse_media_playlist_byterange_and_key():
+    text = ('#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="k.bin",IV=0x00000000000000000000000000000001\n'
+            '#EXTINF:2,\n#EXT-X-BYTERANGE:100@0\nall.ts\n#EXTINF:2,\n#EXT-X-BYTERANGE:50\nall.ts\n')
+    segs = parse_media_playlist(text, 'http://x/a.m3u8').segments
+    assert segs[0].byterange == (100, 0)
+    assert segs[1].byterange == (50, 100)
+    assert segs[0].key.uri == 'http://x/k.bin'
+    assert segs[0].key.iv == (1).to_bytes(16, 'big')
+
+
+def test_encrypted_playlist_needs_cryptography(monkeypatch):
+    text = '#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="k.bin"\n#EXTINF:2,\nseg0.ts\n#EXT-X-ENDLIST\n'
+    monkeypatch.setattr(hls, 'crypto_available', lambda: False)
+    # HLSError sends the episode to the ffmpeg fallback
+    with pytest.raises(hls.HLSError, match='aes extra'):
+        hls.load_playlist(text, 'http://x/a.m3u8')
+    assert hls.load_playlist(MEDIA, 'http://x/a.m3u8').segments
+
+
+def test_download_stream_writes_in_order(tmp_path):
+    session = DummySession({
+        'http://x/path/index.m3u8': MEDIA,
+        'http://x/path/seg0.ts': b'AA',
+        'http://x/path/seg1.ts': b'BB',
+        'http://cdn/seg2.ts': b'CC',
+    })
+    dest = tmp_path / 'out.ts'
+    result = hls.download_stream('http://x/path/index.m3u8', str(dest), concurrency=3, session=session)
+    assert result.bytes == 6
+    assert result.segments == 3
+    assert result.duration == 16.5
+    assert dest.read_bytes() == b'AABBCC'
+    assert result.sha256 == hashlib.sha256(b'AABBCC').hexdigest()
+
+
+def test_download_stream_resumes_from_journal(tmp_path):
+    pages = {
+        'http://x/path/index.m3u8': MEDIA,
+        'http://x/path/seg0.ts': b'AA',
+        'http://x/path/seg1.ts': b'BB',
+        'http://cdn/seg2.ts': b'CC',
+    }
+    dest = tmp_path / 'out.ts'
+    journal = str(dest) + '.json'
+    class FlakySession(DummySession):
+        def get(self, url, headers=None, timeout=None):
+            if url == 'http://cdn/seg2.ts':
+                raise ConnectionError('reset')
+            return super().get(url, headers, timeout)
+    with pytest.raises(ConnectionError):
+        hls.download_stream('http://x/path/index.m3u8', str(dest), concurrency=1,
+                            session=FlakySession(pages), journal=journal, policy=RetryPolicy(0, 0, 0))
+    # Simulate a torn write after the last journaled segment
+    with open(dest, 'ab') as f:
+        f.write(b'garbage')
+    session = DummySession(pages)
+    result = hls.download_stream('http://x/path/index.m3u8', str(dest), concurrency=2,
+                                 session=session, journal=journal)
+    assert dest.read_bytes() == b'AABBCC'
+    assert result.sha256 == hashlib.sha256(b'AABBCC').hexdigest()
+    assert [url for url, _ in session.calls] == ['http://x/path/index.m3u8', 'http://cdn/seg2.ts']
+    assert not (tmp_path / 'out.ts.json').exists()
+
+
+def test_download_stream_stops_once_cancelled(tmp_path):
+    session = DummySession({
+        'http://x/path/index.m3u8': MEDIA,
+        'http://x/path/seg0.ts': b'AA',
+        'http://x/path/seg1.ts': b'BB',
+        'http://cdn/seg2.ts': b'CC',
+    })
+    dest = tmp_path / 'out.ts'
+    journal = str(dest) + '.json'
+    checks = iter([False])
+    with pytest.raises(hls.TransferCancelled):
+        hls.download_stream('http://x/path/index.m3u8', str(dest), concurrency=1, session=session,
+                            journal=journal, cancelled=lambda: next(checks, True))
+    # Not an HLSError: callers must not fall back to ffmpeg
+    assert not issubclass(hls.TransferCancelled, hls.HLSError)
+    assert dest.read_bytes() == b'AA'
+    assert os.path.exists(journal)
+
+
+def test_download_stream_ignores_journal_for_other_playlist(tmp_path):
+    dest = tmp_path / 'out.ts'
+    dest.write_bytes(b'OLDOLD')
+    journal = tmp_path / 'out.ts.json'
+    journal.write_text('{"playlist": [2, "/other/a.ts", "/other/b.ts"], "done": 1, "offset": 3}')
+    session = DummySession({
+        'http://x/path/index.m3u8': MEDIA,
+        'http://x/path/seg0.ts': b'AA',
+        'http://x/path/seg1.ts': b'BB',
+        'http://cdn/seg2.ts': b'CC',
+    })
+    hls.download_stream('http://x/path/index.m3u8', str(dest), session=session, journal=str(journal))
+    assert dest.read_bytes() == b'AABBCC'
+
+
+def test_download_stream_rejects_master(tmp_path):
+    session = DummySession({'http://x/master.m3u8': '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nv.m3u8\n'})
+    with pytest.raises(hls.HLSError):
+        hls.download_stream('http://x/master.m3u8', str(tmp_path / 'o.ts'), session=session)
+
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+360/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720
+720/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080
+1080/index.m3u8
+"""
+
+def test_parse_master_playlist():
+    variants = parse_master_playlist(MASTER, 'http://x/master.m3u8')
+    assert [v.uri for v in variants] == [
+        'http://x/360/index.m3u8', 'http://x/720/index.m3u8', 'http://x/1080/index.m3u8']
+    assert variants[0].resolution == (640, 360)
+    assert variants[0].codecs == 'avc1.4d401e,mp4a.40.2'
+    assert variants[2].bandwidth == 5000000
+
+
+def test_select_variant_policies():
+    variants = parse_master_playlist(MASTER, 'http://x/master.m3u8')
+    assert select_variant(variants).resolution == (1920, 1080)
+    assert select_variant(variants, 'smallest').resolution == (640, 360)
+    assert select_variant(variants, '720p').resolution == (1280, 720)
+    assert select_variant(variants, max_bandwidth=3000000).resolution == (1280, 720)
+    # Nothing fits the caps => smallest
+    assert select_variant(variants, '240p').resolution == (640, 360)
+    with pytest.raises(ValueError):
+        select_variant(variants, 'huge')
+
+
+def test_select_variant_skips_audio_only():
+    text = MASTER + '#EXT-X-STREAM-INF:BANDWIDTH=64000,CODECS="mp4a.40.2"\naudio.m3u8\n'
+    variants = parse_master_playlist(text, 'http://x/master.m3u8')
+    for policy in ('smallest', '240p'):
+        assert select_variant(variants, policy).uri == 'http://x/360/index.m3u8'
+    assert select_variant(variants, max_bandwidth=100000).uri == 'http://x/360/index.m3u8'
+    # A video codec without RESOLUTION still counts as video
+    untagged = parse_master_playlist('#EXT-X-STREAM-INF:BANDWIDTH=1,CODECS="avc1.64001f,mp4a.40.2"\nv.m3u8\n'
+                                     '#EXT-X-STREAM-INF:BANDWIDTH=0,CODECS="mp4a.40.2"\na.m3u8\n', 'http://x/')
+    assert select_variant(untagged, 'smallest').uri == 'http://x/v.m3u8'
+    # Audio-only masters still resolve
+    assert select_variant(untagged[1:]).uri == 'http://x/a.m3u8'
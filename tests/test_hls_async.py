@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from src import hls, hls_async
+from src.retry import RetryPolicy
+import src.downloader as dlmod
+from tests.helpers import FakeProc
+
+MEDIA = '#EXTM3U\n' + ''.join(f'#EXTINF:2,\nhttp://cdn{i % 2}/s{i}.ts\n' for i in range(10)) + '#EXT-X-ENDLIST\n'
+
+NO_RETRY = RetryPolicy(0, 0, 0)
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+class FakeResp:
+    def __init__(self, session, url, body):
+        self.session = session
+        self.url = url
+        self.body = body
+        self.content = FakeContent(body)
+    async def __aenter__(self):
+        host = self.url.split('/')[2]
+        self.session.active[host] = self.session.active.get(host, 0) + 1
+        self.session.peak[host] = max(self.session.peak.get(host, 0), self.session.active[host])
+        return self
+    async def __aexit__(self, *exc):
+        self.session.active[self.url.split('/')[2]] -= 1
+    def raise_for_status(self):
+        if self.body is None:
+            raise ConnectionError(self.url)
+    async def read(self):
+        await asyncio.sleep(0)
+        return self.body
+    async def text(self):
+        return self.body
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+        self.active = {}
+        self.peak = {}
+    def get(self, url, headers=None):
+        self.calls.append(url)
+        return FakeResp(self, url, self.pages.get(url))
+
+def pages():
+    result = {'http://x/index.m3u8': MEDIA}
+    result.update({f'http://cdn{i % 2}/s{i}.ts': bytes([65 + i]) * 3 for i in range(10)})
+    return result
+
+
+def test_async_stream_writes_in_order_within_host_limits(tmp_path):
+    session = FakeSession(pages())
+    dest = tmp_path / 'o.ts'
+    result = asyncio.run(hls_async.download_stream_async('http://x/index.m3u8', str(dest), concurrency=6,
+                                                         session=session, hosts=hls_async.HostLimits(2)))
+    expected = b''.join(bytes([65 + i]) * 3 for i in range(10))
+    assert dest.read_bytes() == expected
+    assert result.sha256 == hashlib.sha256(expected).hexdigest()
+    assert result.segments == 10 and result.duration == 20
+    assert max(session.peak['cdn0'], session.peak['cdn1']) <= 2
+
+
+def test_async_stream_resumes_from_journal(tmp_path):
+    broken = pages()
+    broken['http://cdn1/s7.ts'] = None
+    dest = tmp_path / 'o.ts'
+    journal = str(dest) + '.json'
+    with pytest.raises(ConnectionError):
+        asyncio.run(hls_async.download_stream_async('http://x/index.m3u8', str(dest), concurrency=1,
+                                                    session=FakeSession(broken), journal=journal, policy=NO_RETRY))
+    session = FakeSession(pages())
+    asyncio.run(hls_async.download_stream_async('http://x/index.m3u8', str(dest), session=session, journal=journal))
+    assert dest.read_bytes() == b''.join(bytes([65 + i]) * 3 for i in range(10))
+    assert session.calls[1:] == ['http://cdn1/s7.ts', 'http://cdn0/s8.ts', 'http://cdn1/s9.ts']
+
+
+def test_async_stream_stops_once_cancelled(tmp_path):
+    dest = tmp_path / 'o.ts'
+    checks = iter([False, False])
+    with pytest.raises(hls.TransferCancelled):
+        asyncio.run(hls_async.download_stream_async('http://x/index.m3u8', str(dest), concurrency=1,
+                                                    session=FakeSession(pages()), journal=str(dest) + '.json',
+                                                    cancelled=lambda: next(checks, True)))
+    assert dest.read_bytes() == b'AAABBB'
+
+
+def test_async_fetch_paces_through_limiter():
+    class Limiter:
+        def __init__(self):
+            self.reserved = []
+        def reserve(self, n):
+            self.reserved.append(n)
+            return 0.0
+    limiter = Limiter()
+    session = FakeSession({'http://cdn0/big.ts': b'x' * 100})
+    assert asyncio.run(hls_async._fetch(session, 'http://cdn0/big.ts', limiter=limiter)) == b'x' * 100
+    assert sum(limiter.reserved) == 100
+
+
+def test_sync_wrapper_requires_aiohttp(tmp_path, monkeypatch):
+    monkeypatch.setattr(hls_async, 'available', lambda: False)
+    with pytest.raises(hls.HLSError):
+        hls_async.download_stream('http://x/index.m3u8', str(tmp_path / 'o.ts'))
+
+
+def test_async_engine_falls_back_to_threads_without_aiohttp(tmp_path, monkeypatch):
+    monkeypatch.setattr(hls_async, 'available', lambda: False)
+    used = []
+    def threaded(m3u8, dest, concurrency=8, journal=None, controller=None):
+        used.append(concurrency)
+        with open(dest, 'wb') as f:
+            f.write(b'ts')
+        return hls.StreamResult(2, 1, 1.0, 'h')
+    monkeypatch.setattr(dlmod.hls, 'download_stream', threaded)
+    class DummyPopenRemux(FakeProc):
+        def __init__(self, cmd, *args, **kwargs):
+            self.returncode = 0
+            with open(cmd[-1], 'wb') as f:
+                f.write(b'mp4')
+        def communicate(self): return (b'', b'')
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', DummyPopenRemux)
+    assert dlmod._download_native(1, 'http://x/index.m3u8', str(tmp_path / 'a.mp4'), {}, 'async')
+    assert used == [8]
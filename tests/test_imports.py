@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds a bare ``import src`` may take; generous, it guards against eager imports creeping back
+IMPORT_BUDGET = 0.5
+
+
+def run_python(code):
+    # A fresh interpreter: conftest's stub tkinter must not hide real imports
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_import_src_is_lazy():
+    loaded = run_python(
+        "import sys, json, time\n"
+        "start = time.perf_counter()\n"
+        "import src\n"
+        "src.expand_ranges('1-2')\n"
+        "elapsed = time.perf_counter() - start\n"
+        "heavy = ['tkinter', 'bs4', 'requests', 'tqdm', 'colorama', 'art', 'src.downloader']\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': [m for m in heavy if m in sys.modules]}))\n")
+    assert loaded['loaded'] == []
+    assert loaded['elapsed'] < IMPORT_BUDGET
+
+
+def test_downloader_imports_without_tkinter():
+    loaded = run_python(
+        "import sys, json\n"
+        "sys.modules['tkinter'] = None  # as on a server without Tk libraries\n"
+        "import src\n"
+        "print(json.dumps({'run_download': callable(src.run_download), 'tk': 'tkinter' in sys.modules and sys.modules['tkinter'] is not None}))\n")
+    assert loaded == {'run_download': True, 'tk': False}
+
+
+def test_all_matches_lazy_exports():
+    import src
+    assert sorted(src.__all__) == sorted(src._EXPORTS)
+
+
+def test_unknown_attribute_raises():
+    import src
+    with pytest.raises(AttributeError, match='no_such_name'):
+        src.no_such_name
@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+
+from src import jobstore
+from src.jobstore import JobStore
+
+
+def test_uses_wal(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    assert store._conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_queue_order(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    a = store.add_drama('http://x/a', 'A', 'out', {'workers': 2})
+    b = store.add_drama('http://x/b', 'B', 'out')
+    c = store.add_drama('http://x/c', 'C', 'out')
+    store.move_drama(c, -1)
+    assert [d['id'] for d in store.dramas()] == [a, c, b]
+    store.move_drama(a, -1)
+    assert [d['id'] for d in store.dramas()] == [a, c, b]
+    store.remove_drama(c)
+    assert [d['name'] for d in store.dramas()] == ['A', 'B']
+    assert store.drama(a)['config']['workers'] == 2
+    assert store.open_drama('http://x/b', 'out') == b
+    assert store.open_drama('http://x/b', 'elsewhere') not in (a, b, c)
+
+
+def test_attempt_lifecycle(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    drama = store.add_drama('http://x/a')
+    store.add_episodes(drama, [(1, 'http://x/a/ep-1'), (2, 'http://x/a/ep-2')])
+    first = store.begin_attempt(drama, 1)
+    # The transfer stage continues the attempt its resolve stage opened
+    assert store.begin_attempt(drama, 1) == first
+    store.finish_attempt(drama, 1, jobstore.STALLED, error='transfer stalled')
+    store.begin_attempt(drama, 1)
+    store.finish_attempt(drama, 1, jobstore.DONE, 1024, 'out/1.mp4')
+    store.begin_attempt(drama, 2)
+    store.finish_attempt(drama, 2, jobstore.FAILED, error='HTTP 404')
+    episodes = {e['num']: e for e in store.episodes(drama)}
+    assert (episodes[1]['status'], episodes[1]['attempts'], episodes[1]['bytes']) == ('done', 2, 1024)
+    assert episodes[1]['path'] == 'out/1.mp4' and episodes[1]['finished']
+    assert (episodes[2]['status'], episodes[2]['last_error']) == ('failed', 'HTTP 404')
+    assert [a['status'] for a in store.attempts(drama, 1)] == ['stalled', 'done']
+    assert store.summary(drama) == {'done': 1, 'failed': 1}
+
+
+def test_recover_after_crash(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = JobStore(path)
+    drama = store.add_drama('http://x/a')
+    store.update_drama(drama, status=jobstore.RUNNING)
+    store.add_episodes(drama, [(1, 'u1'), (2, 'u2')])
+    store.begin_attempt(drama, 1)
+    store.finish_attempt(drama, 1, jobstore.DONE, 10)
+    store.begin_attempt(drama, 2)
+    # Killed mid-attempt: a fresh process opens the same file
+    reopened = JobStore(path)
+    assert reopened.recover() == 1
+    assert reopened.drama(drama)['status'] == 'queued'
+    assert {e['num']: e['status'] for e in reopened.episodes(drama)} == {1: 'done', 2: 'pending'}
+    assert [a['status'] for a in reopened.attempts(drama, 2)] == ['interrupted']
+
+
+def test_recover_one_drama(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    a, b = store.add_drama('http://x/a'), store.add_drama('http://x/b')
+    store.begin_attempt(a, 1)
+    store.begin_attempt(b, 1)
+    assert store.recover(a) == 1
+    assert store.episodes(b)[0]['status'] == 'running'
+
+
+def test_update_drama_rejects_unknown_fields(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    drama = store.add_drama('http://x/a')
+    try:
+        store.update_drama(drama, id=5)
+    except ValueError as e:
+        assert 'id' in str(e)
+    else:
+        raise AssertionError('expected ValueError')
+
+
+def test_import_legacy_queue(tmp_path):
+    legacy = tmp_path / 'drama_queue.json'
+    legacy.write_text(json.dumps([{'url': 'http://x/a', 'name': 'A', 'output': 'out', 'workers': 4}]))
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    assert store.import_queue(str(legacy)) == 1
+    assert store.import_queue(str(legacy)) == 0
+    assert os.path.exists(str(legacy) + '.imported')
+    drama = store.dramas()[0]
+    assert (drama['url'], drama['name'], drama['config']['workers']) == ('http://x/a', 'A', 4)
+
+
+def test_open_store_is_shared_per_process(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    assert jobstore.open_store(path) is jobstore.open_store(path)
+    jobstore.open_store(path).add_drama('http://x/a')
+    # Readers on other connections see committed rows
+    assert sqlite3.connect(path).execute('SELECT COUNT(*) FROM dramas').fetchone()[0] == 1
+
+
+def test_configs_share_one_schema_and_keep_their_source(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    queued = store.add_drama('http://x/a', 'A', 'out', jobstore.drama_config(jobstore.GUI_QUEUE, workers=2,
+                                                                             colour='red'))
+    store.open_drama('http://x/b', 'out', config=jobstore.drama_config(jobstore.CLI, episode_list='1-3',
+                                                                       download_all=False))
+    # Rows from older versions and other tools may lack keys or carry odd types
+    old = store.add_drama('http://x/c', 'C', 'out', {'episodes': '2', 'engine': 'native'})
+    legacy = store.add_drama('http://x/d', 'D', 'out', {'workers': 'many'})
+    assert [d['id'] for d in store.dramas(source=jobstore.GUI_QUEUE)] == [queued, legacy]
+    config = store.drama(queued)['config']
+    assert (config['url'], config['workers'], config['retries'], config['source']) == ('http://x/a', 2, 0, 'gui_queue')
+    assert 'colour' not in config
+    assert store.dramas(source=jobstore.CLI)[0]['config']['episode_list'] == '1-3'
+    daemon, = store.dramas(source=jobstore.DAEMON)
+    assert daemon['id'] == old
+    assert (daemon['config']['episode_list'], daemon['config']['download_all'], daemon['config']['engine']) == \
+        ('2', False, 'native')
+    assert store.dramas()[-1]['config']['workers'] == 4
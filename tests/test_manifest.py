@@ -1,7 +1,15 @@
 import time
-from src.manifest import get_manifest_urls
+from src.manifest import (
+    extract_manifest_urls,
+    get_manifest_urls,
+    resolve_manifests,
+    resolve_streams,
+    static_manifests,
+)
 import sys
 import types
+import pytest
+import requests
 
 class DummyReq:
     def __init__(self, url, headers):
@@ -31,6 +39,15 @@ def test_get_manifest_urls_filters(monkeypatch):
     assert 'http://x/stream1' in manifests
     assert 'http://x/other.ts' not in manifests
 
+def test_get_manifest_urls_reports_page_title(monkeypatch):
+    class TitledDriver(DummyDriver):
+        title = ' Show \n Ep 5 '
+    monkeypatch.setattr('seleniumwire.webdriver.Chrome', lambda *args, **kwargs: TitledDriver(), raising=True)
+    monkeypatch.setattr(time, 'sleep', lambda x: None)
+    page = {}
+    assert 'http://x/media.m3u8' in get_manifest_urls('http://test', wait=0, page=page)
+    assert page == {'title': 'Show Ep 5'}
+
 # Edge: no requests
 class EmptyDriver(DummyDriver):
     def __init__(self):
@@ -79,4 +96,135 @@ def test_get_manifest_urls_autoplay_exception(monkeypatch, capsys):
     # Should still filter manifests from DummyDriverExec.requests
     assert 'http://x/media.m3u8' in manifests
     assert 'http://x/stream1' in manifests
-    assert 'http://x/other.ts' not in manifests 
\ No newline at end of file
+    assert 'http://x/other.ts' not in manifests 
+
+class DummyPlaylistResp:
+    def __init__(self, text, url=None):
+        self.text = text
+        self.url = url
+    def raise_for_status(self):
+        pass
+
+def test_resolve_manifest_picks_variant(monkeypatch):
+    pages = {
+        'http://x/master.m3u8': ('#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=854x480\nlo.m3u8\n'
+                                 '#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\nmid.m3u8\n'
+                                 '#EXT-X-STREAM-INF:BANDWIDTH=6000000,RESOLUTION=1920x1080\nhi.m3u8\n'),
+        'http://ads/ad.m3u8': '#EXTM3U\n#EXTINF:15,\nad.ts\n#EXT-X-ENDLIST\n',
+    }
+    monkeypatch.setattr('src.manifest.requests.Session.get', lambda self, url, timeout=None: DummyPlaylistResp(pages[url]))
+    assert resolve_streams(set(pages))[0] == 'http://x/hi.m3u8'
+    assert resolve_streams(set(pages), '720p')[0] == 'http://x/mid.m3u8'
+    assert resolve_streams(set(pages), 'smallest')[0] == 'http://x/lo.m3u8'
+
+def test_resolve_streams_pairs_variant_with_its_audio(monkeypatch):
+    pages = {
+        'http://x/master.m3u8': ('#EXTM3U\n'
+                                 '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="es",URI="audio/es.m3u8"\n'
+                                 '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="en",DEFAULT=YES,URI="audio/en.m3u8"\n'
+                                 '#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=854x480,AUDIO="aud"\nlo.m3u8\n'
+                                 '#EXT-X-STREAM-INF:BANDWIDTH=6000000,RESOLUTION=1920x1080,AUDIO="aud"\nhi.m3u8\n'),
+    }
+    monkeypatch.setattr('src.manifest.requests.Session.get', lambda self, url, timeout=None: DummyPlaylistResp(pages[url]))
+    assert resolve_streams(set(pages), 'smallest') == ('http://x/lo.m3u8', 'http://x/audio/en.m3u8')
+    # The quality policy holds even with separate audio: never the master playlist
+    assert resolve_streams(set(pages), '720p')[0] == 'http://x/lo.m3u8'
+    assert resolve_streams(set()) == (None, None)
+
+def test_resolve_manifest_skips_short_ad_playlists(monkeypatch):
+    pages = {
+        'http://ads/ad.m3u8': '#EXTM3U\n#EXTINF:15,\nad.ts\n#EXT-X-ENDLIST\n',
+        'http://x/media.m3u8': '#EXTM3U\n#EXTINF:600,\na.ts\n#EXTINF:600,\nb.ts\n#EXT-X-ENDLIST\n',
+    }
+    monkeypatch.setattr('src.manifest.requests.Session.get', lambda self, url, timeout=None: DummyPlaylistResp(pages[url]))
+    assert resolve_streams(set(pages))[0] == 'http://x/media.m3u8'
+
+def test_resolve_manifest_unreachable_falls_back(monkeypatch):
+    def fail(self, url, timeout=None):
+        raise requests.RequestException('down')
+    monkeypatch.setattr('src.manifest.requests.Session.get', fail)
+    assert resolve_streams({'http://b/2.m3u8', 'http://a/1.m3u8'})[0] == 'http://a/1.m3u8'
+    assert resolve_streams(set())[0] is None
+
+def test_resolve_streams_follows_redirects_for_relative_uris(monkeypatch):
+    master = ('#EXTM3U\n#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="a",URI="en.m3u8"\n'
+              '#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=854x480,AUDIO="a"\nlo.m3u8\n')
+    monkeypatch.setattr('src.manifest.requests.Session.get',
+                        lambda self, url, timeout=None: DummyPlaylistResp(master, 'http://edge/7/master.m3u8'))
+    assert resolve_streams({'http://x/master.m3u8'}) == ('http://edge/7/lo.m3u8', 'http://edge/7/en.m3u8')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+    def monotonic(self):
+        return self.now
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+class LateDriver(DummyDriver):
+    """Playlist request shows up after the page has been polled a few times."""
+    def __init__(self, clock, appear_at, sibling_at=None):
+        self.clock = clock
+        self.appear_at = appear_at
+        self.sibling_at = sibling_at
+    @property
+    def requests(self):
+        reqs = []
+        if self.clock.now >= self.appear_at:
+            reqs.append(DummyReq('http://x/master.m3u8', {}))
+        if self.sibling_at is not None and self.clock.now >= self.sibling_at:
+            reqs.append(DummyReq('http://x/720.m3u8', {}))
+        return reqs
+
+def test_get_manifest_urls_returns_early(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(time, 'sleep', clock.sleep)
+    monkeypatch.setattr(sys.modules['seleniumwire.webdriver'], 'Chrome', lambda *args, **kwargs: LateDriver(clock, 0.5, 1.0))
+    manifests = get_manifest_urls('http://test', wait=10, settle=1.0)
+    assert manifests == {'http://x/master.m3u8', 'http://x/720.m3u8'}
+    # Found at 0.5s, settled for 1s: nowhere near the 10s deadline
+    assert clock.now == pytest.approx(1.5)
+
+def test_get_manifest_urls_deadline(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(time, 'sleep', clock.sleep)
+    monkeypatch.setattr(sys.modules['seleniumwire.webdriver'], 'Chrome', lambda *args, **kwargs: LateDriver(clock, 99))
+    assert get_manifest_urls('http://test', wait=3) == set()
+    assert clock.now == pytest.approx(3.0)
+
+
+def test_extract_manifest_urls_html_and_json():
+    html = ('<video src="/hls/ep1.m3u8?t=1&amp;s=2"></video>'
+            '<script>var cfg = {"file":"https:\\/\\/cdn.example\\/v\\/master.m3u8"};</script>')
+    assert extract_manifest_urls(html, 'https://site.test/show/ep-1') == {
+        'https://site.test/hls/ep1.m3u8?t=1&s=2', 'https://cdn.example/v/master.m3u8'}
+
+def test_static_manifests_follows_iframe(monkeypatch):
+    pages = {'https://player.test/embed/9': '<script>src: "https://cdn/9/index.m3u8"</script>'}
+    seen = []
+    def fake_get(self, url, headers=None, timeout=None):
+        seen.append((url, headers))
+        return DummyPlaylistResp(pages[url])
+    monkeypatch.setattr('src.manifest.requests.Session.get', fake_get)
+    html = '<html><iframe width="640" src="https://player.test/embed/9"></iframe></html>'
+    manifests, tier = static_manifests('https://site.test/ep-9', html)
+    assert manifests == {'https://cdn/9/index.m3u8'}
+    assert tier == 'iframe'
+    assert seen == [('https://player.test/embed/9', {'Referer': 'https://site.test/ep-9'})]
+
+def test_resolve_manifests_tiers(monkeypatch):
+    calls = []
+    def browser(url, **kwargs):
+        calls.append((url, kwargs))
+        return {'http://x/from-browser.m3u8'}
+    manifests, tier = resolve_manifests('http://site/ep', '<a href="x/a.m3u8">', browser=browser)
+    assert (manifests, tier) == ({'http://site/x/a.m3u8'}, 'html')
+    assert calls == []
+    manifests, tier = resolve_manifests('http://site/ep', '<p>nothing</p>', browser=browser, wait=5)
+    assert (manifests, tier) == ({'http://x/from-browser.m3u8'}, 'browser')
+    assert calls == [('http://site/ep', {'wait': 5})]
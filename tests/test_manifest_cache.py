@@ -0,0 +1,70 @@
+import json
+import threading
+
+import pytest
+import requests
+
+import src.manifest_cache as mcmod
+from src.manifest_cache import ManifestCache, url_expiry
+
+class DummyStatus:
+    def __init__(self, code):
+        self.status_code = code
+    def close(self):
+        pass
+
+@pytest.fixture
+def reachable(monkeypatch):
+    monkeypatch.setattr(mcmod.requests.Session, 'head', lambda *args, **kwargs: DummyStatus(200))
+
+
+def test_url_expiry_variants():
+    assert url_expiry('http://cdn/a.m3u8?Expires=1900000000&Signature=x') == 1900000000
+    assert url_expiry('http://cdn/a.m3u8?hdnts=st=1~exp=1900000000~acl=/*') == 1900000000
+    assert url_expiry('http://cdn/a.m3u8?exp=1900000000123') == pytest.approx(1900000000.123)
+    assert url_expiry('http://cdn/a.m3u8?episode=12') is None
+
+
+def test_cache_round_trip(tmp_path, reachable):
+    path = str(tmp_path / 'cache.json')
+    ManifestCache(path).put('http://site/ep-1', {'http://cdn/1.m3u8'})
+    # A fresh instance reads what the previous run wrote
+    assert ManifestCache(path).get('http://site/ep-1') == {'http://cdn/1.m3u8'}
+    entry = json.loads((tmp_path / 'cache.json').read_text())['http://site/ep-1']
+    assert entry['expires'] == pytest.approx(entry['captured'] + mcmod.DEFAULT_TTL)
+
+
+def test_cache_honours_signed_expiry(tmp_path, reachable, monkeypatch):
+    cache = ManifestCache(str(tmp_path / 'cache.json'), ttl=10**9)
+    cache.put('http://site/ep-2', {'http://cdn/2.m3u8?expires=1900000000'})
+    monkeypatch.setattr(mcmod.time, 'time', lambda: 1900000001)
+    assert cache.get('http://site/ep-2') is None
+
+
+def test_cache_drops_unreachable_entries(tmp_path, monkeypatch):
+    cache = ManifestCache(str(tmp_path / 'cache.json'))
+    cache.put('http://site/ep-3', {'http://cdn/3.m3u8'})
+    monkeypatch.setattr(mcmod.requests.Session, 'head', lambda *args, **kwargs: DummyStatus(403))
+    assert cache.get('http://site/ep-3') is None
+    # Entry was discarded, so even an unvalidated lookup misses
+    assert cache.get('http://site/ep-3', validate=False) is None
+
+
+def test_head_not_allowed_falls_back_to_get(monkeypatch):
+    monkeypatch.setattr(mcmod.requests.Session, 'head', lambda *args, **kwargs: DummyStatus(405))
+    monkeypatch.setattr(mcmod.requests.Session, 'get', lambda *args, **kwargs: DummyStatus(200))
+    assert mcmod.is_reachable('http://cdn/x.m3u8')
+    monkeypatch.setattr(mcmod.requests.Session, 'head', lambda *args, **kwargs: (_ for _ in ()).throw(requests.ConnectionError()))
+    assert not mcmod.is_reachable('http://cdn/x.m3u8')
+
+
+def test_concurrent_puts_from_separate_instances(tmp_path, reachable):
+    path = str(tmp_path / 'cache.json')
+    threads = [threading.Thread(target=lambda n=n: ManifestCache(path).put(f'http://site/ep-{n}',
+                                                                          {f'http://cdn/{n}.m3u8'}))
+               for n in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(json.loads((tmp_path / 'cache.json').read_text())) == 50
@@ -0,0 +1,107 @@
+import json
+import queue
+
+import pytest
+
+from src import metrics
+from src.metrics import Registry, Sample
+import src.downloader as dlmod
+from tests.helpers import make_job
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    metrics.install(None)
+    yield metrics.reset()
+    metrics.install(None)
+
+
+def test_registry_totals_per_session_and_episode():
+    registry = Registry()
+    registry.record(Sample(1, 'timer', 'transfer', 2.0))
+    registry.record(Sample(2, 'timer', 'transfer', 3.0))
+    registry.record(Sample(1, 'counter', 'bytes', 100))
+    registry.record(Sample(None, 'timer', 'scrape', 0.5))
+    data = registry.snapshot()
+    assert data['stages'] == {'scrape': {'count': 1, 'seconds': 0.5}, 'transfer': {'count': 2, 'seconds': 5.0}}
+    assert data['counters'] == {'bytes': 100}
+    assert data['episodes']['1'] == {'timers': {'transfer': 2.0}, 'counters': {'bytes': 100}}
+
+
+def test_timer_and_count_attribute_to_current_episode(fresh_session):
+    with metrics.episode(4):
+        with metrics.timer('manifest'):
+            pass
+        metrics.count('retries', 2)
+    metrics.count('retries', 0)
+    data = fresh_session.snapshot()
+    assert data['episodes']['4']['counters'] == {'retries': 2}
+    assert data['stages']['manifest']['count'] == 1
+
+
+def test_samples_forward_to_sink():
+    sink = queue.Queue()
+    metrics.install(sink.put)
+    metrics.count('failures', num=3)
+    assert sink.get_nowait() == Sample(3, 'counter', 'failures', 1)
+    assert metrics.current().snapshot()['counters'] == {}
+
+
+def test_series_keep_their_episodes_apart(fresh_session):
+    for series, nbytes in (('out/A', 10), ('out/B/', 20)):
+        with metrics.episode(1, series):
+            metrics.count('bytes', nbytes)
+            with metrics.timer('transfer'):
+                pass
+    data = fresh_session.snapshot()
+    assert data['counters'] == {'bytes': 30} and data['stages']['transfer']['count'] == 2
+    assert data['episodes'] == {}
+    assert data['series']['out/A']['episodes']['1']['counters'] == {'bytes': 10}
+    only_b = fresh_session.snapshot('out/B')
+    assert only_b['counters'] == {'bytes': 20} and only_b['stages']['transfer']['count'] == 1
+    assert only_b['episodes']['1']['counters'] == {'bytes': 20}
+
+
+def test_prometheus_textfile(tmp_path):
+    path = tmp_path / 'novastream.prom'
+    registry = Registry(textfile=str(path))
+    registry.record(Sample(1, 'timer', 'transfer', 1.5))
+    registry.record(Sample(1, 'counter', 'bytes', 2048))
+    registry.write_textfile()
+    text = path.read_text()
+    assert 'novastream_stage_seconds_total{stage="transfer"} 1.5' in text
+    assert 'novastream_bytes_total 2048' in text
+
+
+def test_transfer_records_stages_and_counters(tmp_path, monkeypatch, fresh_session):
+    def ffmpeg(cmd, on_progress=None, stall_timeout=None):
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'movie')
+        return 0, ''
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', ffmpeg)
+    assert dlmod.transfer_episode(make_job(tmp_path))
+    path = tmp_path / metrics.METRICS_FILE
+    fresh_session.write_json(str(path), series=str(tmp_path))
+    data = json.loads(path.read_text())
+    assert data['episodes']['1']['counters'] == {'bytes': 5, 'completed': 1}
+    assert set(data['episodes']['1']['timers']) == {'postprocess', 'transfer'}
+
+
+def test_failed_reresolve_counts_one_failure(tmp_path, monkeypatch, fresh_session):
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', lambda cmd, on_progress=None, stall_timeout=None:
+                        (1, 'Server returned 403 Forbidden (access denied)'))
+    # The resolve stage counts its own failure, as _resolve_job does
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: metrics.count('failures') or False)
+    assert dlmod.transfer_episode(make_job(tmp_path)) is False
+    assert fresh_session.snapshot()['counters']['failures'] == 1
+
+
+def test_samples_sent_while_workers_exit_are_recorded(monkeypatch, fresh_session):
+    monkeypatch.setattr(dlmod, 'tqdm', lambda *args, **kwargs: type('Bar', (), {
+        'update': lambda self, n=1: None, 'set_postfix_str': lambda self, s: None, 'close': lambda self: None})())
+    events = queue.Queue()
+    def finish():
+        # A worker's last sample lands only as the pool is joined
+        events.put(Sample(1, 'counter', 'bytes', 10))
+    assert list(dlmod._track_progress(iter([True]), 1, events, finish=finish)) == [True]
+    assert fresh_session.snapshot()['counters'] == {'bytes': 10}
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import src.downloader as dlmod
+from src.pipeline import run_pipeline
+
+
+def test_pipeline_resolves_then_transfers():
+    transferred = []
+    def resolve(n):
+        return True if n == 0 else ('job', n)
+    def transfer(job):
+        transferred.append(job[1])
+        return job[1] % 2 == 1
+    results = list(run_pipeline(range(5), resolve, transfer, resolvers=2, transfers=3))
+    assert sorted(results) == [False, False, True, True, True]
+    assert sorted(transferred) == [1, 2, 3, 4]
+
+
+def test_pipeline_bounds_lookahead():
+    state = {'resolved': 0, 'transferred': 0, 'max_ahead': 0}
+    lock = threading.Lock()
+    def resolve(n):
+        with lock:
+            state['resolved'] += 1
+            ahead = state['resolved'] - state['transferred']
+            state['max_ahead'] = max(state['max_ahead'], ahead)
+        return n
+    def transfer(n):
+        time.sleep(0.005)
+        with lock:
+            state['transferred'] += 1
+        return True
+    assert all(run_pipeline(range(20), resolve, transfer, resolvers=2, transfers=1, lookahead=2))
+    # queued jobs + one in transfer + one per resolver waiting to enqueue
+    assert state['max_ahead'] <= 2 + 1 + 2
+
+
+def test_pipeline_refreshes_and_survives_errors():
+    def resolve(n):
+        if n == 3:
+            raise RuntimeError('browser crashed')
+        return n
+    refreshed = []
+    def refresh(n):
+        refreshed.append(n)
+        return False if n == 2 else n
+    results = list(run_pipeline(range(4), resolve, lambda n: True, refresh=refresh))
+    assert sorted(results) == [False, False, True, True]
+    assert sorted(refreshed) == [0, 1, 2]
+
+
+def test_refresh_episode_job_re_resolves_expiring_manifest(tmp_path, monkeypatch):
+    job = dlmod.EpisodeJob(('Show', 1, 'http://x', str(tmp_path)), 1, 'http://x', 'http://cdn/a.m3u8',
+                           str(tmp_path / 'a.mp4'), 'ffmpeg', False, 0, {}, time.time() + 10)
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: 'fresh')
+    assert dlmod.refresh_episode_job(job) == 'fresh'
+    later = job._replace(expires=time.time() + 3600)
+    assert dlmod.refresh_episode_job(later) is later
+    unsigned = job._replace(expires=None)
+    assert dlmod.refresh_episode_job(unsigned) is unsigned
+
+
+def test_run_download_pipelined(monkeypatch, tmp_path):
+    monkeypatch.setattr(dlmod, 'banner', lambda: None)
+    monkeypatch.setattr(dlmod, 'find_episode_links', lambda url: [(1, 'http://s/ep-1'), (2, 'http://s/ep-2')])
+    monkeypatch.setattr(dlmod.browser_pool, 'configure', lambda size=1, max_uses=25: None)
+    monkeypatch.setattr(dlmod.mp, 'Pool', lambda *a, **k: (_ for _ in ()).throw(AssertionError('no process pool')))
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: ('job', args[1]))
+    transferred = []
+    monkeypatch.setattr(dlmod, 'transfer_episode', lambda job: transferred.append(job[1]) or True)
+    monkeypatch.setattr(dlmod, 'refresh_episode_job', lambda job: job)
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, text: None)
+    dlmod.run_download('http://s/show', 'Show', str(tmp_path), True, '', 3, resolvers=1)
+    assert sorted(transferred) == [1, 2]
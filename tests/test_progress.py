@@ -0,0 +1,89 @@
+import io
+import queue
+import time
+
+from src import progress
+from src.progress import Progress, ProgressParser, ProgressTracker
+import src.downloader as dlmod
+
+BLOCK = b'frame=10\nout_time_us=30000000\ntotal_size=4096\nspeed=2.5x\nprogress=continue\n'
+END = b'out_time_us=60000000\ntotal_size=8192\nspeed=N/A\nprogress=end\n'
+
+
+def test_parser_emits_one_event_per_block():
+    parser = ProgressParser(num=3)
+    parser.duration = 120.0
+    events = [parser.feed(line) for line in (BLOCK + END).decode().splitlines()]
+    events = [e for e in events if e]
+    assert events == [Progress(3, 30.0, 120.0, 4096, 2.5, False), Progress(3, 60.0, 120.0, 8192, None, True)]
+
+
+def test_parse_duration():
+    assert progress.parse_duration('  Duration: 01:02:03.50, start: 0.000000, bitrate: 900 kb/s') == 3723.5
+    assert progress.parse_duration('Stream #0:0: Video: h264') is None
+
+
+def test_tracker_counts_partial_episodes_until_done():
+    tracker = ProgressTracker()
+    assert tracker.update(Progress(1, 30.0, 120.0, 0, 2.0, False)) == 0.25
+    assert tracker.update(Progress(2, 60.0, 120.0, 0, 1.0, False)) == 0.5
+    assert tracker.describe() == '2 active, 3.0x'
+    # The finished episode's share is handed back to its result
+    assert tracker.update(Progress(1, 120.0, 120.0, 0, None, True)) == -0.25
+    assert tracker.partial == 0.5
+
+
+class ProgressProc:
+    def __init__(self, cmd, *args, **kwargs):
+        self.cmd = cmd
+        self.returncode = 0
+        self.stdout = io.BytesIO(BLOCK + END)
+        lines = b''.join(b'noise %d\n' % i for i in range(500))
+        self.stderr = io.BytesIO(b'  Duration: 00:02:00.00, start: 0.0\n' + lines)
+    def wait(self):
+        return self.returncode
+
+
+def test_run_ffmpeg_streams_progress_and_keeps_stderr_tail(monkeypatch):
+    procs = []
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', lambda cmd, **kw: procs.append(ProgressProc(cmd)) or procs[-1])
+    events = []
+    returncode, tail = dlmod._run_ffmpeg(['ffmpeg', '-i', 'in.m3u8', 'out.mp4'], events.append)
+    assert returncode == 0
+    assert procs[0].cmd == ['ffmpeg', '-i', 'in.m3u8', '-progress', 'pipe:1', '-nostats', 'out.mp4']
+    assert [(e.out_time, e.done) for e in events] == [(30.0, False), (60.0, True)]
+    assert events[0].duration == 120.0
+    assert tail.splitlines() == [f'noise {i}' for i in range(500 - dlmod.STDERR_TAIL_LINES, 500)]
+
+
+def test_ffmpeg_transfer_publishes_events_and_duration(monkeypatch):
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', ProgressProc)
+    sink = queue.Queue()
+    progress.install(sink.put)
+    try:
+        returncode, _, duration = dlmod._ffmpeg_transfer(7, ['ffmpeg', '-i', 'in.m3u8', 'out.mp4'])
+    finally:
+        progress.install(None)
+    assert returncode == 0 and duration == 60.0
+    assert [e.num for e in sink.queue] == [7, 7]
+
+
+def test_track_progress_moves_bar_within_episodes(monkeypatch):
+    class Bar:
+        n = 0
+        def __init__(self, *args, **kwargs): pass
+        def update(self, n=1): Bar.n += n
+        def set_postfix_str(self, s): pass
+        def close(self): pass
+    monkeypatch.setattr(dlmod, 'tqdm', Bar)
+    events = queue.Queue()
+    seen = []
+    def results():
+        events.put(Progress(1, 50.0, 100.0, 0, 1.0, False))
+        deadline = time.time() + 5
+        while Bar.n == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        seen.append(Bar.n)
+        yield True
+    assert list(dlmod._track_progress(results(), 2, events)) == [True]
+    assert seen == [0.5]
@@ -0,0 +1,138 @@
+import multiprocessing as mp
+import threading
+
+import pytest
+
+from src import hls, ratelimit
+from src.ratelimit import TokenBucket
+import src.downloader as dlmod
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+    def __call__(self):
+        return self.now
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture(autouse=True)
+def reset_limiter():
+    ratelimit.reset()
+    yield
+    ratelimit.reset()
+
+
+def test_bucket_holds_rate_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(1000, burst=1000, clock=clock, sleep=clock.sleep)
+    bucket.consume(1000)  # burst allowance
+    assert clock.now == 0
+    for _ in range(5):
+        bucket.consume(500)
+    assert clock.now == pytest.approx(2.5)
+
+
+def test_bucket_unlimited_when_rate_zero():
+    clock = FakeClock()
+    bucket = TokenBucket(0, clock=clock, sleep=clock.sleep)
+    assert bucket.consume(10**9) == 0.0
+    assert clock.slept == []
+
+
+def test_set_rate_applies_to_next_consumer():
+    clock = FakeClock()
+    bucket = TokenBucket(1000, burst=1000, clock=clock, sleep=clock.sleep)
+    bucket.consume(1000)
+    bucket.set_rate(4000, burst=4000)
+    assert bucket.consume(2000) == pytest.approx(0.5)
+
+
+def test_bucket_shared_across_threads():
+    clock = FakeClock()
+    lock = threading.Lock()
+    def sleep(seconds):
+        with lock:
+            clock.sleep(seconds)
+    bucket = TokenBucket(1000, burst=1000, clock=clock, sleep=sleep)
+    threads = [threading.Thread(target=lambda: [bucket.consume(100) for _ in range(10)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 4000 bytes at 1000 B/s with a 1000 byte burst: at least 3 seconds overall
+    assert clock.now >= 3.0 - 1e-9
+
+
+def test_bucket_shared_across_processes():
+    ctx = mp.get_context('fork')
+    bucket = TokenBucket(1000, burst=1000, sleep=lambda s: None)
+    proc = ctx.Process(target=bucket.consume, args=(5000,))
+    proc.start()
+    proc.join()
+    # The child's debit is visible to the parent
+    assert bucket._tokens.value < 0
+
+
+def test_configure_updates_shared_bucket():
+    bucket = ratelimit.configure(0)
+    assert bucket.rate == 0 and not ratelimit.throttled()
+    assert ratelimit.configure(800) is bucket
+    assert bucket.rate == 100000 and ratelimit.throttled()
+    ratelimit.set_rate(1600)
+    assert ratelimit.current() is bucket
+    assert bucket.rate == 200000
+
+
+def test_unlimited_session_can_be_capped_later(tmp_path, monkeypatch):
+    ratelimit.configure(0)
+    job = dlmod.EpisodeJob(
+        ('Show', 1, 'http://x/ep-1', str(tmp_path)), 1, 'http://x/ep-1', 'http://x/media.m3u8',
+        str(tmp_path / '1.mp4'), 'ffmpeg', False, 0, {}, None)
+    used = []
+    def fake_native(num, m3u8, outpath, options, engine, audio=None):
+        used.append(ratelimit.current().rate)
+        with open(outpath, 'wb') as f:
+            f.write(b'mp4')
+        return hls.StreamResult(3, 1, 1.0, 'h')
+    monkeypatch.setattr(dlmod, '_download_native', fake_native)
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', lambda *a, **k: pytest.fail('ffmpeg cannot be throttled'))
+    # The cap arrives after the job was resolved unthrottled
+    ratelimit.set_rate(800)
+    assert dlmod.transfer_episode(job)
+    assert used == [100000]
+
+
+def test_fetch_streams_through_limiter():
+    consumed = []
+    class Limiter:
+        def consume(self, n):
+            consumed.append(n)
+    class Resp:
+        def raise_for_status(self): pass
+        def iter_content(self, chunk_size):
+            yield b'a' * 3
+            yield b'b' * 2
+        def close(self): pass
+    class Session:
+        def get(self, url, headers=None, timeout=None, stream=False):
+            assert stream
+            return Resp()
+    assert hls._fetch(Session(), 'http://x/seg.ts', limiter=Limiter()) == b'aaabb'
+    assert consumed == [3, 2]
+
+
+def test_throttle_selects_native_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(dlmod, 'get_manifest_urls', lambda url: {'http://x/media.m3u8'})
+    monkeypatch.setattr(dlmod.requests.Session, 'get', lambda *args, **kwargs: (_ for _ in ()).throw(dlmod.requests.RequestException()))
+    used = []
+    def fake_native(num, m3u8, outpath, options, engine, audio=None):
+        used.append(ratelimit.current().rate)
+        with open(outpath, 'wb') as f:
+            f.write(b'mp4')
+        return hls.StreamResult(3, 1, 1.0, 'h')
+    monkeypatch.setattr(dlmod, '_download_native', fake_native)
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', lambda *a, **k: pytest.fail('ffmpeg cannot be throttled'))
+    assert dlmod.download_episode(('Show', 1, 'http://x/ep-1', str(tmp_path), 8000, 0))
+    assert used == [1000000]
@@ -0,0 +1,152 @@
+import pytest
+import requests
+
+from src import hls, retry
+import src.downloader as dlmod
+from tests.helpers import make_job
+
+class HTTPFailure(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.response = type('Resp', (), {'status_code': status})()
+
+class DummyResp:
+    def __init__(self, url, content=b'', text=''):
+        self.url = url
+        self.content = content
+        self.text = text
+    def raise_for_status(self):
+        pass
+
+class ScriptedSession:
+    """Serves ``pages``; ``failures`` maps a URL to exceptions raised on its first requests."""
+    def __init__(self, pages, failures):
+        self.pages = pages
+        self.failures = failures
+        self.calls = []
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append(url)
+        if self.failures.get(url):
+            raise self.failures[url].pop(0)
+        body = self.pages[url]
+        return DummyResp(url, text=body) if isinstance(body, str) else DummyResp(url, content=body)
+
+MEDIA = '#EXTM3U\n#EXTINF:2,\na.ts\n#EXTINF:2,\nb.ts\n#EXT-X-ENDLIST\n'
+PAGES = {'http://x/i.m3u8': MEDIA, 'http://x/a.ts': b'A', 'http://x/b.ts': b'B'}
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, 'sleep', lambda s: None)
+    monkeypatch.setattr(dlmod.time, 'sleep', lambda s: None)
+
+
+@pytest.mark.parametrize('exc, kind', [
+    (HTTPFailure(503), retry.RETRY),
+    (HTTPFailure(429), retry.RETRY),
+    (HTTPFailure(403), retry.RERESOLVE),
+    (HTTPFailure(404), retry.FATAL),
+    (requests.ReadTimeout(), retry.RETRY),
+    (requests.exceptions.ChunkedEncodingError(), retry.RETRY),
+    (ValueError('bad'), retry.FATAL),
+])
+def test_classify(exc, kind):
+    assert retry.classify(exc) == kind
+
+
+def test_backoff_is_capped_with_full_jitter():
+    policy = retry.RetryPolicy(10, 0.5, 4.0)
+    assert retry.backoff(1, policy, rng=lambda: 1.0) == 0.5
+    assert retry.backoff(3, policy, rng=lambda: 1.0) == 2.0
+    assert retry.backoff(8, policy, rng=lambda: 1.0) == 4.0
+    assert retry.backoff(8, policy, rng=lambda: 0.0) == 0.0
+
+
+def test_call_gives_up_after_attempts():
+    calls = []
+    def flaky():
+        calls.append(1)
+        raise requests.ConnectionError('reset')
+    stats = retry.RetryStats()
+    with pytest.raises(requests.ConnectionError):
+        retry.call(flaky, retry.RetryPolicy(2, 0.1, 1), stats)
+    assert len(calls) == 3
+    assert stats.retries == 2
+
+
+def test_segment_retried_alone(tmp_path):
+    session = ScriptedSession(PAGES, {'http://x/b.ts': [HTTPFailure(502), requests.ReadTimeout()]})
+    result = hls.download_stream('http://x/i.m3u8', str(tmp_path / 'o.ts'), concurrency=1, session=session)
+    assert (tmp_path / 'o.ts').read_bytes() == b'AB'
+    assert result.retries == 2
+    # Only the failing segment was fetched again
+    assert session.calls.count('http://x/a.ts') == 1
+    assert session.calls.count('http://x/b.ts') == 3
+
+
+def test_segment_404_fails_fast(tmp_path):
+    session = ScriptedSession(PAGES, {'http://x/b.ts': [HTTPFailure(404)]})
+    with pytest.raises(HTTPFailure):
+        hls.download_stream('http://x/i.m3u8', str(tmp_path / 'o.ts'), session=session)
+    assert session.calls.count('http://x/b.ts') == 1
+
+
+def test_rejected_token_raises_manifest_expired(tmp_path):
+    session = ScriptedSession(PAGES, {'http://x/a.ts': [HTTPFailure(403)]})
+    with pytest.raises(hls.ManifestExpired):
+        hls.download_stream('http://x/i.m3u8', str(tmp_path / 'o.ts'), session=session)
+
+
+def test_native_expired_tokens_reresolve(tmp_path, monkeypatch):
+    seen = []
+    def native(num, m3u8, outpath, options, engine, audio=None):
+        seen.append(m3u8)
+        if m3u8.endswith('old.m3u8'):
+            raise hls.ManifestExpired('403')
+        with open(outpath, 'wb') as f:
+            f.write(b'mp4')
+        return hls.StreamResult(3, 1, 1.0, 'h')
+    monkeypatch.setattr(dlmod, '_download_native', native)
+    job = make_job(tmp_path, engine='native')
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: job._replace(m3u8='http://cdn/new.m3u8'))
+    assert dlmod.transfer_episode(job)
+    assert seen == ['http://cdn/old.m3u8', 'http://cdn/new.m3u8']
+
+
+def test_ffmpeg_404_is_not_retried(tmp_path, monkeypatch):
+    runs = []
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', lambda cmd, on_progress=None, stall_timeout=None: runs.append(cmd) or (1, 'HTTP error 404 Not Found'))
+    assert dlmod.transfer_episode(make_job(tmp_path)) is False
+    assert len(runs) == 1
+
+
+def test_ffmpeg_403_reresolves_instead_of_retrying(tmp_path, monkeypatch):
+    runs = []
+    def ffmpeg(cmd, on_progress=None, stall_timeout=None):
+        runs.append(cmd[3])
+        if cmd[3].endswith('old.m3u8'):
+            return 1, 'Server returned 403 Forbidden (access denied)'
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'mp4')
+        return 0, ''
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', ffmpeg)
+    job = make_job(tmp_path)
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: job._replace(m3u8='http://cdn/new.m3u8'))
+    assert dlmod.transfer_episode(job)
+    assert runs == ['http://cdn/old.m3u8', 'http://cdn/new.m3u8']
+
+
+def test_ffmpeg_403_reresolves_without_retries(tmp_path, monkeypatch):
+    # run_download, the daemon and run_batch pass retries=0
+    runs = []
+    def ffmpeg(cmd, on_progress=None, stall_timeout=None):
+        runs.append(cmd[3])
+        if cmd[3].endswith('old.m3u8'):
+            return 1, 'Server returned 403 Forbidden (access denied)'
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'mp4')
+        return 0, ''
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', ffmpeg)
+    job = make_job(tmp_path, retries=0)
+    monkeypatch.setattr(dlmod, 'resolve_episode_job', lambda args: job._replace(m3u8='http://cdn/new.m3u8'))
+    assert dlmod.transfer_episode(job)
+    assert runs == ['http://cdn/old.m3u8', 'http://cdn/new.m3u8']
@@ -1,9 +1,10 @@
 import os
 import src.downloader as dlmod
+from src.completion import CompletionIndex
 from src.downloader import run_download
 
 class DummyPool:
-    def __init__(self, workers):
+    def __init__(self, workers, **kwargs):
         self.workers = workers
     def imap_unordered(self, func, args):
         # Call the function for each argument
@@ -14,13 +15,9 @@ class DummyPool:
         return self
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
-
-class DummyTk:
-    def __init__(self):
-        pass
-    def withdraw(self):
+    def close(self):
         pass
-    def destroy(self):
+    def join(self):
         pass
 
 
@@ -34,13 +31,11 @@ def test_run_download_static_url(monkeypatch, tmp_path, capsys):
     monkeypatch.setattr(dlmod, 'download_episode', lambda args: calls.append(args))
     # Use DummyPool instead of real Pool
     monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool)
-    # Stub tkinter.Tk to avoid real GUI
-    monkeypatch.setattr(dlmod.tk, 'Tk', DummyTk)
-    # Stub simpledialog.askstring to return None so that it skips
-    monkeypatch.setattr(dlmod.simpledialog, 'askstring', lambda title, text, initialvalue=None: None)
-    # Stub messagebox calls
-    monkeypatch.setattr(dlmod.messagebox, 'showerror', lambda title, text: calls.append('error:'+text))
-    monkeypatch.setattr(dlmod.messagebox, 'showinfo', lambda title, text: calls.append('info:'+text))
+    # Stub the episode count prompt to return None so that it skips
+    monkeypatch.setattr(dlmod.dialogs, 'ask_total', lambda: None)
+    # Stub dialog calls
+    monkeypatch.setattr(dlmod.dialogs, 'show_error', lambda title, text: calls.append('error:'+text))
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, text: calls.append('info:'+text))
     # Run download on static episode URL
     url = 'http://example.com/show/episode-3'
     run_download(url, 'MyShow', str(tmp_path), False, '', 2)
@@ -50,4 +45,63 @@ def test_run_download_static_url(monkeypatch, tmp_path, capsys):
     drama_dir = os.path.join(str(tmp_path), 'MyShow')
     assert ('MyShow', 3, url, drama_dir) in calls
     # showinfo should have been called
-    assert any(isinstance(call, str) and call.startswith('info:') for call in calls) 
\ No newline at end of file
+    assert any(isinstance(call, str) and call.startswith('info:') for call in calls)
+    # Session metrics are exported next to download.log
+    assert os.path.exists(os.path.join(drama_dir, 'metrics.json'))
+
+def test_run_download_skips_completed_before_network(monkeypatch, tmp_path):
+    calls = []
+    drama_dir = tmp_path / 'MyShow'
+    drama_dir.mkdir()
+    done = drama_dir / 'done.mp4'
+    done.write_bytes(b'data')
+    CompletionIndex(str(drama_dir)).record(1, str(done), 4)
+    monkeypatch.setattr(dlmod, 'find_episode_links', lambda url: [(1, 'http://x/ep-1'), (2, 'http://x/ep-2')])
+    monkeypatch.setattr(dlmod, 'banner', lambda: None)
+    monkeypatch.setattr(dlmod, 'download_episode', lambda args: calls.append(args))
+    monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool)
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, text: None)
+    run_download('http://x/show', 'MyShow', str(tmp_path), True, '', 2)
+    assert calls == [('MyShow', 2, 'http://x/ep-2', str(drama_dir))]
+
+def test_run_download_records_attempts(monkeypatch, tmp_path):
+    drama_dir = tmp_path / 'MyShow'
+    def fake_download(args):
+        if args[1] == 2:
+            dlmod.logging.error('[#2] ffmpeg returned code 1: boom')
+            return False
+        path = drama_dir / f'{args[1]}.mp4'
+        path.write_bytes(b'data')
+        CompletionIndex(str(drama_dir)).record(args[1], str(path), 4)
+        return True
+    monkeypatch.setattr(dlmod, 'find_episode_links', lambda url: [(1, 'http://x/ep-1'), (2, 'http://x/ep-2')])
+    monkeypatch.setattr(dlmod, 'banner', lambda: None)
+    monkeypatch.setattr(dlmod, 'download_episode', fake_download)
+    monkeypatch.setattr(dlmod.mp, 'Pool', DummyPool)
+    monkeypatch.setattr(dlmod.dialogs, 'show_info', lambda title, text: None)
+    db = str(tmp_path / 'jobs.db')
+    run_download('http://x/show', 'MyShow', str(tmp_path), True, '', 2, job_store=db)
+    store = dlmod.jobstore.open_store(db)
+    drama = store.find_drama('http://x/show', str(tmp_path))
+    assert drama['status'] == 'failed'
+    episodes = {e['num']: e for e in store.episodes(drama['id'])}
+    assert (episodes[1]['status'], episodes[1]['bytes']) == ('done', 4)
+    assert episodes[2]['last_error'] == '[#2] ffmpeg returned code 1: boom'
+    # A second run reuses the drama row and skips the finished episode
+    run_download('http://x/show', 'MyShow', str(tmp_path), True, '', 2, job_store=db)
+    assert store.find_drama('http://x/show', str(tmp_path))['id'] == drama['id']
+    assert [a['status'] for a in store.attempts(drama['id'], 1)] == ['done']
+    assert [a['status'] for a in store.attempts(drama['id'], 2)] == ['failed', 'failed']
+
+
+def test_adaptive_episode_workers_start_from_half_the_pool(monkeypatch, tmp_path):
+    class AsyncPool(DummyPool):
+        def apply_async(self, func, args, callback=None, error_callback=None):
+            callback(func(*args))
+    controllers = []
+    real = dlmod.AIMDController
+    monkeypatch.setattr(dlmod, 'AIMDController', lambda **kw: controllers.append(real(**kw)) or controllers[-1])
+    monkeypatch.setattr(dlmod.mp, 'Pool', AsyncPool)
+    pool_args = [('Show', n, f'http://x/ep-{n}', str(tmp_path)) for n in range(1, 4)]
+    dlmod._run_pool(pool_args, 6, None, True, str(tmp_path), download=lambda args: True)
+    assert controllers[0].level == 3 and controllers[0].maximum == 6
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from src import progress, ratelimit
+from src.progress import Progress
+from src.scheduler import Scheduler, Stages
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr('src.scheduler.browser_pool.configure', lambda size=1, max_uses=25: None)
+    monkeypatch.setattr('src.scheduler.browser_pool.shutdown', lambda: None)
+    schedulers = []
+    def make(**kwargs):
+        schedulers.append(Scheduler(**kwargs))
+        return schedulers[-1]
+    yield make
+    for sched in schedulers:
+        sched.close()
+    ratelimit.reset()
+
+
+def consume(gen, into):
+    thread = threading.Thread(target=lambda: into.extend(gen), daemon=True)
+    thread.start()
+    return thread
+
+
+def run_two_series(sched, priorities=(0, 0)):
+    order = []
+    gate = threading.Event()
+    def resolve(item):
+        if item == 'A0':
+            gate.wait(5)
+        order.append(item)
+        return item
+    stages = Stages(resolve, lambda job: True, None)
+    results = []
+    first = consume(sched.imap([f'A{i}' for i in range(4)], stages, 'A', priority=priorities[0]), results)
+    # A0 holds the only resolver while both series queue up
+    while sched._feed.pending('A') != 3:
+        pass
+    second = consume(sched.imap(['B0', 'B1'], stages, 'B', priority=priorities[1]), results)
+    while sched._feed.pending('B') != 2:
+        pass
+    gate.set()
+    first.join(5)
+    second.join(5)
+    assert results == [True] * 6
+    return order
+
+
+def test_round_robin_interleaves_series(budget):
+    order = run_two_series(budget(transfers=1, browsers=1))
+    assert order == ['A0', 'A1', 'B0', 'A2', 'B1', 'A3']
+
+
+def test_priority_serves_higher_first(budget):
+    order = run_two_series(budget(transfers=1, browsers=1, policy='priority'), priorities=(0, 5))
+    assert order == ['A0', 'B0', 'B1', 'A1', 'A2', 'A3']
+
+
+def test_cancel_drops_waiting_items(budget):
+    sched = budget(transfers=1, browsers=1)
+    gate = threading.Event()
+    resolved = []
+    def resolve(item):
+        if item == 0:
+            gate.wait(5)
+        resolved.append(item)
+        return item
+    results = []
+    thread = consume(sched.imap(range(5), Stages(resolve, lambda job: True, None), 'S'), results)
+    while sched._feed.pending('S') != 4:
+        pass
+    sched.cancel('S')
+    gate.set()
+    thread.join(5)
+    assert resolved == [0]
+    assert sorted(results) == [False] * 5
+    assert sched.active == 0
+
+
+def test_progress_is_routed_to_its_series(budget):
+    sched = budget(transfers=2, browsers=1)
+    seen = {'A': [], 'B': []}
+    def transfer(job):
+        progress.emit(Progress(job, 1.0, 10.0, 0, 1.0, False))
+        return True
+    stages = Stages(lambda item: item, transfer, lambda job: job)
+    assert list(sched.imap([1], stages, 'A', on_progress=seen['A'].append)) == [True]
+    assert list(sched.imap([2], stages, 'B', on_progress=seen['B'].append)) == [True]
+    assert [e.num for e in seen['A']] == [1] and [e.num for e in seen['B']] == [2]
+
+
+def test_budget_ignores_live_bandwidth(budget):
+    sched = budget(transfers=3, browsers=1, throttle_kbps=100)
+    assert sched.budget() == (3, 1, 'round_robin')
@@ -1,7 +1,11 @@
-from src.scraper import find_episode_links
 import logging
+
+import pytest
 import requests
 
+from src import scraper
+from src.scraper import find_episode_links
+
 class DummyResp:
     def __init__(self, text):
         self.text = text
@@ -10,7 +14,7 @@ class DummyResp:
 
 def test_find_episode_links_static(monkeypatch):
     html = '<a href="/show/episode-1">1</a><a href="episode_2/">2</a>'
-    monkeypatch.setattr('src.scraper.requests.get', lambda *args, **kwargs: DummyResp(html))
+    monkeypatch.setattr('src.scraper.requests.Session.get', lambda *args, **kwargs: DummyResp(html))
     links = find_episode_links('https://example.com')
     assert links == [
         (1, 'https://example.com/show/episode-1'),
@@ -19,7 +23,7 @@ def test_find_episode_links_static(monkeypatch):
 
 def test_find_episode_links_fallback(monkeypatch):
     # Static parse yields no links
-    monkeypatch.setattr('src.scraper.requests.get', lambda *args, **kwargs: DummyResp(''))
+    monkeypatch.setattr('src.scraper.requests.Session.get', lambda *args, **kwargs: DummyResp(''))
     class DummyDriver:
         def __init__(self):
             self.page_source = '<a href="ep-10/">10</a>'
@@ -35,7 +39,7 @@ def test_find_episode_links_fallback(monkeypatch):
 
 def test_find_episode_links_none(monkeypatch):
     # No links and fallback driver raises
-    monkeypatch.setattr('src.scraper.requests.get', lambda *args, **kwargs: DummyResp(''))
+    monkeypatch.setattr('src.scraper.requests.Session.get', lambda *args, **kwargs: DummyResp(''))
     def bad_driver():
         raise Exception('no driver')
     monkeypatch.setattr('src.scraper.get_driver', bad_driver)
@@ -44,7 +48,7 @@ def test_find_episode_links_none(monkeypatch):
 
 def test_find_episode_links_static_request_exception(monkeypatch, caplog):
     # Static HTTP get fails, triggers warning and Selenium fallback
-    monkeypatch.setattr('src.scraper.requests.get',
+    monkeypatch.setattr('src.scraper.requests.Session.get',
                         lambda *args, **kwargs: (_ for _ in ()).throw(requests.RequestException('fail')),
                         raising=True)
     caplog.set_level(logging.WARNING)
@@ -58,4 +62,21 @@ def test_find_episode_links_static_request_exception(monkeypatch, caplog):
     # warning logged about fetch failure
     assert any('Failed to fetch homepage' in rec.message for rec in caplog.records)
     # fallback found link
-    assert links == [(20, 'https://error.test/series/ep-20')] 
\ No newline at end of file
+    assert links == [(20, 'https://error.test/series/ep-20')]
+
+def test_extract_episode_links_ignores_ep_inside_words():
+    html = ('<div><a href="/deep-5/">x</a><a href="/step2">x</a><a href="/show/ep1080p">x</a>'
+            '<a href="/watch?ep=4">4</a><a href="/EP-3/">3</a><a>no href</a></div>')
+    assert scraper.extract_episode_links(html, 'https://s.test/') == [
+        (4, 'https://s.test/watch?ep=4'),
+        (3, 'https://s.test/EP-3/')
+    ]
+
+def test_register_site_pattern(monkeypatch):
+    monkeypatch.setattr(scraper, 'SITE_PATTERNS', {})
+    scraper.register_site_pattern('www.example.org', r'/capitulo-(\d+)')
+    html = '<a href="/capitulo-7">7</a><a href="/episode-1">1</a>'
+    assert scraper.extract_episode_links(html, 'https://m.example.org/') == [(7, 'https://m.example.org/capitulo-7')]
+    assert scraper.extract_episode_links(html, 'https://other.test/') == [(1, 'https://other.test/episode-1')]
+    with pytest.raises(ValueError):
+        scraper.register_site_pattern('example.org', r'/capitulo-\d+')
@@ -0,0 +1,39 @@
+import threading
+
+from src import transport
+
+
+def test_build_session_configuration():
+    session = transport.build_session(pool_maxsize=5, retries=2)
+    adapter = session.get_adapter('https://cdn.example/seg.ts')
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 2
+    assert 503 in adapter.max_retries.status_forcelist
+    assert session.headers['User-Agent'] == transport.USER_AGENT
+    assert 'gzip' in session.headers['Accept-Encoding']
+
+
+def test_host_limits_mount_blocking_pool():
+    session = transport.build_session(host_limits={'cdn.example': 2})
+    limited = session.get_adapter('https://cdn.example/a.ts')
+    assert limited._pool_maxsize == 2
+    assert limited._pool_block is True
+    assert session.get_adapter('https://other.example/a.ts') is not limited
+
+
+def test_get_session_is_per_thread():
+    main = transport.get_session()
+    assert transport.get_session() is main
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(transport.get_session()))
+    t.start()
+    t.join()
+    assert seen[0] is not main
+
+
+def test_segment_session_has_no_status_retries():
+    # hls retries segments itself so every retry is counted
+    plain = transport.get_session(retries=0)
+    assert plain is not transport.get_session()
+    assert plain is transport.get_session(retries=0)
+    assert plain.get_adapter('https://cdn.example/seg.ts').max_retries.total == 0
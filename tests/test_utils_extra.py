@@ -3,7 +3,7 @@ from colorama import Fore
 
 def test_banner(monkeypatch, capsys):
     # Monkeypatch text2art to return a known banner
-    monkeypatch.setattr('src.utils.text2art', lambda title: 'MOCK_ART')
+    monkeypatch.setattr('art.text2art', lambda title: 'MOCK_ART')
     banner()
     captured = capsys.readouterr()
     # The output should include the mocked art and start with cyan color code
@@ -0,0 +1,88 @@
+import io
+import threading
+import time
+
+import pytest
+
+from src import watchdog
+from src.watchdog import TransferStalled, Watchdog
+import src.downloader as dlmod
+from tests.helpers import make_job
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+
+def test_watchdog_fires_once_after_silence():
+    clock = FakeClock()
+    fired = []
+    dog = Watchdog(10, lambda: fired.append(clock.now), clock=clock)
+    clock.now = 9
+    dog.feed()
+    clock.now = 18
+    assert not dog.check()
+    clock.now = 19
+    assert dog.check() and dog.check()
+    assert fired == [19]
+
+
+def test_watchdog_disabled_without_timeout():
+    clock = FakeClock()
+    dog = Watchdog(0, lambda: pytest.fail('disabled'), clock=clock)
+    clock.now = 10**6
+    with dog:
+        assert not dog.check()
+
+
+class StuckProc:
+    # Reports the same position forever, as ffmpeg does while blocked on a dead socket
+    def __init__(self, cmd, *args, **kwargs):
+        self.pid = 0
+        self.returncode = None
+        self.killed = threading.Event()
+        self.stderr = io.BytesIO(b'')
+        self.stdout = self._lines()
+    def _lines(self):
+        while not self.killed.is_set():
+            yield b'out_time_us=1000000\n'
+            yield b'total_size=512\n'
+            yield b'progress=continue\n'
+            time.sleep(0.01)
+    def wait(self):
+        self.returncode = -9
+        return self.returncode
+
+
+def test_run_ffmpeg_kills_stalled_process(monkeypatch):
+    procs = []
+    monkeypatch.setattr(dlmod.subprocess, 'Popen', lambda cmd, **kw: procs.append(StuckProc(cmd)) or procs[-1])
+    monkeypatch.setattr(watchdog, 'kill_group', lambda proc: proc.killed.set())
+    with pytest.raises(TransferStalled):
+        dlmod._run_ffmpeg(['ffmpeg', '-i', 'in.m3u8', 'out.mp4'], stall_timeout=0.2)
+    assert procs[0].killed.is_set()
+    assert not dlmod.FFMPEG_PROCS
+
+
+def test_stalled_transfer_is_requeued(tmp_path, monkeypatch):
+    def stalled(cmd, on_progress=None, stall_timeout=None):
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'partial')
+        raise TransferStalled('ffmpeg made no progress for 1s')
+    monkeypatch.setattr(dlmod, '_run_ffmpeg', stalled)
+    job = make_job(tmp_path)
+    assert dlmod.transfer_episode(job) == dlmod.Requeue(job.args)
+    assert not list(tmp_path.glob('*.part'))
+
+
+def test_with_requeue_runs_stalled_episodes_last():
+    passes = []
+    def run(args_list):
+        passes.append(list(args_list))
+        for args in args_list:
+            yield dlmod.Requeue(args) if args == 'b' else True
+    assert list(dlmod.with_requeue(run, ['a', 'b', 'c'], rounds=2)) == [True, True, False]
+    assert passes == [['a', 'b', 'c'], ['b'], ['b']]